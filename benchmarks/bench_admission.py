@@ -0,0 +1,88 @@
+"""Surcoût du contrôle d'admission : opérations élémentaires et requêtes avec ou sans limiteur.
+
+Les requêtes visent un endpoint léger (/api/chatbot/intentions) soumis à une règle
+généreuse, qui n'en refuse aucune : seul le coût de la vérification est mesuré. Les
+mesures avec et sans limiteur alternent par blocs pour répartir le bruit de la machine.
+
+    python -m benchmarks.bench_admission [--repetitions 2000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.scenarios import executer_requete, statistiques
+
+ENDPOINT = 'chatbot.get_available_intentions'
+URL = '/api/chatbot/intentions'
+# Règle qui ne refuse jamais : débit et concurrence hors d'atteinte d'un client de test
+REGLE = {ENDPOINT: {'debit': 1e9, 'rafale': 1e9, 'concurrence': 64, 'attente': 1.0, 'file': 64}}
+
+def mesurer_operations(controle, iterations=20000):
+    """Durée moyenne (µs) d'une prise de jeton et d'une prise/libération de place"""
+    debut = time.perf_counter()
+    for numero in range(iterations):
+        controle.consommer(f'bench|{numero % 256}', 1e9, 1e9)
+    jeton = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    for _ in range(iterations):
+        controle.liberer(controle.acquerir(ENDPOINT, 64, 0.0, 1))
+    place = time.perf_counter() - debut
+    return {'iterations': iterations,
+            'jeton_us': round(jeton / iterations * 1e6, 2),
+            'place_us': round(place / iterations * 1e6, 2)}
+
+def mesurer_surcout(application, repetitions=2000, blocs=20):
+    """Statistiques de l'endpoint avec et sans limiteur, et surcoût médian (µs).
+
+    L'application doit avoir été créée avec REGLE dans ADMISSION_REGLES ; ADMISSION_ACTIVE
+    est rétabli à sa valeur d'origine à la fin.
+    """
+    client = application.test_client()
+    active = application.config['ADMISSION_ACTIVE']
+    durees = {True: [], False: []}
+    erreurs = {True: 0, False: 0}
+    totaux = {True: 0.0, False: 0.0}
+    try:
+        for _ in range(20):
+            executer_requete(client, 'GET', URL, None)
+        for bloc in range(blocs * 2):
+            avec = bloc % 2 == 0
+            application.config['ADMISSION_ACTIVE'] = avec
+            debut = time.perf_counter()
+            for _ in range(repetitions // blocs):
+                statut, duree = executer_requete(client, 'GET', URL, None)
+                durees[avec].append(duree)
+                erreurs[avec] += statut >= 400
+            totaux[avec] += time.perf_counter() - debut
+    finally:
+        application.config['ADMISSION_ACTIVE'] = active
+
+    resultats = {
+        'sans_limiteur': statistiques(durees[False], erreurs[False], totaux[False]),
+        'avec_limiteur': statistiques(durees[True], erreurs[True], totaux[True]),
+        'operations': mesurer_operations(application.extensions['controle_admission'])
+    }
+    resultats['surcout_p50_us'] = round(
+        (resultats['avec_limiteur']['p50_ms'] - resultats['sans_limiteur']['p50_ms']) * 1000, 1)
+    return resultats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repetitions', type=int, default=2000)
+    arguments = parser.parse_args()
+
+    from benchmarks.donnees import ouvrir_application
+    from src.services.admission import REGLES_PAR_DEFAUT
+
+    with tempfile.TemporaryDirectory() as dossier:
+        base = os.path.join(dossier, 'admission.db')
+        application = ouvrir_application(base, {
+            'ADMISSION_REGLES': dict(REGLES_PAR_DEFAUT, **REGLE), 'ADMISSION_FICHIER': base + '.admission',
+            'SLOW_QUERY_FICHIER': None})
+        print(json.dumps(mesurer_surcout(application, arguments.repetitions), ensure_ascii=False, indent=2))
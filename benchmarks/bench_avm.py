@@ -0,0 +1,104 @@
+"""Modèle d'estimation (AVM) : durée d'entraînement, de mise à jour incrémentale et débit de prédiction.
+
+Les ventes sont générées directement en colonnes (comme bench_instantane), avec un prix
+au m² qui dépend de la ville, du type et de l'année pour que le modèle ait un signal à
+retrouver. L'erreur médiane est mesurée sur des ventes tenues à l'écart de l'entraînement.
+
+    python -m benchmarks.bench_avm [--ventes 500000] [--lot 10000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.bench_instantane import generer
+from src.services.avm import MoteurAVM
+from src.services.property_snapshot import DATE_ABSENTE, Colonnes, serialiser
+
+TYPES = ['appartement', 'maison', 'studio', 'loft', 'terrain']
+VILLES = [f'Ville {numero}' for numero in range(200)]
+
+class _Application:
+    """Configuration minimale du moteur, sans application Flask ni artefact sur disque"""
+    config = {'AVM_ANNEES': 15, 'AVM_VILLES_MAX': 500, 'AVM_RIDGE': 1.0, 'AVM_DOSSIER': None}
+
+def ventes(lignes, graine=11):
+    """Colonnes de generer() avec des prix expliqués par la ville, le type, l'année et la surface"""
+    tableaux = generer(lignes, graine)
+    aleatoire = np.random.default_rng(graine)
+    effets_villes = aleatoire.normal(0, 0.25, len(VILLES))
+    effets_types = np.array([0.0, 0.1, 0.15, 0.2, -0.8])
+    annees = np.where(tableaux['sale_date'] != DATE_ABSENTE, tableaux['sale_date'] // 365, 45)
+    log_prix_m2 = np.log(3000) + effets_villes[tableaux['city']] + effets_types[tableaux['property_type']] \
+        + 0.03 * (annees - 45) - 0.1 * np.log(tableaux['surface'] / 70) + aleatoire.normal(0, 0.15, lignes)
+    tableaux['price'] = np.where(np.isnan(tableaux['price']), np.nan, tableaux['surface'] * np.exp(log_prix_m2))
+    return tableaux
+
+def _mediane_ms(fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append((time.perf_counter() - debut) * 1000)
+    return round(float(np.median(durees)), 3)
+
+def mesurer(lignes=500_000, lot=10_000, repetitions=5, graine=11):
+    """Entraînement sur 99 % des ventes, ajout incrémental du reste, prédictions unitaires et par lot"""
+    tableaux = ventes(lignes, graine)
+    complet = Colonnes(serialiser(tableaux, VILLES, TYPES, 0))
+    coupure = int(lignes * 0.99)
+    entrainement = Colonnes(serialiser({nom: valeurs[:coupure] for nom, valeurs in tableaux.items()},
+                                       VILLES, TYPES, 0))
+    moteur = MoteurAVM()
+    moteur.app = _Application()
+
+    debut = time.perf_counter()
+    modele = moteur.entrainer(entrainement)
+    resultats = {'ventes': lignes, 'ventes_apprises': modele.base[3], 'variables': len(modele.coefficients),
+                 'entrainement_s': round(time.perf_counter() - debut, 3), 'r2': modele.meta['r2'],
+                 'mdape_entrainement': modele.meta['mdape']}
+
+    debut = time.perf_counter()
+    mis_a_jour = moteur._integrer_ventes(modele, complet)
+    resultats['increment_ms'] = round((time.perf_counter() - debut) * 1000, 2)
+    resultats['ventes_incrementales'] = mis_a_jour.lignes_incrementales
+
+    # Ventes tenues à l'écart : estimées à leur année de vente, comparées au prix réel
+    retenues = moteur._utilisables(complet)
+    retenues[:coupure] = False
+    index = np.flatnonzero(retenues)
+    annees = complet['sale_month'][index] // 12 + 1970
+    erreurs = []
+    for annee in np.unique(annees):
+        selection = index[annees == annee]
+        estimations = mis_a_jour.estimer(
+            complet['surface'][selection], complet['rooms'][selection].astype(np.float64),
+            complet['latitude'][selection], complet['longitude'][selection],
+            [TYPES[code] for code in complet['property_type'][selection]],
+            [VILLES[code] for code in complet['city'][selection]], int(annee))[0]
+        erreurs.append(np.abs(estimations / complet['price'][selection] - 1))
+    resultats['mdape_test'] = round(float(np.median(np.concatenate(erreurs))) * 100, 2)
+
+    aleatoire = np.random.default_rng(graine)
+    surfaces, pieces = aleatoire.uniform(20, 200, lot), aleatoire.integers(-1, 7, lot).astype(np.float64)
+    latitudes, longitudes = aleatoire.normal(45.76, 0.2, lot), aleatoire.normal(4.84, 0.3, lot)
+    types = [TYPES[code] for code in aleatoire.integers(0, len(TYPES), lot)]
+    villes = [VILLES[code] for code in aleatoire.integers(0, len(VILLES), lot)]
+    resultats['prediction_unitaire_us'] = round(1000 * _mediane_ms(lambda: mis_a_jour.estimer(
+        surfaces[:1], pieces[:1], latitudes[:1], longitudes[:1], types[:1], villes[:1]), 200), 1)
+    lot_ms = _mediane_ms(lambda: mis_a_jour.estimer(surfaces, pieces, latitudes, longitudes, types, villes),
+                         repetitions)
+    resultats.update({'lot': lot, 'lot_ms': lot_ms, 'predictions_par_s': int(lot / lot_ms * 1000)})
+    return resultats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ventes', type=int, default=500_000)
+    parser.add_argument('--lot', type=int, default=10_000)
+    arguments = parser.parse_args()
+    print(json.dumps(mesurer(arguments.ventes, arguments.lot), ensure_ascii=False, indent=2))
@@ -0,0 +1,82 @@
+"""Compression des réponses : temps CPU contre octets gagnés, par encodage et niveau.
+
+Les réponses volumineuses de l'API (listes complètes des biens, des leads, rapports avec
+contenu, cartographie) sont lues une fois sans compression, puis compressées avec chaque
+encodage. Le gain est estimé pour une liaison mobile de DEBIT_MOBILE_MBITS : temps de
+transfert économisé moins temps de compression. Le surcoût de bout en bout est mesuré
+en demandant la même réponse avec et sans Accept-Encoding.
+
+    python -m benchmarks.bench_compression --base /tmp/ferme-immo-10k.db [--repetitions 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.compression import Compresseur, brotli
+
+DEBIT_MOBILE_MBITS = 2.0  # 3G ou 4G dégradée, sur le terrain
+CHARGES = {
+    'proprietes': '/api/properties',
+    'leads': '/api/leads',
+    'rapports_contenu': '/api/rapports?include=content',
+    'cartographie': '/api/quartiers/cartographie',
+}
+# (encodage, niveau) comparés ; br seulement si le module brotli est installé
+VARIANTES = [('gzip', 1), ('gzip', 6), ('gzip', 9), ('deflate', 6)] + ([('br', 4), ('br', 9)] if brotli else [])
+
+def _transfert_ms(octets):
+    return octets * 8 / (DEBIT_MOBILE_MBITS * 1e6) * 1000
+
+def _mediane_ms(fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append((time.perf_counter() - debut) * 1000)
+    return statistics.median(durees)
+
+def mesurer(application, repetitions=5):
+    """Par charge : taille brute, puis octets, ratio, CPU, débit et gain mobile de chaque variante"""
+    client = application.test_client()
+    resultats = {'debit_mobile_mbits': DEBIT_MOBILE_MBITS,
+                 'niveau_configure': application.config['COMPRESSION_NIVEAU'], 'charges': {}}
+    for nom, url in CHARGES.items():
+        donnees = client.get(url).get_data()
+        charge = {'octets': len(donnees), 'variantes': {}}
+        for encodage, niveau in VARIANTES:
+            def compresser():
+                compresseur = Compresseur(encodage, niveau, niveau)
+                return compresseur.compresser(donnees) + compresseur.terminer()
+            octets = len(compresser())
+            cpu_ms = _mediane_ms(compresser, repetitions)
+            charge['variantes'][f'{encodage}-{niveau}'] = {
+                'octets': octets,
+                'ratio': round(octets / len(donnees), 4) if donnees else 1.0,
+                'cpu_ms': round(cpu_ms, 3),
+                'mo_par_s': round(len(donnees) / 2 ** 20 / (cpu_ms / 1000), 1) if cpu_ms else None,
+                'gain_mobile_ms': round(_transfert_ms(len(donnees) - octets) - cpu_ms, 1),
+            }
+
+        # De bout en bout : même requête avec et sans compression négociée
+        avec = _mediane_ms(lambda: client.get(url, headers={'Accept-Encoding': 'gzip'}).get_data(), repetitions)
+        sans = _mediane_ms(lambda: client.get(url).get_data(), repetitions)
+        charge['requete_identite_ms'] = round(sans, 3)
+        charge['requete_gzip_ms'] = round(avec, 3)
+        charge['surcout_ms'] = round(avec - sans, 3)
+        resultats['charges'][nom] = charge
+    return resultats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base', required=True, help='Base SQLite peuplée par benchmarks.donnees')
+    parser.add_argument('--repetitions', type=int, default=5)
+    arguments = parser.parse_args()
+
+    from benchmarks.donnees import ouvrir_application
+    application = ouvrir_application(arguments.base, {'ADMISSION_ACTIVE': False})
+    print(json.dumps(mesurer(application, arguments.repetitions), ensure_ascii=False, indent=2))
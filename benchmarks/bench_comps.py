@@ -0,0 +1,74 @@
+"""Recherche de comparables : construction des arbres k-d et latence d'une requête.
+
+Les ventes sont générées directement en colonnes (comme bench_instantane). Une partie
+des requêtes est vérifiée contre une recherche exhaustive.
+
+    python -m benchmarks.bench_comps [--ventes 500000] [--requetes 1000] [--k 10]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.bench_instantane import generer
+from src.services.comps import DIMENSIONS, ECHELLES_PAR_DEFAUT, MoteurComparables
+from src.services.property_snapshot import EPOQUE, Colonnes, serialiser
+
+TYPES = ['appartement', 'maison', 'studio', 'loft', 'terrain']
+
+class _Application:
+    """Configuration minimale du moteur, sans application Flask ni base"""
+    config = {'COMPS_ECHELLES': ECHELLES_PAR_DEFAUT, 'COMPS_TAILLE_FEUILLE': 64, 'COMPS_RECONSTRUCTION': 0.05}
+
+def mesurer(moteur, colonnes, requetes=1000, k=10, verifications=50, graine=7):
+    """Latences (ms) de `requetes` recherches et nombre d'écarts avec la recherche exhaustive"""
+    aleatoire = np.random.default_rng(graine)
+    valeurs, points = moteur._ventes(colonnes)
+    aujourd_hui = date.today().toordinal() - EPOQUE
+    durees, ecarts = [], 0
+    for numero in range(requetes):
+        latitude, longitude = float(aleatoire.normal(45.76, 0.2)), float(aleatoire.normal(4.84, 0.3))
+        surface = float(aleatoire.uniform(20, 200))
+        rooms = int(aleatoire.integers(1, 7)) if numero % 3 else None
+        property_type = TYPES[numero % 2] if numero % 4 else None
+        debut = time.perf_counter()
+        resultat = moteur.chercher(colonnes, latitude, longitude, surface, rooms, property_type, k)
+        durees.append((time.perf_counter() - debut) * 1000)
+
+        if numero < verifications:
+            requete = moteur.caracteristiques(np.array([latitude]), np.array([longitude]), np.array([surface]),
+                                              np.array([-1 if rooms is None else rooms]), np.array([aujourd_hui]))[0]
+            poids = np.ones(len(DIMENSIONS))
+            if rooms is None:
+                poids[DIMENSIONS.index('rooms')] = 0.0
+            selection = valeurs['type'] == property_type if property_type else np.ones(len(points), dtype=bool)
+            distances = ((points[selection] - requete) ** 2 * poids).sum(axis=1)
+            attendus = set(valeurs['id'][selection][np.argsort(distances)[:k]].tolist())
+            ecarts += attendus != {comparable['id'] for comparable in resultat}
+    return {'requetes': requetes, 'k': k,
+            'p50_ms': round(float(np.percentile(durees, 50)), 3),
+            'p95_ms': round(float(np.percentile(durees, 95)), 3),
+            'max_ms': round(max(durees), 3),
+            'verifications': min(verifications, requetes), 'ecarts': int(ecarts)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ventes', type=int, default=500_000)
+    parser.add_argument('--requetes', type=int, default=1000)
+    parser.add_argument('--k', type=int, default=10)
+    arguments = parser.parse_args()
+
+    colonnes = Colonnes(serialiser(generer(arguments.ventes), [f'Ville {numero}' for numero in range(200)], TYPES, 0))
+    moteur = MoteurComparables()
+    moteur.app = _Application()
+    debut = time.perf_counter()
+    moteur.index(colonnes)
+    resultats = {'ventes': arguments.ventes, 'construction_s': round(time.perf_counter() - debut, 2)}
+    resultats.update(mesurer(moteur, colonnes, arguments.requetes, arguments.k))
+    print(json.dumps(resultats, ensure_ascii=False, indent=2))
@@ -0,0 +1,98 @@
+"""Benchmark du démarrage : profil d'import et temps jusqu'à la première requête servie.
+
+Chaque mesure est faite dans un interpréteur neuf (démarrage à froid d'un worker).
+Les variantes comparées :
+- historique : tous les blueprints et création du schéma au démarrage (comportement d'avant create_app)
+- usine : create_app() par défaut, schéma créé au préalable par `flask init-db`
+- reduit : create_app() limité au blueprint chatbot (worker dédié)
+
+    python -m benchmarks.bench_demarrage [--repetitions 7] [--top 15]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code exécuté dans le processus fils ; {config} est remplacé par la configuration de la variante
+SCRIPT_PREMIERE_REQUETE = """
+import time
+debut = time.perf_counter()
+from src.main import create_app
+app = create_app({config})
+reponse = app.test_client().get('/api/chatbot/intentions')
+assert reponse.status_code == 200, reponse.status_code
+print(time.perf_counter() - debut)
+"""
+
+VARIANTES = {
+    'historique': {'CREATE_SCHEMA_ON_STARTUP': True},
+    'usine': {},
+    'reduit': {'ENABLED_BLUEPRINTS': ['chatbot']},
+}
+
+REGEX_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+def environnement_fils(base):
+    environnement = dict(os.environ, FERME_IMMO_DATABASE_URI=f'sqlite:///{base}')
+    environnement.pop('FERME_IMMO_BLUEPRINTS', None)
+    return environnement
+
+def profil_import(base, code='from src.main import create_app; create_app()', top=15):
+    """Modules les plus coûteux à l'import (temps cumulé, en ms) d'après -X importtime"""
+    resultat = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=RACINE,
+                              env=environnement_fils(base), capture_output=True, text=True, check=True)
+    modules = []
+    for ligne in resultat.stderr.splitlines():
+        correspondance = REGEX_IMPORTTIME.match(ligne)
+        if correspondance:
+            propre, cumule, indentation, nom = correspondance.groups()
+            modules.append({'module': nom, 'propre_ms': int(propre) / 1000, 'cumule_ms': int(cumule) / 1000,
+                            'niveau': (len(indentation) - 1) // 2})
+    premier_niveau = [module for module in modules if module['niveau'] == 0]
+    return {
+        'total_ms': round(sum(module['cumule_ms'] for module in premier_niveau), 1),
+        'modules_projet_ms': round(sum(module['propre_ms'] for module in modules if module['module'].startswith('src.')), 1),
+        'plus_couteux': sorted(premier_niveau, key=lambda module: -module['cumule_ms'])[:top],
+        'projet': sorted((module for module in modules if module['module'].startswith('src.')),
+                         key=lambda module: -module['cumule_ms'])[:top]
+    }
+
+def premiere_requete(base, config, repetitions):
+    """Durées (s) de l'import à la première réponse, chacune dans un interpréteur neuf"""
+    durees = []
+    for _ in range(repetitions):
+        resultat = subprocess.run([sys.executable, '-c', SCRIPT_PREMIERE_REQUETE.format(config=repr(config))],
+                                  cwd=RACINE, env=environnement_fils(base), capture_output=True, text=True, check=True)
+        durees.append(float(resultat.stdout.strip().splitlines()[-1]))
+    return durees
+
+def executer(repetitions=7, top=15):
+    with tempfile.TemporaryDirectory() as dossier:
+        base = os.path.join(dossier, 'demarrage.db')
+        # Schéma créé une fois, comme le ferait `flask init-db` avant de lancer les workers
+        subprocess.run([sys.executable, '-c', 'from src.main import create_app, init_schema; init_schema(create_app())'],
+                       cwd=RACINE, env=environnement_fils(base), check=True)
+
+        resultats = {'repetitions': repetitions, 'premiere_requete_ms': {}}
+        for nom, config in VARIANTES.items():
+            durees = premiere_requete(base, config, repetitions)
+            resultats['premiere_requete_ms'][nom] = {
+                'mediane': round(statistics.median(durees) * 1000, 1),
+                'min': round(min(durees) * 1000, 1),
+                'max': round(max(durees) * 1000, 1)
+            }
+        resultats['profil_import'] = profil_import(base, top=top)
+    return resultats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repetitions', type=int, default=7)
+    parser.add_argument('--top', type=int, default=15)
+    arguments = parser.parse_args()
+    print(json.dumps(executer(arguments.repetitions, arguments.top), ensure_ascii=False, indent=2))
@@ -0,0 +1,84 @@
+"""Agrégats sur l'instantané en colonnes des biens : durée des calculs et d'une publication.
+
+Les colonnes sont générées directement (sans base) puis écrites et projetées en mémoire
+comme en production ; chaque agrégat est mesuré sur la médiane de plusieurs exécutions.
+
+    python -m benchmarks.bench_instantane [--lignes 1000000] [--repetitions 7]
+"""
+import argparse
+import json
+import mmap
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from src.services import property_analytics
+from src.services.property_snapshot import COLONNES, DATE_ABSENTE, Colonnes, serialiser
+
+def generer(lignes, graine=42):
+    """Colonnes aléatoires plausibles : 200 villes, 5 types, ventes sur 15 ans autour de Lyon"""
+    aleatoire = np.random.default_rng(graine)
+    surfaces = aleatoire.uniform(15, 250, lignes)
+    dates = aleatoire.integers(16000, 20500, lignes).astype(np.int32)
+    dates[aleatoire.random(lignes) < 0.05] = DATE_ABSENTE
+    return {
+        'id': np.arange(1, lignes + 1, dtype=np.int64),
+        'price': np.where(aleatoire.random(lignes) < 0.03, np.nan, surfaces * aleatoire.uniform(1500, 9000, lignes)),
+        'surface': surfaces,
+        'rooms': aleatoire.integers(1, 8, lignes).astype(np.int16),
+        'sale_date': dates,
+        'latitude': aleatoire.normal(45.76, 0.2, lignes),
+        'longitude': aleatoire.normal(4.84, 0.3, lignes),
+        'city': aleatoire.zipf(1.3, lignes).clip(1, 200).astype(np.int32) - 1,
+        'property_type': aleatoire.integers(0, 5, lignes).astype(np.int32),
+    }
+
+def chronometrer(fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append((time.perf_counter() - debut) * 1000)
+    return round(statistics.median(durees), 2)
+
+def mesurer(colonnes, repetitions=7):
+    """Durées médianes (ms) des agrégats servis par /properties/analytics et /properties/heatmap"""
+    tout = property_analytics.masque(colonnes, historique=True)
+    return {
+        'statistiques_ms': chronometrer(lambda: property_analytics.statistiques(
+            colonnes, property_analytics.masque(colonnes, historique=True)), repetitions),
+        'par_type_ms': chronometrer(lambda: property_analytics.grouper(colonnes, tout, 'property_type'), repetitions),
+        'par_ville_ms': chronometrer(lambda: property_analytics.grouper(colonnes, tout, 'city'), repetitions),
+        'par_mois_ms': chronometrer(lambda: property_analytics.grouper(colonnes, tout, 'month'), repetitions),
+        'ville_filtree_ms': chronometrer(lambda: property_analytics.statistiques(
+            colonnes, property_analytics.masque(colonnes, city='ville 1', historique=True)), repetitions),
+        'carte_chaleur_ms': chronometrer(lambda: property_analytics.carte_chaleur(colonnes, tout, 0.01), repetitions),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lignes', type=int, default=1_000_000)
+    parser.add_argument('--repetitions', type=int, default=7)
+    arguments = parser.parse_args()
+
+    tableaux = generer(arguments.lignes)
+    villes = [f'Ville {numero}' for numero in range(200)]
+    types = ['appartement', 'maison', 'studio', 'loft', 'terrain']
+    with tempfile.TemporaryDirectory() as dossier:
+        fichier = os.path.join(dossier, 'proprietes.col')
+        debut = time.perf_counter()
+        with open(fichier, 'wb') as flux:
+            flux.write(serialiser(tableaux, villes, types, 0))
+        publication = (time.perf_counter() - debut) * 1000
+        with open(fichier, 'rb') as flux:
+            colonnes = Colonnes(mmap.mmap(flux.fileno(), 0, access=mmap.ACCESS_READ))
+        resultats = {'lignes': arguments.lignes, 'taille_mo': round(os.path.getsize(fichier) / 2 ** 20, 1),
+                     'colonnes': len(COLONNES), 'publication_ms': round(publication, 1)}
+        resultats.update(mesurer(colonnes, arguments.repetitions))
+        print(json.dumps(resultats, ensure_ascii=False, indent=2))
@@ -0,0 +1,108 @@
+"""Micro-benchmark de l'analyse d'intention du chatbot.
+
+Compare l'implémentation historique (dictionnaire reconstruit à chaque appel,
+premier mot-clé trouvé) à l'automate d'Aho-Corasick compilé une seule fois.
+
+    python -m benchmarks.bench_intentions [--repetitions 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.routes.chatbot import analyser_intention, classer_intentions
+
+# Messages réels (anonymisés) reçus par le widget du site
+CORPUS_MESSAGES = [
+    "Bonjour",
+    "bonjour je cherche à acheter une maison avec jardin",
+    "Salut, je veux vendre mon appartement T3 aux Minimes",
+    "Quel est le prix moyen au m² à Rangueil ?",
+    "mon budget est de 320 000 euros maximum",
+    "On cherche dans le secteur de Castanet ou Ramonville",
+    "Vous pouvez me joindre au 06 12 34 56 78",
+    "mon email est julie.martin@gmail.com",
+    "Comment évolue le marché immobilier à Toulouse en ce moment ?",
+    "Les prix vont-ils baisser l'année prochaine ?",
+    "Je souhaite prendre rendez-vous pour une estimation",
+    "Est-ce qu'on peut se rencontrer samedi matin ?",
+    "Merci beaucoup, au revoir !",
+    "hello, do you speak english?",
+    "Je voudrais visiter la maison de la rue des Fleurs",
+    "Combien coûte un T2 à Saint-Agne ?",
+    "j'ai un financement accordé par ma banque pour 250k€",
+    "Nous voulons acquérir un terrain constructible",
+    "mettre en vente notre maison familiale à Labège",
+    "Quelle est la tendance sur le quartier Saint-Cyprien ?",
+    "Pouvez-vous m'appeler demain après 18h ?",
+    "bonsoir, je regarde juste",
+    "c'est pour un investissement locatif étudiant",
+    "Je suis primo-accédant, par où commencer ?",
+    "Le délai de vente est de combien en moyenne ?",
+    "hey",
+    "J'aimerais céder mon local commercial",
+    "stop",
+    "Ma maison fait 120m² avec piscine, combien peut-elle valoir ?",
+    "on habite Blagnac mais on veut se rapprocher du centre-ville",
+    "à bientôt",
+    "Bonjour, je veux acheter dans la région de Muret avec un budget de 200 000 €",
+]
+
+INTENTIONS_MOTS_CLES_HISTORIQUE = {
+    'salutation': ['bonjour', 'salut', 'hello', 'bonsoir', 'hey'],
+    'recherche_achat': ['acheter', 'achat', 'acquérir', 'cherche à acheter', 'veux acheter'],
+    'recherche_vente': ['vendre', 'vente', 'céder', 'veux vendre', 'mettre en vente'],
+    'information_budget': ['budget', 'prix', 'coût', 'payer', 'financement', 'euros', '€'],
+    'information_localisation': ['toulouse', 'quartier', 'secteur', 'zone', 'ville', 'région'],
+    'information_contact': ['email', 'téléphone', 'contact', 'joindre', '@', 'appeler'],
+    'question_marche': ['marché', 'tendance', 'évolution', 'prix', 'immobilier'],
+    'demande_rdv': ['rendez-vous', 'rencontrer', 'rdv', 'voir', 'visiter'],
+    'au_revoir': ['au revoir', 'bye', 'à bientôt', 'merci', 'stop']
+}
+
+def analyser_intention_historique(message):
+    """Implémentation d'origine, conservée comme référence"""
+    message = message.lower()
+    intentions_mots_cles = dict(INTENTIONS_MOTS_CLES_HISTORIQUE)
+    for intention, mots_cles in intentions_mots_cles.items():
+        if any(mot in message for mot in mots_cles):
+            return intention
+    return 'autre'
+
+def mesurer(fonction, messages, repetitions):
+    """Débit (messages/s) d'une fonction d'analyse sur le corpus"""
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        for message in messages:
+            fonction(message)
+    duree = time.perf_counter() - debut
+    return round(len(messages) * repetitions / duree)
+
+def executer(repetitions=200):
+    messages = [message.lower() for message in CORPUS_MESSAGES]
+    resultats = {
+        'messages': len(messages),
+        'repetitions': repetitions,
+        'historique_messages_par_s': mesurer(analyser_intention_historique, messages, repetitions),
+        'automate_meilleure_messages_par_s': mesurer(analyser_intention, messages, repetitions),
+        'automate_classement_messages_par_s': mesurer(classer_intentions, messages, repetitions),
+        'desaccords': [
+            {'message': message,
+             'historique': analyser_intention_historique(message),
+             'automate': classer_intentions(message)}
+            for message in messages
+            if analyser_intention_historique(message) != analyser_intention(message)
+        ]
+    }
+    resultats['ratio_debit'] = round(
+        resultats['automate_classement_messages_par_s'] / resultats['historique_messages_par_s'], 2)
+    return resultats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repetitions', type=int, default=200)
+    arguments = parser.parse_args()
+    print(json.dumps(executer(arguments.repetitions), ensure_ascii=False, indent=2))
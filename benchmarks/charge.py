@@ -0,0 +1,97 @@
+"""Générateur de charge concurrente : N clients enchaînent des scénarios tirés au hasard.
+
+Par défaut les clients passent par le client de test Flask, dans le processus. Avec
+une URL de base, ils visent un serveur réel (gunicorn multi-processus par exemple)
+en HTTP.
+"""
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.scenarios import executer_requete, statistiques
+
+class ReponseHttp:
+    """Réponse HTTP minimale, compatible avec celle du client de test"""
+
+    def __init__(self, status_code, donnees):
+        self.status_code = status_code
+        self._donnees = donnees
+
+    def get_data(self):
+        return self._donnees
+
+    def close(self):
+        pass
+
+class ClientHttp:
+    """Client HTTP (bibliothèque standard) exposant la méthode open() du client de test"""
+
+    def __init__(self, url_base, delai=30):
+        self.url_base = url_base.rstrip('/')
+        self.delai = delai
+
+    def open(self, url, method='GET', json=None):
+        corps = None
+        entetes = {}
+        if json is not None:
+            corps = _json_dumps(json).encode('utf-8')
+            entetes['Content-Type'] = 'application/json'
+        requete = urllib.request.Request(self.url_base + url, data=corps, headers=entetes, method=method)
+        try:
+            with urllib.request.urlopen(requete, timeout=self.delai) as reponse:
+                return ReponseHttp(reponse.status, reponse.read())
+        except urllib.error.HTTPError as erreur:
+            return ReponseHttp(erreur.code, erreur.read())
+
+def _json_dumps(valeur):
+    return json.dumps(valeur, ensure_ascii=False)
+
+def executer_charge(fabrique_client, scenarios, clients=8, duree=10.0, graine=42):
+    """Lancer `clients` threads pendant `duree` secondes ; statistiques globales et par scénario"""
+    mesures = {nom: [] for nom, _, _ in scenarios}
+    erreurs = {nom: 0 for nom, _, _ in scenarios}
+    verrou = threading.Lock()
+    depart = threading.Barrier(clients + 1)
+    fin = [0.0]
+
+    def travailleur(index):
+        rng = random.Random(f'{graine}-charge-{index}')
+        client = fabrique_client()
+        locales = {nom: [] for nom, _, _ in scenarios}
+        locales_erreurs = {nom: 0 for nom, _, _ in scenarios}
+        depart.wait()
+        while time.perf_counter() < fin[0]:
+            nom, methode, requete = rng.choice(scenarios)
+            try:
+                statut, duree_requete = executer_requete(client, methode, *requete(rng))
+            except Exception:
+                locales_erreurs[nom] += 1
+                continue
+            locales[nom].append(duree_requete)
+            if statut >= 400:
+                locales_erreurs[nom] += 1
+        with verrou:
+            for nom in mesures:
+                mesures[nom].extend(locales[nom])
+                erreurs[nom] += locales_erreurs[nom]
+
+    threads = [threading.Thread(target=travailleur, args=(index,), daemon=True) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    fin[0] = time.perf_counter() + duree
+    debut = time.perf_counter()
+    depart.wait()
+    for thread in threads:
+        thread.join()
+    ecoule = time.perf_counter() - debut
+
+    toutes = [valeur for valeurs in mesures.values() for valeur in valeurs]
+    return {
+        'clients': clients,
+        'duree_s': round(ecoule, 2),
+        'global': statistiques(toutes, sum(erreurs.values()), ecoule),
+        'scenarios': {nom: statistiques(mesures[nom], erreurs[nom], ecoule) for nom in mesures if mesures[nom]}
+    }
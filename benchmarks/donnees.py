@@ -0,0 +1,323 @@
+"""Générateur de données synthétiques reproductibles (agglomération toulousaine).
+
+Les volumes sont dérivés du nombre de biens de l'échelle choisie : un lead pour
+10 biens, un rapport pour 100 biens et une transcription de chatbot pour 10 biens.
+Les quartiers sont une liste fixe (les quartiers de Toulouse et les communes de
+l'agglomération). Avec la même graine, deux exécutions produisent les mêmes données.
+
+    python -m benchmarks.donnees --echelle 100k --base /tmp/bench-100k.db [--graine 42]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ECHELLES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Commune, code postal, latitude, longitude, prix moyen au m² (ordre de grandeur 2024), poids dans les ventes
+COMMUNES = [
+    ('Toulouse', '31000', 43.6045, 1.4440, 3700, 45),
+    ('Blagnac', '31700', 43.6370, 1.3900, 3500, 5),
+    ('Colomiers', '31770', 43.6110, 1.3350, 2900, 5),
+    ('Tournefeuille', '31170', 43.5850, 1.3450, 3400, 5),
+    ('Muret', '31600', 43.4610, 1.3270, 2400, 4),
+    ('Balma', '31130', 43.6110, 1.4990, 3800, 3),
+    ("L'Union", '31240', 43.6580, 1.4840, 3200, 3),
+    ('Ramonville-Saint-Agne', '31520', 43.5460, 1.4780, 3300, 3),
+    ('Castanet-Tolosan', '31320', 43.5160, 1.4980, 3300, 3),
+    ('Labège', '31670', 43.5300, 1.5330, 3400, 2),
+    ('Saint-Orens-de-Gameville', '31650', 43.5540, 1.5340, 3600, 3),
+    ('Portet-sur-Garonne', '31120', 43.5230, 1.4060, 2800, 2),
+    ('Cugnaux', '31270', 43.5370, 1.3440, 2900, 3),
+    ('Plaisance-du-Touch', '31830', 43.5650, 1.2970, 2900, 2),
+    ('Launaguet', '31140', 43.6720, 1.4570, 2900, 2),
+    ('Aucamville', '31140', 43.6700, 1.4300, 2900, 2),
+    ('Escalquens', '31750', 43.5190, 1.5590, 3100, 1),
+    ('Auzeville-Tolosane', '31320', 43.5290, 1.4860, 3400, 1),
+    ('Fonsorbes', '31470', 43.5360, 1.2310, 2500, 2),
+    ('Villeneuve-Tolosane', '31270', 43.5240, 1.3500, 2700, 2),
+]
+
+# Quartiers de Toulouse : nom, code postal, latitude, longitude, coefficient de prix
+QUARTIERS_TOULOUSE = [
+    ('Capitole', '31000', 43.6045, 1.4440, 1.35),
+    ('Carmes', '31000', 43.5970, 1.4450, 1.40),
+    ('Saint-Cyprien', '31300', 43.5980, 1.4300, 1.15),
+    ('Minimes', '31200', 43.6200, 1.4350, 0.95),
+    ('Rangueil', '31400', 43.5700, 1.4600, 0.95),
+    ('Saint-Agne', '31400', 43.5800, 1.4500, 1.05),
+    ('Côte Pavée', '31500', 43.5990, 1.4720, 1.20),
+    ('Compans-Caffarelli', '31000', 43.6100, 1.4330, 1.15),
+    ('Purpan', '31300', 43.6080, 1.3980, 0.90),
+    ('Lardenne', '31300', 43.5950, 1.3850, 1.00),
+    ('Borderouge', '31200', 43.6420, 1.4500, 0.90),
+    ('Croix-Daurade', '31200', 43.6360, 1.4680, 0.92),
+    ('Jolimont', '31500', 43.6150, 1.4650, 0.98),
+    ('Bonnefoy', '31500', 43.6150, 1.4590, 0.95),
+    ('Empalot', '31400', 43.5800, 1.4400, 0.75),
+    ('Mirail', '31100', 43.5750, 1.4000, 0.65),
+    ('Saint-Michel', '31400', 43.5870, 1.4460, 1.10),
+    ('Busca', '31400', 43.5930, 1.4600, 1.30),
+    ('Montaudran', '31400', 43.5690, 1.4860, 0.95),
+    ('Pouvourville', '31400', 43.5520, 1.4630, 1.00),
+]
+
+# Type de bien : surface médiane (m²), dispersion log-normale, poids dans les ventes
+TYPES_BIENS = [
+    ('appartement', 58, 0.40, 55),
+    ('maison', 115, 0.35, 35),
+    ('terrain', 600, 0.60, 5),
+    ('local_commercial', 90, 0.55, 5),
+]
+
+VOIES = ['rue', 'avenue', 'allée', 'chemin', 'impasse', 'boulevard', 'place']
+NOMS_VOIES = ['des Fleurs', 'de la République', 'Jean Jaurès', 'du Midi', 'des Pyrénées', 'de la Garonne',
+              'Saint-Exupéry', 'des Violettes', 'du Canal', 'Pierre-Paul Riquet', 'de Lattre de Tassigny',
+              'des Lilas', 'du Stade', 'de l\'Église', 'Clément Ader', 'des Tilleuls', 'du Lauragais', 'Victor Hugo']
+PRENOMS = ['Julie', 'Thomas', 'Camille', 'Nicolas', 'Léa', 'Maxime', 'Sarah', 'Antoine', 'Manon', 'Hugo',
+           'Chloé', 'Lucas', 'Emma', 'Julien', 'Inès', 'Paul', 'Laura', 'Mathieu', 'Sophie', 'Pierre']
+NOMS = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+        'Garcia', 'Fabre', 'Roux', 'Fournier', 'Girard', 'Bonnet', 'Dupont', 'Lambert', 'Fontaine', 'Rousseau']
+STATUTS_LEADS = [('new', 40), ('contacted', 25), ('qualified', 20), ('converted', 5), ('lost', 10)]
+SOURCES_LEADS = [('site_web', 35), ('chatbot', 20), ('reseaux_sociaux', 15), ('recommandation', 10),
+                 ('salon', 5), ('boitage', 15)]
+TYPES_RAPPORTS = ['analyse_marche', 'prediction_quartier', 'profil_acquereurs']
+
+# Tours de conversation typiques du widget, combinés pour produire les transcriptions
+MESSAGES_CHATBOT = [
+    'Bonjour', 'bonsoir', 'je cherche à acheter une maison avec jardin', 'je veux vendre mon appartement',
+    'mettre en vente notre maison familiale', 'mon budget est de {budget} euros', 'je cherche à {commune}',
+    'dans le quartier {quartier} à toulouse', 'mon email est {email}', 'vous pouvez me joindre au {telephone}',
+    'comment évolue le marché immobilier ?', 'je voudrais un rendez-vous pour une estimation', 'merci, au revoir',
+    'les prix vont-ils baisser ?', 'combien coûte un T2 ?', 'hello',
+]
+
+def choix_pondere(rng, elements):
+    """Choisir un élément d'une liste de tuples dont le dernier champ est le poids"""
+    return rng.choices(elements, weights=[element[-1] for element in elements])[0]
+
+def echelle_vers_nombre(echelle):
+    """Nombre de biens d'une échelle nommée (10k, 100k, 1m) ou d'un entier"""
+    return ECHELLES[echelle.lower()] if echelle.lower() in ECHELLES else int(echelle)
+
+def _email(rng, prenom, nom):
+    return f"{prenom.lower()}.{nom.lower()}{rng.randint(1, 999)}@example.com".replace('é', 'e').replace('è', 'e').replace('ï', 'i')
+
+def _telephone(rng):
+    return f"0{rng.choice('67')}{rng.randint(0, 99999999):08d}"
+
+def generer_quartiers(rng):
+    """Quartiers de Toulouse puis communes de l'agglomération, avec leurs indicateurs"""
+    quartiers = []
+    prix_toulouse = COMMUNES[0][4]
+    elements = [(nom, 'Toulouse', code, lat, lon, prix_toulouse * coef) for nom, code, lat, lon, coef in QUARTIERS_TOULOUSE]
+    elements += [(ville, ville, code, lat, lon, prix) for ville, code, lat, lon, prix, _ in COMMUNES[1:]]
+    for nom, ville, code, lat, lon, prix_m2 in elements:
+        quartiers.append({
+            'name': nom,
+            'city': ville,
+            'postal_code': code,
+            'latitude': round(lat, 5),
+            'longitude': round(lon, 5),
+            'rotation_rate_score': round(rng.uniform(20, 95), 1),
+            'potential_score': round(rng.uniform(30, 98), 1),
+            'demand_indicator': round(rng.uniform(0.3, 1.0), 2),
+            'average_age': round(rng.uniform(29, 52), 1),
+            'average_income': round(rng.uniform(22000, 58000), -2),
+            'population': rng.randint(4000, 30000),
+            'average_price_m2': round(prix_m2 * rng.uniform(0.95, 1.05)),
+            'average_sale_time': rng.randint(35, 120),
+            'created_at': datetime(2024, 1, 1),
+            'updated_at': datetime(2024, 1, 1)
+        })
+    return quartiers
+
+def generer_proprietes(rng, nombre, reference=date(2025, 1, 1)):
+    """Biens vendus sur les cinq dernières années, prix cohérents avec la commune et le type"""
+    for _ in range(nombre):
+        ville, code, lat, lon, prix_m2, _ = choix_pondere(rng, COMMUNES)
+        if ville == 'Toulouse':
+            _, code, lat, lon, coefficient = rng.choice(QUARTIERS_TOULOUSE)
+            prix_m2 *= coefficient
+        type_bien, mediane, dispersion, _ = choix_pondere(rng, TYPES_BIENS)
+        surface = round(mediane * math.exp(rng.gauss(0, dispersion)), 1)
+        prix_unitaire = prix_m2 * (0.08 if type_bien == 'terrain' else 1.0)
+        vente = reference - timedelta(days=rng.randint(0, 5 * 365))
+        # Tendance : environ +3 % par an jusqu'à la date de référence
+        tendance = 1.03 ** (-(reference - vente).days / 365)
+        yield {
+            'address': f"{rng.randint(1, 180)} {rng.choice(VOIES)} {rng.choice(NOMS_VOIES)}",
+            'city': ville,
+            'postal_code': code,
+            'property_type': type_bien,
+            'surface': surface,
+            'rooms': None if type_bien == 'terrain' else max(1, round(surface / rng.uniform(20, 28))),
+            'price': round(surface * prix_unitaire * tendance * rng.uniform(0.85, 1.15), -2),
+            'sale_date': vente,
+            'latitude': round(lat + rng.gauss(0, 0.008), 6),
+            'longitude': round(lon + rng.gauss(0, 0.008), 6),
+            'created_at': datetime.combine(vente, datetime.min.time()),
+            'updated_at': datetime.combine(vente, datetime.min.time())
+        }
+
+def generer_leads(rng, nombre, reference=datetime(2025, 1, 1)):
+    """Prospects acheteurs et vendeurs, budgets alignés sur les prix de leur commune"""
+    from src.models.lead import Lead
+    from src.routes.lead import calculate_lead_score
+
+    for _ in range(nombre):
+        prenom, nom = rng.choice(PRENOMS), rng.choice(NOMS)
+        ville, _, _, _, prix_m2, _ = choix_pondere(rng, COMMUNES)
+        budget = round(prix_m2 * rng.uniform(40, 140), -3)
+        cree = reference - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+        statut = choix_pondere(rng, STATUTS_LEADS)[0]
+        lead = {
+            'first_name': prenom,
+            'last_name': nom,
+            'email': _email(rng, prenom, nom),
+            'phone': _telephone(rng) if rng.random() < 0.7 else None,
+            'lead_type': 'buyer' if rng.random() < 0.6 else 'seller',
+            'budget_min': budget * 0.8 if rng.random() < 0.8 else None,
+            'budget_max': budget * 1.2 if rng.random() < 0.8 else None,
+            'property_type_interest': choix_pondere(rng, TYPES_BIENS)[0],
+            'location_interest': ville,
+            'score': None,
+            'status': statut,
+            'source': choix_pondere(rng, SOURCES_LEADS)[0],
+            'notes': None,
+            'created_at': cree,
+            'updated_at': cree,
+            'last_contact_date': cree + timedelta(days=rng.randint(1, 30)) if statut != 'new' else None
+        }
+        # Score de l'application (0 à 10), avec l'aléa du générateur pour rester reproductible
+        lead['score'] = calculate_lead_score(Lead(**lead), rng)
+        yield lead
+
+def generer_rapports(rng, nombre, user_id=1, reference=datetime(2025, 1, 1)):
+    """Rapports terminés, contenu JSON compressé comme en production"""
+    from src.models.report import compresser_contenu
+
+    for _ in range(nombre):
+        ville = choix_pondere(rng, COMMUNES)[0]
+        report_type = rng.choice(TYPES_RAPPORTS)
+        contenu = json.dumps({
+            'localisation': ville,
+            'date_generation': (reference - timedelta(days=rng.randint(0, 365))).isoformat(),
+            'statistiques_marche': {
+                'nombre_ventes': rng.randint(10, 4000),
+                'prix_moyen': round(rng.uniform(150000, 550000), 2),
+                'prix_moyen_m2': round(rng.uniform(2300, 5200), 2)
+            },
+            'tendances': [{'mois': mois, 'evolution_prix': round(rng.uniform(-2, 4), 2)} for mois in range(1, 13)],
+            'recommandations': [rng.choice(NOMS_VOIES) for _ in range(5)]
+        }, ensure_ascii=False)
+        compresse, taille = compresser_contenu(contenu)
+        cree = reference - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+        yield {
+            'title': f'Rapport {report_type} - {ville}',
+            'report_type': report_type,
+            'location': ville,
+            'content_compressed': compresse,
+            'content_size': taille,
+            'status': 'completed',
+            'user_id': user_id,
+            'created_at': cree,
+            'updated_at': cree
+        }
+
+def generer_transcriptions(rng, nombre):
+    """Conversations archivées au format attendu par chatbot-analyse (une par ligne JSONL)"""
+    for index in range(nombre):
+        prenom, nom = rng.choice(PRENOMS), rng.choice(NOMS)
+        valeurs = {
+            'budget': f"{rng.randint(150, 600)} 000",
+            'commune': choix_pondere(rng, COMMUNES)[0].lower(),
+            'quartier': rng.choice(QUARTIERS_TOULOUSE)[0].lower(),
+            'email': _email(rng, prenom, nom),
+            'telephone': _telephone(rng)
+        }
+        messages = [rng.choice(MESSAGES_CHATBOT).format(**valeurs) for _ in range(rng.randint(2, 8))]
+        yield {'session_id': f'bench-{index:08d}', 'source': 'transcription', 'messages': messages}
+
+def _inserer(modele, lignes, taille_lot=20000):
+    from sqlalchemy import insert
+    from src.models.user import db
+
+    lot = []
+    total = 0
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) >= taille_lot:
+            db.session.execute(insert(modele), lot)
+            total += len(lot)
+            lot = []
+    if lot:
+        db.session.execute(insert(modele), lot)
+        total += len(lot)
+    db.session.commit()
+    return total
+
+def peupler(app, echelle='10k', graine=42, fichier_transcriptions=None):
+    """Remplir la base de l'application (supposée vide) ; renvoie les volumes insérés"""
+    from src.models.user import User, db
+    from src.models.property import Property
+    from src.models.lead import Lead
+    from src.models.neighborhood import Neighborhood
+    from src.models.report import Report
+    from src.services.data_version import incrementer_version
+
+    nombre = echelle_vers_nombre(echelle)
+    # Un générateur par table : ajouter une colonne à l'une ne change pas les autres
+    debut = time.perf_counter()
+    with app.app_context():
+        db.session.add(User(id=1, username='benchmark', email='benchmark@example.com'))
+        db.session.commit()
+        volumes = {
+            'quartiers': _inserer(Neighborhood, generer_quartiers(random.Random(f'{graine}-quartiers'))),
+            'proprietes': _inserer(Property, generer_proprietes(random.Random(f'{graine}-proprietes'), nombre)),
+            'leads': _inserer(Lead, generer_leads(random.Random(f'{graine}-leads'), nombre // 10)),
+            'rapports': _inserer(Report, generer_rapports(random.Random(f'{graine}-rapports'), max(1, nombre // 100)))
+        }
+        incrementer_version(Property.__tablename__, Lead.__tablename__, Neighborhood.__tablename__, Report.__tablename__)
+
+    if fichier_transcriptions:
+        with open(fichier_transcriptions, 'w', encoding='utf-8') as fichier:
+            for transcription in generer_transcriptions(random.Random(f'{graine}-transcriptions'), nombre // 10):
+                fichier.write(json.dumps(transcription, ensure_ascii=False) + '\n')
+        volumes['transcriptions'] = nombre // 10
+
+    volumes['duree_s'] = round(time.perf_counter() - debut, 2)
+    return volumes
+
+def ouvrir_application(base, config=None):
+    """Application sur une base SQLite dédiée, schéma créé si nécessaire"""
+    from src.main import create_app, init_schema
+
+    # Contrôle d'admission local au processus : pas de partage d'état avec un serveur lancé à côté
+    app = create_app(dict({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(base)}',
+                           'ADMISSION_FICHIER': None}, **(config or {})))
+    init_schema(app)
+    return app
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--echelle', default='10k', help='10k, 100k, 1m ou un nombre de biens')
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--base', required=True, help='Fichier SQLite à créer')
+    parser.add_argument('--transcriptions', help='Fichier JSONL de transcriptions à produire')
+    parser.add_argument('--volumes', help='Fichier JSON où écrire les volumes insérés')
+    arguments = parser.parse_args()
+    if os.path.exists(arguments.base):
+        parser.error(f'{arguments.base} existe déjà')
+    application = ouvrir_application(arguments.base)
+    volumes = peupler(application, arguments.echelle, arguments.graine, arguments.transcriptions)
+    print(json.dumps(volumes, indent=2))
+    if arguments.volumes:
+        with open(arguments.volumes, 'w', encoding='utf-8') as fichier:
+            json.dump(volumes, fichier)
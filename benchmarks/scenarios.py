@@ -0,0 +1,112 @@
+"""Scénarios de benchmark : une requête représentative par endpoint de chaque blueprint.
+
+Chaque scénario est un tuple (nom, méthode, fonction rng -> (url, corps JSON)).
+Les paramètres (villes, identifiants, messages) sont tirés d'un générateur seedé
+pour que deux exécutions envoient exactement les mêmes requêtes.
+"""
+import time
+from urllib.parse import quote
+
+from benchmarks.donnees import COMMUNES, MESSAGES_CHATBOT, QUARTIERS_TOULOUSE, echelle_vers_nombre
+
+def _ville(rng):
+    return rng.choice(COMMUNES)[0]
+
+def _ville_url(rng):
+    return quote(_ville(rng))
+
+def _estimation(rng):
+    ville, _, latitude, longitude, _, _ = rng.choice(COMMUNES)
+    return (f'/api/properties/estimate?city={quote(ville)}&lat={latitude + rng.uniform(-0.01, 0.01):.5f}'
+            f'&lon={longitude + rng.uniform(-0.01, 0.01):.5f}&surface={rng.randint(20, 200)}'
+            f'&rooms={rng.randint(1, 6)}&property_type=appartement', None)
+
+def construire_scenarios(echelle):
+    """Scénarios adaptés aux volumes d'une échelle (bornes des identifiants tirés)"""
+    nombre = echelle_vers_nombre(echelle)
+    nb_leads = max(1, nombre // 10)
+    nb_rapports = max(1, nombre // 100)
+    nb_quartiers = len(QUARTIERS_TOULOUSE) + len(COMMUNES) - 1
+
+    return [
+        # Biens
+        ('proprietes_filtrees', 'GET', lambda rng: (
+            f'/api/properties?city={_ville_url(rng)}&property_type=maison&min_price=400000', None)),
+        ('propriete_detail', 'GET', lambda rng: (f'/api/properties/{rng.randint(1, nombre)}', None)),
+        ('proprietes_stats', 'GET', lambda rng: (f'/api/properties/stats?city={_ville_url(rng)}', None)),
+        ('estimation_bien', 'GET', lambda rng: _estimation(rng)),
+        # Leads
+        ('leads_filtres', 'GET', lambda rng: ('/api/leads?status=qualified&min_score=90', None)),
+        ('lead_detail', 'GET', lambda rng: (f'/api/leads/{rng.randint(1, nb_leads)}', None)),
+        ('leads_stats', 'GET', lambda rng: ('/api/leads/stats', None)),
+        # Quartiers
+        ('quartiers_liste', 'GET', lambda rng: ('/api/quartiers?ville=Toulouse', None)),
+        ('quartiers_cartographie', 'GET', lambda rng: ('/api/quartiers/cartographie', None)),
+        ('quartier_analyse', 'POST', lambda rng: (
+            '/api/quartiers/analyse-predictive', {'quartier_id': rng.randint(1, nb_quartiers)})),
+        # Rapports
+        ('rapports_liste', 'GET', lambda rng: ('/api/rapports?limit=50', None)),
+        ('rapport_detail', 'GET', lambda rng: (f'/api/rapports/{rng.randint(1, nb_rapports)}', None)),
+        ('rapport_marche', 'POST', lambda rng: ('/api/rapports/generer-marche', {'location': _ville(rng)})),
+        ('assistant_redaction', 'POST', lambda rng: ('/api/rapports/assistant-redaction', {
+            'type': 'post_linkedin', 'sujet': 'Maison avec jardin', 'quartier': _ville(rng),
+            'mots_cles': ['maison', 'jardin']})),
+        # Chatbot
+        ('chatbot_conversation', 'POST', lambda rng: ('/api/chatbot/conversation', {
+            'message': rng.choice(MESSAGES_CHATBOT).format(
+                budget='300 000', commune='balma', quartier='minimes',
+                email='bench@example.com', telephone='0612345678'),
+            'session_id': f'bench-{rng.randint(1, 500)}'})),
+        ('chatbot_intentions', 'GET', lambda rng: ('/api/chatbot/intentions', None)),
+        ('chatbot_conversations', 'GET', lambda rng: ('/api/chatbot/conversations?per_page=50', None)),
+        # Utilisateurs
+        ('utilisateurs', 'GET', lambda rng: ('/api/users', None)),
+    ]
+
+def executer_requete(client, methode, url, corps):
+    """Exécuter une requête via le client de test ; renvoie (statut, durée en secondes)"""
+    debut = time.perf_counter()
+    reponse = client.open(url, method=methode, json=corps)
+    reponse.get_data()  # les réponses en streaming sont consommées entièrement
+    duree = time.perf_counter() - debut
+    reponse.close()
+    return reponse.status_code, duree
+
+def percentile(valeurs_triees, rang):
+    """Percentile par interpolation linéaire sur une liste triée"""
+    if not valeurs_triees:
+        return None
+    position = (len(valeurs_triees) - 1) * rang / 100
+    bas = int(position)
+    haut = min(bas + 1, len(valeurs_triees) - 1)
+    return valeurs_triees[bas] + (valeurs_triees[haut] - valeurs_triees[bas]) * (position - bas)
+
+def statistiques(durees, erreurs, duree_totale):
+    """Percentiles de latence (ms) et débit (requêtes/s) d'une série de mesures"""
+    durees = sorted(durees)
+    return {
+        'requetes': len(durees),
+        'erreurs': erreurs,
+        'p50_ms': round(percentile(durees, 50) * 1000, 3) if durees else None,
+        'p95_ms': round(percentile(durees, 95) * 1000, 3) if durees else None,
+        'p99_ms': round(percentile(durees, 99) * 1000, 3) if durees else None,
+        'max_ms': round(durees[-1] * 1000, 3) if durees else None,
+        'moyenne_ms': round(sum(durees) / len(durees) * 1000, 3) if durees else None,
+        'debit_rps': round(len(durees) / duree_totale, 2) if duree_totale else None
+    }
+
+def executer_scenario(client, scenario, rng, repetitions=50, echauffement=3):
+    """Mesurer un scénario en séquence (une requête à la fois)"""
+    _, methode, requete = scenario
+    for _ in range(echauffement):
+        executer_requete(client, methode, *requete(rng))
+
+    durees = []
+    erreurs = 0
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        statut, duree = executer_requete(client, methode, *requete(rng))
+        durees.append(duree)
+        if statut >= 400:
+            erreurs += 1
+    return statistiques(durees, erreurs, time.perf_counter() - debut)
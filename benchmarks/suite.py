@@ -0,0 +1,258 @@
+"""Suite de benchmarks reproductible de l'API.
+
+Crée (ou réutilise) une base synthétique seedée, mesure chaque scénario en séquence,
+puis sous charge concurrente, puis le surcoût du contrôle d'admission, le modèle
+d'estimation (entraînement, débit de prédiction) et la compression des réponses
+(CPU contre octets), et écrit les résultats en JSON. Les scénarios sont mesurés limiteur désactivé : un client unique
+dépasserait les débits autorisés. Avec --reference, les
+résultats sont comparés à une exécution précédente selon les seuils de
+benchmarks/seuils.json. Le code de sortie vaut 1 en cas de régression.
+
+    python -m benchmarks.suite --echelle 10k --sortie resultats-10k.json [--reference precedent.json]
+    python -m benchmarks.suite --url http://127.0.0.1:8000 --echelle 100k --charge-seulement
+"""
+import argparse
+import atexit
+import glob
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_admission import REGLE as REGLE_ADMISSION, mesurer_surcout
+from benchmarks.bench_avm import mesurer as mesurer_avm
+from benchmarks.bench_compression import mesurer as mesurer_compression
+from benchmarks.charge import ClientHttp, executer_charge
+from benchmarks.donnees import ouvrir_application
+from benchmarks.scenarios import construire_scenarios, executer_scenario
+from src.services.admission import REGLES_PAR_DEFAUT
+
+FICHIER_SEUILS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seuils.json')
+
+def empreinte_schema():
+    """Empreinte des modèles et du générateur : une base générée avec un autre schéma ou
+    d'autres distributions n'est pas réutilisée"""
+    racine = os.path.dirname(os.path.dirname(FICHIER_SEUILS))
+    dossier_modeles = os.path.join(racine, 'src', 'models')
+    fichiers = [os.path.join(dossier_modeles, nom) for nom in sorted(os.listdir(dossier_modeles)) if nom.endswith('.py')]
+    fichiers.append(os.path.join(racine, 'benchmarks', 'donnees.py'))
+    empreinte = hashlib.sha1()
+    for chemin in fichiers:
+        with open(chemin, 'rb') as fichier:
+            empreinte.update(os.path.basename(chemin).encode('utf-8') + fichier.read())
+    return empreinte.hexdigest()[:8]
+
+def preparer_base(echelle, graine, dossier):
+    """Copie de travail d'une base de l'échelle demandée.
+
+    La base de référence est générée une seule fois ; chaque exécution travaille sur
+    une copie fraîche, car les scénarios d'écriture (rapports, chatbot) la modifient.
+    """
+    reference = os.path.join(dossier, f'ferme-immo-bench-{echelle}-{graine}-{empreinte_schema()}.db')
+    marqueur = reference + '.pret'
+    if not os.path.exists(marqueur):
+        if os.path.exists(reference):
+            os.remove(reference)
+        # Génération dans un processus séparé : l'application ne peut être importée qu'une fois
+        subprocess.run([sys.executable, '-m', 'benchmarks.donnees', '--echelle', echelle, '--graine', str(graine),
+                        '--base', reference, '--volumes', marqueur],
+                       cwd=os.path.dirname(os.path.dirname(FICHIER_SEUILS)), check=True)
+
+    copie = os.path.join(dossier, f'ferme-immo-bench-{echelle}-{graine}-{os.getpid()}.db')
+    shutil.copyfile(reference, copie)
+    atexit.register(os.remove, copie)
+    atexit.register(lambda: os.path.exists(copie + '.admission') and os.remove(copie + '.admission'))
+    # Fichiers dérivés de la copie : archives, instantané, artefacts du modèle d'estimation
+    atexit.register(lambda: [shutil.rmtree(chemin) if os.path.isdir(chemin) else os.remove(chemin)
+                             for chemin in glob.glob(f'{os.path.splitext(copie)[0]}_*')])
+    with open(marqueur, encoding='utf-8') as fichier:
+        return ouvrir_application(copie, {'ADMISSION_ACTIVE': False, 'ADMISSION_FICHIER': copie + '.admission',
+                                          'ADMISSION_REGLES': dict(REGLES_PAR_DEFAUT, **REGLE_ADMISSION)}), \
+            json.load(fichier)
+
+def environnement():
+    """Contexte d'exécution enregistré avec les résultats (pour comparer à l'identique)"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(FICHIER_SEUILS), check=False).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'date': datetime.utcnow().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plateforme': platform.platform(),
+        'processeurs': os.cpu_count()
+    }
+
+def comparer(resultats, reference, seuils):
+    """Régressions des résultats par rapport à une référence.
+
+    Une régression est un percentile de latence qui augmente, ou un débit qui baisse,
+    de plus que la tolérance relative du scénario (seuils['scenarios'][nom], sinon
+    seuils['defaut']). Les budgets absolus (p95_ms_max, ...) sont aussi vérifiés. Les
+    séries de moins de `requetes_min` mesures sont ignorées.
+    """
+    regressions = []
+
+    def verifier(section, nom, mesure, precedente):
+        tolerances = dict(seuils.get('defaut', {}), **seuils.get('scenarios', {}).get(nom, {}))
+        # Trop peu de mesures : les percentiles hauts ne sont que du bruit
+        if mesure.get('requetes', 0) < tolerances.get('requetes_min', 0):
+            return
+        for indicateur in ('p50_ms', 'p95_ms', 'p99_ms'):
+            tolerance = tolerances.get(indicateur)
+            if tolerance is None or not precedente or precedente.get(indicateur) is None or mesure.get(indicateur) is None:
+                continue
+            # Plancher absolu : quelques dixièmes de milliseconde ne sont pas une régression
+            if mesure[indicateur] > precedente[indicateur] * (1 + tolerance) + tolerances.get('marge_ms', 0):
+                regressions.append({'section': section, 'scenario': nom, 'indicateur': indicateur,
+                                    'reference': precedente[indicateur], 'mesure': mesure[indicateur]})
+        tolerance = tolerances.get('debit_rps')
+        if tolerance is not None and precedente and precedente.get('debit_rps') and mesure.get('debit_rps') is not None:
+            if mesure['debit_rps'] < precedente['debit_rps'] * (1 - tolerance):
+                regressions.append({'section': section, 'scenario': nom, 'indicateur': 'debit_rps',
+                                    'reference': precedente['debit_rps'], 'mesure': mesure['debit_rps']})
+        for indicateur in ('p50_ms', 'p95_ms', 'p99_ms'):
+            budget = tolerances.get(f'{indicateur}_max')
+            if budget is not None and mesure.get(indicateur) is not None and mesure[indicateur] > budget:
+                regressions.append({'section': section, 'scenario': nom, 'indicateur': f'{indicateur}_max',
+                                    'reference': budget, 'mesure': mesure[indicateur]})
+        if mesure.get('erreurs') and not (precedente or {}).get('erreurs'):
+            regressions.append({'section': section, 'scenario': nom, 'indicateur': 'erreurs',
+                                'reference': 0, 'mesure': mesure['erreurs']})
+
+    if resultats.get('admission') and reference.get('admission'):
+        verifier('admission', 'avec_limiteur', resultats['admission']['avec_limiteur'],
+                 reference['admission']['avec_limiteur'])
+        budget = seuils.get('admission', {}).get('surcout_p50_us_max')
+        if budget is not None and resultats['admission']['surcout_p50_us'] > budget:
+            regressions.append({'section': 'admission', 'scenario': 'surcout', 'indicateur': 'surcout_p50_us_max',
+                                'reference': budget, 'mesure': resultats['admission']['surcout_p50_us']})
+    if resultats.get('avm'):
+        budgets = seuils.get('avm', {})
+        for indicateur, mesure in resultats['avm'].items():
+            if mesure > budgets.get(f'{indicateur}_max', mesure):
+                regressions.append({'section': 'avm', 'scenario': 'modele', 'indicateur': f'{indicateur}_max',
+                                    'reference': budgets[f'{indicateur}_max'], 'mesure': mesure})
+            if mesure < budgets.get(f'{indicateur}_min', mesure):
+                regressions.append({'section': 'avm', 'scenario': 'modele', 'indicateur': f'{indicateur}_min',
+                                    'reference': budgets[f'{indicateur}_min'], 'mesure': mesure})
+    if resultats.get('compression'):
+        # Variante servie par défaut (gzip au niveau configuré), sur les réponses assez grosses pour compter
+        budgets = seuils.get('compression', {})
+        variante = f"gzip-{resultats['compression']['niveau_configure']}"
+        for nom, charge in resultats['compression']['charges'].items():
+            mesure = charge['variantes'].get(variante)
+            if mesure is None or charge['octets'] < budgets.get('octets_min', 0):
+                continue
+            if mesure['ratio'] > budgets.get('ratio_max', mesure['ratio']):
+                regressions.append({'section': 'compression', 'scenario': nom, 'indicateur': 'ratio_max',
+                                    'reference': budgets['ratio_max'], 'mesure': mesure['ratio']})
+            if mesure['mo_par_s'] is not None and mesure['mo_par_s'] < budgets.get('mo_par_s_min', 0):
+                regressions.append({'section': 'compression', 'scenario': nom, 'indicateur': 'mo_par_s_min',
+                                    'reference': budgets['mo_par_s_min'], 'mesure': mesure['mo_par_s']})
+    for nom, mesure in resultats.get('sequentiel', {}).items():
+        verifier('sequentiel', nom, mesure, reference.get('sequentiel', {}).get(nom))
+    if resultats.get('charge') and reference.get('charge'):
+        verifier('charge', 'global', resultats['charge']['global'], reference['charge']['global'])
+        for nom, mesure in resultats['charge']['scenarios'].items():
+            verifier('charge', nom, mesure, reference['charge']['scenarios'].get(nom))
+    return regressions
+
+def executer(arguments):
+    scenarios = construire_scenarios(arguments.echelle)
+    if arguments.scenarios:
+        retenus = set(arguments.scenarios.split(','))
+        scenarios = [scenario for scenario in scenarios if scenario[0] in retenus]
+
+    resultats = {'echelle': arguments.echelle, 'graine': arguments.graine, 'environnement': environnement()}
+    if arguments.url:
+        fabrique_client = lambda: ClientHttp(arguments.url)
+        resultats['cible'] = arguments.url
+    else:
+        application, volumes = preparer_base(arguments.echelle, arguments.graine, arguments.dossier)
+        application.config['SLOW_QUERY_FICHIER'] = None
+        fabrique_client = application.test_client
+        resultats['volumes'] = volumes
+        resultats['cible'] = 'client_de_test'
+
+    if not arguments.charge_seulement:
+        client = fabrique_client()
+        rng = random.Random(f'{arguments.graine}-sequentiel')
+        resultats['sequentiel'] = {}
+        for scenario in scenarios:
+            resultats['sequentiel'][scenario[0]] = executer_scenario(client, scenario, rng, arguments.repetitions)
+            print(f"{scenario[0]:<24} {json.dumps(resultats['sequentiel'][scenario[0]])}", file=sys.stderr)
+
+    if arguments.clients:
+        resultats['charge'] = executer_charge(fabrique_client, scenarios, arguments.clients, arguments.duree,
+                                              arguments.graine)
+        print(f"charge ({arguments.clients} clients) {json.dumps(resultats['charge']['global'])}", file=sys.stderr)
+
+    if not arguments.url and not arguments.sans_admission:
+        resultats['admission'] = mesurer_surcout(application)
+        print(f"admission : surcoût p50 {resultats['admission']['surcout_p50_us']} µs "
+              f"{json.dumps(resultats['admission']['operations'])}", file=sys.stderr)
+
+    if not arguments.url and not arguments.sans_compression:
+        resultats['compression'] = mesurer_compression(application)
+        for nom, charge in resultats['compression']['charges'].items():
+            variante = charge['variantes'][f"gzip-{resultats['compression']['niveau_configure']}"]
+            print(f"compression {nom:<18} {charge['octets']} -> {variante['octets']} octets, "
+                  f"{variante['cpu_ms']} ms CPU, surcoût requête {charge['surcout_ms']} ms", file=sys.stderr)
+
+    if not arguments.sans_avm:
+        resultats['avm'] = mesurer_avm(arguments.ventes_avm)
+        print(f"avm : {json.dumps(resultats['avm'])}", file=sys.stderr)
+
+    if arguments.reference:
+        with open(arguments.reference, encoding='utf-8') as fichier:
+            reference = json.load(fichier)
+        with open(arguments.seuils, encoding='utf-8') as fichier:
+            seuils = json.load(fichier)
+        resultats['regressions'] = comparer(resultats, reference, seuils)
+    return resultats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--echelle', default='10k', help='10k, 100k, 1m ou un nombre de biens')
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--dossier', default=tempfile.gettempdir(), help='Dossier des bases générées')
+    parser.add_argument('--repetitions', type=int, default=50, help='Requêtes mesurées par scénario')
+    parser.add_argument('--clients', type=int, default=8, help='Clients concurrents (0 : pas de charge)')
+    parser.add_argument('--duree', type=float, default=10.0, help='Durée de la phase de charge (s)')
+    parser.add_argument('--scenarios', help='Scénarios à exécuter, séparés par des virgules')
+    parser.add_argument('--url', help='Viser un serveur en HTTP au lieu du client de test')
+    parser.add_argument('--charge-seulement', action='store_true')
+    parser.add_argument('--sans-admission', action='store_true', help='Ne pas mesurer le surcoût du limiteur')
+    parser.add_argument('--sans-compression', action='store_true', help='Ne pas mesurer la compression des réponses')
+    parser.add_argument('--sans-avm', action='store_true', help='Ne pas mesurer le modèle d\'estimation')
+    parser.add_argument('--ventes-avm', type=int, default=200_000, help='Ventes générées pour le modèle d\'estimation')
+    parser.add_argument('--sortie', help='Fichier JSON de résultats (défaut : stdout)')
+    parser.add_argument('--reference', help='Résultats précédents à comparer')
+    parser.add_argument('--seuils', default=FICHIER_SEUILS)
+    arguments = parser.parse_args()
+
+    resultats = executer(arguments)
+    texte = json.dumps(resultats, ensure_ascii=False, indent=2)
+    if arguments.sortie:
+        with open(arguments.sortie, 'w', encoding='utf-8') as fichier:
+            fichier.write(texte + '\n')
+    else:
+        print(texte)
+    if resultats.get('regressions'):
+        for regression in resultats['regressions']:
+            print(f"RÉGRESSION {regression['section']}/{regression['scenario']} {regression['indicateur']} : "
+                  f"{regression['reference']} -> {regression['mesure']}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,106 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Créer les tables manquantes et migrer les existantes (à lancer à chaque déploiement, avant les workers)"""
+    from src.main import init_schema
+
+    for operation in init_schema(current_app):
+        click.echo(operation)
+    click.echo('Schéma de la base à jour')
+
+@click.command('rapports-mensuels')
+@click.option('--periode', help='Mois à générer (AAAA-MM), par défaut le mois courant')
+@click.option('--user-id', default=1, show_default=True, help='Utilisateur propriétaire des rapports')
+@click.option('--workers', type=int, help='Nombre de processus de génération (défaut : nombre de cœurs)')
+@click.option('--taille-lot', default=50, show_default=True, help='Nombre de villes par insertion en masse')
+@click.option('--pdf', is_flag=True, help='Produire aussi la version PDF de chaque rapport')
+@with_appcontext
+def rapports_mensuels(periode, user_id, workers, taille_lot, pdf):
+    """Générer les rapports mensuels de toutes les zones de farming (à planifier via cron)"""
+    from src.routes.report import dossier_artefacts
+    from src.services.batch_reports import executer_batch
+
+    batch = executer_batch(periode, user_id=user_id, workers=workers, taille_lot=taille_lot,
+                           dossier_pdf=dossier_artefacts() if pdf else None)
+    click.echo(f"Période {batch.period} : {batch.status}, {batch.reports_created} rapports, "
+               f"{batch.locations_done}/{batch.locations_total} villes en {batch.duration_seconds:.1f} s "
+               f"({batch.throughput or 0} rapports/s)")
+
+@click.command('chatbot-analyse')
+@click.argument('fichier', type=click.File('rb'))
+@click.option('--sortie', type=click.File('w', encoding='utf-8'), default='-', help='Fichier NDJSON de sortie (défaut : stdout)')
+@click.option('--workers', type=int, help='Nombre de processus d\'analyse (défaut : nombre de cœurs)')
+@click.option('--taille-lot', default=500, show_default=True, help='Conversations par lot')
+@click.option('--upsert-leads', is_flag=True, help='Créer ou mettre à jour les leads en base')
+@with_appcontext
+def chatbot_analyse(fichier, sortie, workers, taille_lot, upsert_leads):
+    """Analyser un fichier JSONL de transcriptions avec les extracteurs du chatbot"""
+    import json
+    from src.services.transcripts import analyser_et_ecrire
+
+    for resultat in analyser_et_ecrire(fichier, workers=workers, taille_lot=taille_lot, ecrire_leads=upsert_leads):
+        sortie.write(json.dumps(resultat, ensure_ascii=False) + '\n')
+
+@click.command('purger-changements')
+@click.option('--jours', type=int, help='Rétention en jours (défaut : CHANGES_RETENTION_JOURS)')
+@with_appcontext
+def purger_changements(jours):
+    """Supprimer les entrées anciennes du journal des modifications (à planifier via cron)"""
+    from src.services.change_feed import flux_changements
+
+    supprimees = flux_changements.purger(jours)
+    click.echo(f"{supprimees} entrées supprimées, curseur minimal {flux_changements.curseur_minimal()}")
+
+@click.command('archiver-ventes')
+@click.option('--annees-chaudes', type=int, help='Années gardées dans la table chaude, année courante comprise '
+                                                 '(défaut : PROPERTY_ANNEES_CHAUDES)')
+@with_appcontext
+def archiver_ventes(annees_chaudes):
+    """Déplacer les ventes anciennes vers les archives annuelles (à planifier via cron en début d'année)"""
+    from src.services.partitions import partitions_ventes
+
+    deplacements = partitions_ventes.archiver(annees_chaudes)
+    for annee, nombre in sorted(deplacements.items()):
+        sens = 'archivées' if nombre >= 0 else 'réintégrées dans la table chaude'
+        click.echo(f"{annee} : {abs(nombre)} ventes {sens}")
+    click.echo(f"Table chaude à partir de {partitions_ventes.annee_limite(annees_chaudes)}")
+
+@click.command('reconstruire-instantane')
+@with_appcontext
+def reconstruire_instantane():
+    """Reconstruire l'instantané en colonnes des biens (avant le démarrage, ou après une restauration)"""
+    instantane = current_app.extensions.get('instantane_proprietes')
+    if instantane is None:
+        raise click.ClickException('Blueprint property désactivé : pas d\'instantané')
+    colonnes = instantane.reconstruire()
+    click.echo(f"{colonnes.lignes} biens, curseur {colonnes.curseur}")
+
+@click.command('entrainer-avm')
+@with_appcontext
+def entrainer_avm():
+    """Entraîner et publier une nouvelle version du modèle d'estimation (cron, ou après un import massif)"""
+    moteur = current_app.extensions.get('moteur_avm')
+    if moteur is None:
+        raise click.ClickException('Blueprint property désactivé : pas de modèle d\'estimation')
+    from src.services.avm import ModeleIndisponible  # numpy, chargé avec le blueprint
+    try:
+        modele = moteur.entrainer()
+    except ModeleIndisponible as erreur:
+        raise click.ClickException(str(erreur))
+    meta = modele.meta
+    click.echo(f"Version {meta['version']} : {modele.base[3]} ventes, R² {meta['r2']}, "
+               f"erreur médiane {meta['mdape']} %, {meta['duree_s']} s")
+
+def register_commands(app):
+    """Enregistrer les commandes CLI de l'application"""
+    app.cli.add_command(init_db)
+    app.cli.add_command(rapports_mensuels)
+    app.cli.add_command(chatbot_analyse)
+    app.cli.add_command(purger_changements)
+    app.cli.add_command(archiver_ventes)
+    app.cli.add_command(reconstruire_instantane)
+    app.cli.add_command(entrainer_avm)
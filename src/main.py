@@ -3,60 +3,150 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from importlib import import_module
+from flask import Flask, current_app
 from flask_cors import CORS
+from sqlalchemy.engine import make_url
 from src.models.user import db
-from src.routes.user import user_bp
-from src.routes.property import property_bp
-from src.routes.lead import lead_bp
-from src.routes.neighborhood import neighborhood_bp
-from src.routes.report import report_bp
-from src.routes.chatbot import chatbot_bp
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'ferme-immo-saas-secret-key-2024'
-
-# Activer CORS pour permettre les requêtes cross-origin
-CORS(app)
-
-# Enregistrer tous les blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(property_bp, url_prefix='/api')
-app.register_blueprint(lead_bp, url_prefix='/api')
-app.register_blueprint(neighborhood_bp, url_prefix='/api')
-app.register_blueprint(report_bp, url_prefix='/api')
-app.register_blueprint(chatbot_bp, url_prefix='/api')
-
-# uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-
-# Importer tous les modèles pour la création des tables
-from src.models.property import Property
-from src.models.lead import Lead
-from src.models.neighborhood import Neighborhood
-from src.models.report import Report
-
-with app.app_context():
-    db.create_all()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
+from src.commands import register_commands
+
+# Blueprints disponibles : nom -> (module, attribut). Seuls les modules activés sont importés
+BLUEPRINTS = {
+    'user': ('src.routes.user', 'user_bp'),
+    'property': ('src.routes.property', 'property_bp'),
+    'lead': ('src.routes.lead', 'lead_bp'),
+    'neighborhood': ('src.routes.neighborhood', 'neighborhood_bp'),
+    'report': ('src.routes.report', 'report_bp'),
+    'chatbot': ('src.routes.chatbot', 'chatbot_bp'),
+    'monitoring': ('src.routes.monitoring', 'monitoring_bp'),
+    'changes': ('src.routes.changes', 'changes_bp'),
+    'dashboard': ('src.routes.dashboard', 'dashboard_bp'),
+}
+
+# Services disponibles, dans l'ordre d'initialisation : nom -> (module, attribut). Seuls les services
+# activés sont importés. La compression reste la dernière : son after_request s'exécute en premier
+SERVICES = {
+    'partitions': ('src.services.partitions', 'partitions_ventes'),
+    'chat_sessions': ('src.services.chat_sessions', 'session_store'),
+    'metrics': ('src.services.metrics', 'metriques'),
+    'admission': ('src.services.admission', 'controle_admission'),
+    'slow_queries': ('src.services.slow_queries', 'profileur_requetes'),
+    'static_assets': ('src.services.static_assets', 'fichiers_statiques'),
+    'change_feed': ('src.services.change_feed', 'flux_changements'),
+    'single_flight': ('src.services.single_flight', 'coalescence'),
+    'compression': ('src.services.compression', 'compression_reponses'),
+}
+
+# Toujours chargés : journal des modifications des écritures, archives attachées à chaque connexion
+SERVICES_ESSENTIELS = ('partitions', 'change_feed')
+
+# Services dont les routes d'un blueprint ont besoin : chargés avec lui
+SERVICES_BLUEPRINTS = {
+    'chatbot': ('chat_sessions',),
+    'monitoring': ('metrics', 'slow_queries'),
+}
+
+# Modules de modèles, importés uniquement pour créer le schéma
+MODULES_MODELES = ['src.models.user', 'src.models.property', 'src.models.lead', 'src.models.neighborhood',
+                   'src.models.report', 'src.models.chat', 'src.models.change_log']
+
+def create_app(config=None):
+    """Créer l'application Flask.
+
+    Le schéma de la base n'est pas créé ici : voir init_schema() et la commande
+    `flask --app src.main init-db`.
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config['SECRET_KEY'] = 'ferme-immo-saas-secret-key-2024'
+    # FERME_IMMO_DATA_DIR : dossier des données d'exécution (base, fichiers partagés, journaux, artefacts)
+    app.config['DATA_DIR'] = os.environ.get('FERME_IMMO_DATA_DIR')
+    # FERME_IMMO_DATABASE_URI permet de pointer vers une autre base (benchmarks, environnements de test)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('FERME_IMMO_DATABASE_URI') or \
+        f"sqlite:///{os.path.join(app.config['DATA_DIR'] or os.path.join(os.path.dirname(__file__), 'database'), 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # FERME_IMMO_BLUEPRINTS (ex. "chatbot,lead") limite les blueprints d'un processus dédié
+    blueprints = os.environ.get('FERME_IMMO_BLUEPRINTS')
+    app.config['ENABLED_BLUEPRINTS'] = blueprints.split(',') if blueprints else list(BLUEPRINTS)
+    # FERME_IMMO_SERVICES (ex. "metrics,admission") limite de même les services transverses
+    services = os.environ.get('FERME_IMMO_SERVICES')
+    app.config['ENABLED_SERVICES'] = services.split(',') if services else list(SERVICES)
+    app.config['CREATE_SCHEMA_ON_STARTUP'] = False
+    if config:
+        app.config.update(config)
+    if not app.config['DATA_DIR']:
+        # Par défaut, le dossier de la base SQLite (instance/ pour une base en mémoire ou un autre SGBD)
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        base = url.database if url.get_backend_name() == 'sqlite' else None
+        app.config['DATA_DIR'] = os.path.dirname(os.path.abspath(base)) if base and base != ':memory:' else app.instance_path
+    os.makedirs(app.config['DATA_DIR'], exist_ok=True)
+
+    # Activer CORS pour permettre les requêtes cross-origin
+    CORS(app)
+
+    # Enregistrer les blueprints activés
+    for nom in app.config['ENABLED_BLUEPRINTS']:
+        if nom not in BLUEPRINTS:
+            raise ValueError(f"Blueprint inconnu : {nom}")
+        module, attribut = BLUEPRINTS[nom]
+        app.register_blueprint(getattr(import_module(module), attribut), url_prefix='/api')
+
+    # Commandes CLI (flask --app src.main <commande>)
+    register_commands(app)
+
+    db.init_app(app)
+
+    # Initialiser les services activés, et ceux dont dépendent les blueprints activés
+    actives = set(SERVICES_ESSENTIELS)
+    for nom in app.config['ENABLED_SERVICES']:
+        if nom not in SERVICES:
+            raise ValueError(f"Service inconnu : {nom}")
+        actives.add(nom)
+    for nom in app.config['ENABLED_BLUEPRINTS']:
+        actives.update(SERVICES_BLUEPRINTS.get(nom, ()))
+    for nom, (module, attribut) in SERVICES.items():
+        if nom in actives:
+            getattr(import_module(module), attribut).init_app(app)
+
+    if 'static_assets' in actives:
+        app.add_url_rule('/', defaults={'path': ''}, view_func=serve)
+        app.add_url_rule('/<path:path>', view_func=serve)
+
+    if app.config['CREATE_SCHEMA_ON_STARTUP']:
+        init_schema(app)
+    return app
+
+def init_schema(app):
+    """Créer les tables manquantes de tous les modèles et mettre à niveau les tables existantes"""
+    from src.migrations import migrer_schema
+
+    for module in MODULES_MODELES:
+        import_module(module)
+    with app.app_context():
+        db.create_all()
+        return migrer_schema(db.engine)
+
 def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
+    """Fichiers de static/ depuis le manifeste, index.html pour les routes de l'application web"""
+    if current_app.static_folder is None:
             return "Static folder not configured", 404
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
+    fichiers_statiques = current_app.extensions['fichiers_statiques']
+    entree = fichiers_statiques.trouver(path) if path != "" else None
+    if entree is None:
+        entree = fichiers_statiques.trouver('index.html')
+        if entree is None:
             return "index.html not found", 404
+    return fichiers_statiques.servir(entree)
+
+def __getattr__(nom):
+    # `src.main:app` (gunicorn, flask --app src.main) : application par défaut, créée au premier accès
+    if nom == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {nom!r}")
 
 
 if __name__ == '__main__':
+    app = create_app({'CREATE_SCHEMA_ON_STARTUP': True, 'STATIC_RECHARGEMENT': True})
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,100 @@
+from sqlalchemy import text
+from sqlalchemy.schema import CreateColumn, CreateTable
+from src.models.user import db
+import logging
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT_CONTENU = 500  # rapports recompressés par transaction
+
+def migrer_schema(engine):
+    """Mettre à niveau les tables existantes d'une base SQLite créée par une version antérieure.
+
+    `db.create_all()` crée les tables manquantes mais ne modifie jamais une table
+    existante. Cette étape, idempotente, ajoute les colonnes absentes (PRAGMA
+    table_info), reconstruit les tables passées en AUTOINCREMENT, crée les index et
+    contraintes d'unicité manquants, puis compresse le contenu des anciens rapports.
+    Renvoie la liste des opérations effectuées.
+    """
+    if engine.dialect.name != 'sqlite':
+        return []
+    operations = []
+    with engine.begin() as connexion:
+        for table in db.metadata.sorted_tables:
+            colonnes = _colonnes(connexion, table.name)
+            if not colonnes:
+                continue  # table créée par create_all, déjà au bon schéma
+            for colonne in table.columns:
+                if colonne.name not in colonnes:
+                    ddl = CreateColumn(colonne).compile(dialect=engine.dialect)
+                    connexion.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+                    operations.append(f'{table.name}.{colonne.name} : colonne ajoutée')
+            if table.dialect_options['sqlite'].get('autoincrement') and not _autoincrement(connexion, table.name):
+                _reconstruire(connexion, table, engine.dialect)
+                operations.append(f'{table.name} : reconstruite en AUTOINCREMENT')
+            for index in table.indexes:
+                if not _index_existe(connexion, index.name):
+                    index.create(connexion)
+                    operations.append(f'{table.name} : index {index.name} créé')
+            for colonne in table.columns:
+                if colonne.unique and not _unique(connexion, table.name, colonne.name):
+                    # ALTER TABLE ADD COLUMN n'accepte pas UNIQUE : index unique équivalent
+                    connexion.execute(text(f'CREATE UNIQUE INDEX uq_{table.name}_{colonne.name} '
+                                           f'ON {table.name} ({colonne.name})'))
+                    operations.append(f'{table.name}.{colonne.name} : index unique créé')
+    migres = _compresser_rapports(engine)
+    if migres:
+        operations.append(f'report : {migres} contenus compressés')
+    for operation in operations:
+        logger.info('Migration du schéma : %s', operation)
+    return operations
+
+def _colonnes(connexion, table):
+    return {ligne[1] for ligne in connexion.execute(text(f"PRAGMA table_info('{table}')"))}
+
+def _autoincrement(connexion, table):
+    ddl = connexion.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :nom"),
+                            {'nom': table}).scalar() or ''
+    return 'AUTOINCREMENT' in ddl.upper()
+
+def _index_existe(connexion, nom):
+    return connexion.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :nom"),
+                             {'nom': nom}).first() is not None
+
+def _unique(connexion, table, colonne):
+    for index in connexion.execute(text(f"PRAGMA index_list('{table}')")).mappings():
+        if index['unique']:
+            colonnes = [ligne[2] for ligne in connexion.execute(text(f"PRAGMA index_info('{index['name']}')"))]
+            if colonnes == [colonne]:
+                return True
+    return False
+
+def _reconstruire(connexion, table, dialect):
+    """Recréer une table avec le DDL du modèle en conservant ses lignes (et leurs identifiants)"""
+    provisoire = f'{table.name}__migration'
+    ddl = str(CreateTable(table).compile(dialect=dialect)).strip()
+    ddl = ddl.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {provisoire} ', 1)
+    colonnes = ', '.join(colonne.name for colonne in table.columns)
+    connexion.execute(text(ddl))
+    connexion.execute(text(f'INSERT INTO {provisoire} ({colonnes}) SELECT {colonnes} FROM {table.name}'))
+    connexion.execute(text(f'DROP TABLE {table.name}'))  # ses index disparaissent avec elle et sont recréés ensuite
+    connexion.execute(text(f'ALTER TABLE {provisoire} RENAME TO {table.name}'))
+
+def _compresser_rapports(engine):
+    """Déplacer le contenu historique `content` des rapports vers `content_compressed`"""
+    from src.models.report import compresser_contenu
+
+    total = 0
+    while True:
+        with engine.begin() as connexion:
+            lignes = connexion.execute(text('SELECT id, content FROM report WHERE content IS NOT NULL '
+                                            'AND content_compressed IS NULL LIMIT :taille'),
+                                       {'taille': TAILLE_LOT_CONTENU}).all()
+            if not lignes:
+                return total
+            for identifiant, contenu in lignes:
+                compresse, taille = compresser_contenu(contenu)
+                connexion.execute(text('UPDATE report SET content_compressed = :compresse, content_size = :taille, '
+                                       'content = NULL WHERE id = :id'),
+                                  {'compresse': compresse, 'taille': taille, 'id': identifiant})
+            total += len(lignes)
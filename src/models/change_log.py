@@ -0,0 +1,33 @@
+from src.models.user import db
+from datetime import datetime
+
+class ChangeLog(db.Model):
+    """Journal des modifications : une ligne par écriture sur une table suivie.
+
+    `seq` croît strictement (AUTOINCREMENT : jamais réutilisé, même après une purge)
+    et sert de curseur au flux /api/changes. Les suppressions laissent une entrée
+    'delete' (tombstone) pour que les clients synchronisés retirent la ligne.
+    """
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_table_seq', 'table_name', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+
+    seq = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # insert, update, delete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ChangeLog {self.seq} {self.operation} {self.table_name}:{self.row_id}>'
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'table': self.table_name,
+            'id': self.row_id,
+            'operation': self.operation,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
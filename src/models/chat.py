@@ -0,0 +1,50 @@
+from flask_sqlalchemy import SQLAlchemy
+from src.models.user import db
+from datetime import datetime
+import json
+
+class ChatSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(64), unique=True, nullable=False)
+    contexte = db.Column(db.Text)  # Contexte de la conversation en JSON
+    nb_messages = db.Column(db.Integer, default=0)
+    lead_id = db.Column(db.Integer, db.ForeignKey('lead.id'))  # Lead généré par la conversation
+    statut = db.Column(db.String(20), default='en_cours')  # en_cours, qualifie
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<ChatSession {self.session_id}>'
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'date_debut': self.created_at.isoformat() if self.created_at else None,
+            'derniere_activite': self.updated_at.isoformat() if self.updated_at else None,
+            'messages': self.nb_messages,
+            'lead_genere': self.lead_id is not None,
+            'lead_id': self.lead_id,
+            'statut': self.statut,
+            'contexte': json.loads(self.contexte) if self.contexte else {}
+        }
+
+class ChatTurn(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(64), nullable=False, index=True)
+    message = db.Column(db.Text)
+    intention = db.Column(db.String(50))
+    reponse = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ChatTurn {self.session_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'session_id': self.session_id,
+            'message': self.message,
+            'intention': self.intention,
+            'reponse': self.reponse,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
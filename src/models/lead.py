@@ -20,6 +20,9 @@ class Lead(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_contact_date = db.Column(db.DateTime)
+    session_id = db.Column(db.String(64), unique=True)  # Conversation chatbot d'origine
+    # Incrémentée à chaque écriture : contrôle de concurrence optimiste des mises à jour en masse
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1', onupdate=db.literal_column('version') + 1)
 
     def __repr__(self):
         return f'<Lead {self.first_name} {self.last_name}>'
@@ -42,6 +45,8 @@ class Lead(db.Model):
             'notes': self.notes,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'last_contact_date': self.last_contact_date.isoformat() if self.last_contact_date else None
+            'last_contact_date': self.last_contact_date.isoformat() if self.last_contact_date else None,
+            'session_id': self.session_id,
+            'version': self.version
         }
 
@@ -3,6 +3,9 @@ from src.models.user import db
 from datetime import datetime
 
 class Property(db.Model):
+    # AUTOINCREMENT : les identifiants des ventes archivées (services/partitions.py) ne sont jamais réattribués
+    __table_args__ = {'sqlite_autoincrement': True}
+
     id = db.Column(db.Integer, primary_key=True)
     address = db.Column(db.String(200), nullable=False)
     city = db.Column(db.String(100), nullable=False)
@@ -16,6 +19,8 @@ class Property(db.Model):
     longitude = db.Column(db.Float)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Incrémentée à chaque écriture : contrôle de concurrence optimiste des mises à jour en masse
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1', onupdate=db.literal_column('version') + 1)
 
     def __repr__(self):
         return f'<Property {self.address}>'
@@ -34,6 +39,7 @@ class Property(db.Model):
             'latitude': self.latitude,
             'longitude': self.longitude,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'version': self.version
         }
 
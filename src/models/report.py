@@ -1,33 +1,125 @@
 from flask_sqlalchemy import SQLAlchemy
 from src.models.user import db
 from datetime import datetime
+import zlib
+
+# Niveau de compression zlib du contenu des rapports (compromis CPU / taille)
+NIVEAU_COMPRESSION = 6
+TAILLE_BLOC_STREAMING = 64 * 1024
 
 class Report(db.Model):
+    __table_args__ = (
+        db.Index('ix_report_user_created', 'user_id', 'created_at'),
+        db.Index('ix_report_type_created', 'report_type', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     report_type = db.Column(db.String(50), nullable=False)  # 'market_analysis', 'neighborhood_prediction', etc.
     location = db.Column(db.String(200))  # Zone géographique du rapport
-    content = db.Column(db.Text)  # Contenu du rapport en JSON ou HTML
+    # Contenu historique non compressé (anciens rapports), chargé uniquement à la demande
+    content_legacy = db.deferred(db.Column('content', db.Text), group='contenu')
+    # Contenu du rapport en JSON compressé zlib, chargé uniquement à la demande
+    content_compressed = db.deferred(db.Column(db.LargeBinary), group='contenu')
+    content_size = db.Column(db.Integer)  # Taille du contenu décompressé en octets
     file_path = db.Column(db.String(500))  # Chemin vers le fichier PDF généré
     status = db.Column(db.String(20), default='generating')  # generating, completed, error
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('report_batch.id'), index=True)  # Génération planifiée d'origine
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __repr__(self):
         return f'<Report {self.title}>'
 
-    def to_dict(self):
-        return {
+    @property
+    def content(self):
+        """Contenu JSON du rapport, décompressé à la lecture"""
+        if self.content_compressed is not None:
+            return zlib.decompress(self.content_compressed).decode('utf-8')
+        return self.content_legacy
+
+    @content.setter
+    def content(self, valeur):
+        if valeur is None:
+            self.content_compressed = None
+            self.content_size = None
+        else:
+            self.content_compressed, self.content_size = compresser_contenu(valeur)
+        self.content_legacy = None
+
+    def iter_content(self, taille_bloc=TAILLE_BLOC_STREAMING):
+        """Itérer sur le contenu JSON par blocs, en décompressant au fil de l'eau"""
+        if self.content_compressed is not None:
+            return decompresser_par_blocs(self.content_compressed, taille_bloc)
+        if self.content_legacy is not None:
+            return iter([self.content_legacy.encode('utf-8')])
+        return iter([])
+
+    def to_dict(self, include_content=True):
+        data = {
             'id': self.id,
             'title': self.title,
             'report_type': self.report_type,
             'location': self.location,
-            'content': self.content,
             'file_path': self.file_path,
             'status': self.status,
             'user_id': self.user_id,
+            'batch_id': self.batch_id,
+            'content_size': self.content_size,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_content:
+            data['content'] = self.content
+        return data
+
+class ReportBatch(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), unique=True, nullable=False)  # Mois couvert, ex. '2024-03'
+    status = db.Column(db.String(20), default='running')  # running, completed, error
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    locations_total = db.Column(db.Integer, default=0)
+    locations_done = db.Column(db.Integer, default=0)
+    reports_created = db.Column(db.Integer, default=0)
+    duration_seconds = db.Column(db.Float, default=0.0)  # Cumulé sur toutes les reprises
+    throughput = db.Column(db.Float)  # Rapports générés par seconde
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ReportBatch {self.period}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'period': self.period,
+            'status': self.status,
+            'user_id': self.user_id,
+            'locations_total': self.locations_total,
+            'locations_done': self.locations_done,
+            'reports_created': self.reports_created,
+            'duration_seconds': self.duration_seconds,
+            'throughput': self.throughput,
+            'error': self.error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+def compresser_contenu(texte):
+    """Compresser un contenu texte, retourne (octets compressés, taille d'origine)"""
+    brut = texte.encode('utf-8')
+    return zlib.compress(brut, NIVEAU_COMPRESSION), len(brut)
 
+def decompresser_par_blocs(donnees, taille_bloc=TAILLE_BLOC_STREAMING):
+    """Décompresser des octets zlib par blocs bornés en mémoire"""
+    decompresseur = zlib.decompressobj()
+    for debut in range(0, len(donnees), taille_bloc):
+        bloc = decompresseur.decompress(donnees[debut:debut + taille_bloc], taille_bloc)
+        while bloc:
+            yield bloc
+            bloc = decompresseur.decompress(decompresseur.unconsumed_tail, taille_bloc)
+    reste = decompresseur.flush()
+    if reste:
+        yield reste
@@ -0,0 +1,46 @@
+from flask import Blueprint, current_app, jsonify, request
+from src.models.user import db
+from src.services.change_feed import TABLES_SUIVIES, flux_changements
+import time
+
+changes_bp = Blueprint('changes', __name__)
+
+@changes_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """Modifications des biens, leads et quartiers postérieures à un curseur.
+
+    Sans `since`, renvoie seulement le curseur courant (à lire avant la copie
+    initiale des données). Avec `wait`, la requête attend jusqu'à `wait` secondes
+    qu'une modification arrive quand il n'y en a aucune (long-poll).
+    """
+    config = current_app.config
+    tables = request.args.get('tables')
+    tables = [table for table in tables.split(',') if table] if tables else list(TABLES_SUIVIES)
+    inconnues = [table for table in tables if table not in TABLES_SUIVIES]
+    if inconnues:
+        return jsonify({'erreur': f"Tables non suivies : {', '.join(inconnues)}",
+                        'tables_suivies': list(TABLES_SUIVIES)}), 400
+
+    depuis = request.args.get('since', type=int)
+    if depuis is None:
+        return jsonify({'changes': [], 'cursor': flux_changements.curseur_courant(), 'has_more': False})
+    if depuis < flux_changements.curseur_minimal():
+        # Entrées purgées depuis ce curseur : le client doit refaire une copie complète
+        return jsonify({'erreur': 'Curseur expiré, resynchronisation complète requise',
+                        'cursor': flux_changements.curseur_courant()}), 410
+
+    limite = min(max(request.args.get('limit', config['CHANGES_LIMITE_DEFAUT'], type=int), 1),
+                 config['CHANGES_LIMITE_MAX'])
+    attente = min(max(request.args.get('wait', 0, type=float), 0), config['CHANGES_ATTENTE_MAX'])
+    echeance = time.monotonic() + attente
+
+    generation = flux_changements.generation
+    changements, curseur, reste = flux_changements.lire(depuis, tables, limite)
+    while not changements and time.monotonic() < echeance:
+        # Connexion rendue au pool pendant l'attente, nouvelle transaction pour voir les commits
+        db.session.rollback()
+        flux_changements.attendre(generation, min(echeance - time.monotonic(), config['CHANGES_INTERVALLE_SONDAGE']))
+        generation = flux_changements.generation
+        changements, curseur, reste = flux_changements.lire(depuis, tables, limite)
+
+    return jsonify({'changes': changements, 'cursor': curseur, 'has_more': reste})
@@ -1,42 +1,137 @@
-from flask import Blueprint, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from sqlalchemy.exc import IntegrityError
 from src.models.lead import Lead, db
+from src.routes.lead import CHAMPS_SCORE_LEAD, calculate_lead_score
+from src.services import transcripts
+from src.services.chat_sessions import session_store
+from src.services.intent_matcher import MatcheurIntentions
 from datetime import datetime
 import json
 import random
+import re
+import threading
+import uuid
 
 chatbot_bp = Blueprint('chatbot', __name__)
 
+# Mots-clés pour chaque intention
+INTENTIONS_MOTS_CLES = {
+    'salutation': ['bonjour', 'salut', 'hello', 'bonsoir', 'hey'],
+    'recherche_achat': ['acheter', 'achat', 'acquérir', 'cherche à acheter', 'veux acheter'],
+    'recherche_vente': ['vendre', 'vente', 'céder', 'veux vendre', 'mettre en vente'],
+    'information_budget': ['budget', 'prix', 'coût', 'payer', 'financement', 'euros', '€'],
+    'information_localisation': ['toulouse', 'quartier', 'secteur', 'zone', 'ville', 'région'],
+    'information_contact': ['email', 'téléphone', 'contact', 'joindre', '@', 'appeler'],
+    'question_marche': ['marché', 'tendance', 'évolution', 'prix', 'immobilier'],
+    'demande_rdv': ['rendez-vous', 'rencontrer', 'rdv', 'voir', 'visiter'],
+    'au_revoir': ['au revoir', 'bye', 'à bientôt', 'merci', 'stop']
+}
+
+# Automate compilé une seule fois au chargement du module
+_matcheur_intentions = MatcheurIntentions(INTENTIONS_MOTS_CLES)
+
+# Extracteurs d'entités, compilés une seule fois
+REGEX_BUDGET = re.compile(r'(\d+(?:\s*\d+)*)\s*(?:euros?|€)')
+REGEX_EMAIL = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+REGEX_TELEPHONE = re.compile(r'(?:\+33|0)[1-9](?:[0-9]{8})')
+
+# Clés du contexte renseignées par mettre_a_jour_contexte : seules acceptées du client, avec leur type
+CLES_CONTEXTE = {
+    'type_projet': str,
+    'budget': str,
+    'localisation': str,
+    'localisation_precise': bool,
+    'email': str,
+    'telephone': str,
+}
+LONGUEUR_MAX_CONTEXTE = 120  # caractères par valeur texte
+
+_verrou_executeur = threading.Lock()
+
 @chatbot_bp.route('/chatbot/conversation', methods=['POST'])
 def handle_conversation():
     """Gérer une conversation avec le chatbot de pré-qualification"""
     data = request.json
-    message_utilisateur = data.get('message', '').lower()
-    session_id = data.get('session_id')
-    contexte = data.get('contexte', {})
-    
-    # Analyser l'intention du message
-    intention = analyser_intention(message_utilisateur)
+    tour = preparer_tour(data)
     
-    # Générer la réponse appropriée
-    reponse = generer_reponse_chatbot(intention, message_utilisateur, contexte)
-    
-    # Mettre à jour le contexte de la conversation
-    nouveau_contexte = mettre_a_jour_contexte(contexte, intention, message_utilisateur)
-    
-    # Vérifier si on peut créer un lead
+    # Créer le lead de la session, ou le mettre à jour si les informations ont changé
     lead_cree = None
-    if peut_creer_lead(nouveau_contexte):
-        lead_cree = creer_lead_depuis_contexte(nouveau_contexte)
+    if tour['lead_a_ecrire']:
+        lead_cree = creer_lead_depuis_contexte(tour['contexte'], tour['session_id'])
+        tour['session'].lead_id = lead_cree.id
+    
+    session_store.enregistrer_tour(tour['session'], tour['contexte'], data.get('message', ''),
+                                   tour['intention'], tour['reponse'])
     
     return jsonify({
-        'reponse': reponse,
-        'intention': intention,
-        'contexte': nouveau_contexte,
+        'session_id': tour['session_id'],
+        'reponse': tour['reponse'],
+        'intention': tour['intention'],
+        'intentions': tour['intentions'],
+        'contexte': tour['contexte'],
         'lead_cree': lead_cree.to_dict() if lead_cree else None,
-        'suggestions': generer_suggestions_reponse(intention),
-        'prochaine_question': generer_prochaine_question(nouveau_contexte)
+        'lead_id': tour['session'].lead_id,
+        'suggestions': generer_suggestions_reponse(tour['intention']),
+        'prochaine_question': generer_prochaine_question(tour['contexte'])
     })
 
+@chatbot_bp.route('/chatbot/conversation/stream', methods=['POST'])
+def handle_conversation_stream():
+    """Variante SSE : la réponse est envoyée tout de suite, le résultat du lead ensuite"""
+    data = request.json
+    tour = preparer_tour(data)
+    session = tour['session']
+    
+    # Le contexte est enregistré immédiatement : le message suivant le voit même si le lead est en cours d'écriture
+    session_store.enregistrer_tour(session, tour['contexte'], data.get('message', ''),
+                                   tour['intention'], tour['reponse'])
+    
+    # L'écriture du lead part en arrière-plan avant même l'envoi de la réponse
+    ecriture_lead = None
+    if tour['lead_a_ecrire']:
+        app = current_app._get_current_object()
+        ecriture_lead = executeur_effets(app).submit(ecrire_lead_session, app, session, tour['contexte'])
+    
+    def generer():
+        yield evenement_sse('reponse', {
+            'session_id': tour['session_id'],
+            'reponse': tour['reponse'],
+            'intention': tour['intention'],
+            'intentions': tour['intentions'],
+            'contexte': tour['contexte'],
+            'suggestions': generer_suggestions_reponse(tour['intention']),
+            'prochaine_question': generer_prochaine_question(tour['contexte'])
+        })
+        
+        if ecriture_lead is not None:
+            try:
+                lead = ecriture_lead.result(timeout=current_app.config.get('CHATBOT_LEAD_TIMEOUT', 10))
+                yield evenement_sse('lead', {'lead_cree': lead, 'lead_id': session.lead_id})
+            except Exception as erreur:
+                current_app.logger.exception("Échec de l'écriture du lead de la session %s", tour['session_id'])
+                yield evenement_sse('erreur', {'erreur': str(erreur) or erreur.__class__.__name__})
+        
+        yield evenement_sse('fin', {'session_id': tour['session_id'], 'lead_id': session.lead_id})
+    
+    reponse = Response(stream_with_context(generer()), mimetype='text/event-stream')
+    reponse.headers['Cache-Control'] = 'no-cache'
+    reponse.headers['X-Accel-Buffering'] = 'no'  # pas de mise en tampon par un proxy nginx
+    return reponse
+
+@chatbot_bp.route('/chatbot/batch-analyse', methods=['POST'])
+def batch_analyse():
+    """Analyser en lot des transcriptions archivées (JSONL en entrée, NDJSON en sortie)"""
+    workers = request.args.get('workers', type=int)
+    ecrire_leads = request.args.get('upsert_leads') in ('1', 'true')
+    
+    def generer():
+        resultats = transcripts.analyser_et_ecrire(request.stream, workers=workers, ecrire_leads=ecrire_leads)
+        for resultat in resultats:
+            yield json.dumps(resultat, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generer()), mimetype='application/x-ndjson')
+
 @chatbot_bp.route('/chatbot/intentions', methods=['GET'])
 def get_available_intentions():
     """Récupérer la liste des intentions disponibles"""
@@ -88,50 +183,88 @@ def get_available_intentions():
 @chatbot_bp.route('/chatbot/conversations', methods=['GET'])
 def get_conversations():
     """Récupérer l'historique des conversations"""
-    # Dans une vraie implémentation, on stockerait les conversations en base
-    # Ici on retourne des données simulées
-    conversations = [
-        {
-            'session_id': 'session_123',
-            'date_debut': datetime.now().isoformat(),
-            'messages': 5,
-            'lead_genere': True,
-            'statut': 'qualifie'
-        },
-        {
-            'session_id': 'session_124',
-            'date_debut': datetime.now().isoformat(),
-            'messages': 3,
-            'lead_genere': False,
-            'statut': 'en_cours'
-        }
-    ]
+    page = max(request.args.get('page', 1, type=int), 1)
+    par_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
     
-    return jsonify(conversations)
+    sessions, total = session_store.lister(page, par_page)
+    
+    reponse = jsonify([session.to_dict() for session in sessions])
+    reponse.headers['X-Total-Count'] = str(total)
+    return reponse
 
-def analyser_intention(message):
-    """Analyser l'intention d'un message utilisateur (simulation d'IA)"""
-    message = message.lower()
-    
-    # Mots-clés pour chaque intention
-    intentions_mots_cles = {
-        'salutation': ['bonjour', 'salut', 'hello', 'bonsoir', 'hey'],
-        'recherche_achat': ['acheter', 'achat', 'acquérir', 'cherche à acheter', 'veux acheter'],
-        'recherche_vente': ['vendre', 'vente', 'céder', 'veux vendre', 'mettre en vente'],
-        'information_budget': ['budget', 'prix', 'coût', 'payer', 'financement', 'euros', '€'],
-        'information_localisation': ['toulouse', 'quartier', 'secteur', 'zone', 'ville', 'région'],
-        'information_contact': ['email', 'téléphone', 'contact', 'joindre', '@', 'appeler'],
-        'question_marche': ['marché', 'tendance', 'évolution', 'prix', 'immobilier'],
-        'demande_rdv': ['rendez-vous', 'rencontrer', 'rdv', 'voir', 'visiter'],
-        'au_revoir': ['au revoir', 'bye', 'à bientôt', 'merci', 'stop']
-    }
+@chatbot_bp.route('/chatbot/conversations/<session_id>', methods=['GET'])
+def get_conversation(session_id):
+    """Récupérer une conversation et ses messages"""
+    trouvee = session_store.conversation(session_id)
+    if trouvee is None:
+        abort(404)
+    session, tours = trouvee
+    
+    conversation = session.to_dict()
+    conversation['tours'] = [tour.to_dict() for tour in tours]
+    return jsonify(conversation)
+
+def preparer_tour(data):
+    """Calculer la réponse d'un tour de conversation, sans écriture en base"""
+    message_utilisateur = data.get('message', '').lower()
+    session_id = data.get('session_id') or uuid.uuid4().hex
+    
+    # Le contexte est conservé côté serveur ; celui envoyé par le client ne sert qu'à amorcer une nouvelle session
+    session = session_store.obtenir(session_id)
+    contexte = dict(session.contexte) if session.nb_messages else contexte_client(data.get('contexte'))
     
-    # Analyser le message
-    for intention, mots_cles in intentions_mots_cles.items():
-        if any(mot in message for mot in mots_cles):
-            return intention
+    # Analyser les intentions du message
+    intentions = classer_intentions(message_utilisateur)
+    intention = intentions[0]['intention'] if intentions else 'autre'
     
-    return 'autre'
+    # Générer la réponse appropriée
+    reponse = generer_reponse_chatbot(intention, message_utilisateur, contexte)
+    
+    # Mettre à jour le contexte de la conversation
+    nouveau_contexte = mettre_a_jour_contexte(contexte, intention, message_utilisateur)
+    
+    return {
+        'session_id': session_id,
+        'session': session,
+        'intention': intention,
+        'intentions': intentions,
+        'reponse': reponse,
+        'contexte': nouveau_contexte,
+        'lead_a_ecrire': peut_creer_lead(nouveau_contexte) and (
+            session.lead_id is None
+            or champs_lead_depuis_contexte(nouveau_contexte) != champs_lead_depuis_contexte(contexte))
+    }
+
+def executeur_effets(app):
+    """Pool de threads des écritures différées du chatbot, créé à la première utilisation"""
+    executeur = app.extensions.get('chatbot_effets')
+    if executeur is None:
+        with _verrou_executeur:
+            executeur = app.extensions.get('chatbot_effets')
+            if executeur is None:
+                executeur = ThreadPoolExecutor(max_workers=app.config.get('CHATBOT_EFFETS_WORKERS', 4),
+                                               thread_name_prefix='chatbot-effets')
+                app.extensions['chatbot_effets'] = executeur
+    return executeur
+
+def ecrire_lead_session(app, session, contexte):
+    """Créer ou mettre à jour le lead d'une session (exécuté hors du chemin de la réponse)"""
+    with app.app_context():
+        lead = creer_lead_depuis_contexte(contexte, session.session_id)
+        session_store.associer_lead(session, lead.id)
+        return lead.to_dict()
+
+def evenement_sse(nom, donnees):
+    """Formater un évènement Server-Sent Events"""
+    return f"event: {nom}\ndata: {json.dumps(donnees, ensure_ascii=False)}\n\n"
+
+def analyser_intention(message):
+    """Analyser l'intention d'un message utilisateur (simulation d'IA)"""
+    return _matcheur_intentions.meilleure(message)
+
+def classer_intentions(message):
+    """Toutes les intentions détectées dans un message, avec leur score"""
+    return _matcheur_intentions.classer(message)
 
 def generer_reponse_chatbot(intention, message, contexte):
     """Générer une réponse appropriée selon l'intention (simulation d'IA)"""
@@ -190,6 +323,24 @@ def generer_reponse_chatbot(intention, message, contexte):
     
     return random.choice(reponses.get(intention, reponses['autre']))
 
+def contexte_client(contexte):
+    """Contexte initial fourni par le client, réduit aux clés connues et à des valeurs courtes"""
+    if not isinstance(contexte, dict):
+        return {}
+    retenu = {}
+    for cle, type_valeur in CLES_CONTEXTE.items():
+        valeur = contexte.get(cle)
+        if type(valeur) is not type_valeur:
+            continue
+        if type_valeur is str:
+            valeur = valeur.strip()
+            if not valeur or len(valeur) > LONGUEUR_MAX_CONTEXTE:
+                continue
+            if cle == 'budget' and not valeur.isdigit():
+                continue  # converti en nombre pour le lead
+        retenu[cle] = valeur
+    return retenu
+
 def mettre_a_jour_contexte(contexte, intention, message):
     """Mettre à jour le contexte de la conversation"""
     nouveau_contexte = contexte.copy()
@@ -201,8 +352,7 @@ def mettre_a_jour_contexte(contexte, intention, message):
         nouveau_contexte['type_projet'] = 'vente'
     elif intention == 'information_budget':
         # Extraire le budget du message (simulation)
-        import re
-        budget_match = re.search(r'(\d+(?:\s*\d+)*)\s*(?:euros?|€)', message)
+        budget_match = REGEX_BUDGET.search(message)
         if budget_match:
             nouveau_contexte['budget'] = budget_match.group(1).replace(' ', '')
     elif intention == 'information_localisation':
@@ -213,12 +363,11 @@ def mettre_a_jour_contexte(contexte, intention, message):
             nouveau_contexte['localisation_precise'] = True
     elif intention == 'information_contact':
         # Extraire email/téléphone (simulation)
-        import re
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', message)
+        email_match = REGEX_EMAIL.search(message)
         if email_match:
             nouveau_contexte['email'] = email_match.group()
         
-        phone_match = re.search(r'(?:\+33|0)[1-9](?:[0-9]{8})', message.replace(' ', ''))
+        phone_match = REGEX_TELEPHONE.search(message.replace(' ', ''))
         if phone_match:
             nouveau_contexte['telephone'] = phone_match.group()
     
@@ -242,31 +391,53 @@ def peut_creer_lead(contexte):
     
     return True
 
-def creer_lead_depuis_contexte(contexte):
-    """Créer un lead à partir du contexte de conversation"""
+def champs_lead_depuis_contexte(contexte):
+    """Valeurs des champs du lead déduites du contexte de conversation"""
+    informations = {cle: contexte[cle] for cle in ('type_projet', 'budget', 'localisation', 'email', 'telephone')
+                    if cle in contexte}
+    return {
+        'first_name': 'Prospect',  # À améliorer avec extraction du nom
+        'last_name': 'Chatbot',
+        'email': contexte.get('email', 'prospect@example.com'),
+        'phone': contexte.get('telephone'),
+        'lead_type': 'buyer' if contexte.get('type_projet') == 'achat' else 'seller',
+        'budget_min': float(contexte.get('budget', 0)) * 0.8 if contexte.get('budget') else None,
+        'budget_max': float(contexte.get('budget', 0)) * 1.2 if contexte.get('budget') else None,
+        'location_interest': contexte.get('localisation'),
+        'source': 'chatbot',
+        'notes': f"Lead généré par chatbot. Contexte: {json.dumps(informations, ensure_ascii=False, sort_keys=True)}"
+    }
+
+def creer_lead_depuis_contexte(contexte, session_id=None):
+    """Créer ou mettre à jour le lead d'une conversation (un seul lead par session)"""
     if not peut_creer_lead(contexte):
         return None
     
-    lead = Lead(
-        first_name='Prospect',  # À améliorer avec extraction du nom
-        last_name='Chatbot',
-        email=contexte.get('email', 'prospect@example.com'),
-        phone=contexte.get('telephone'),
-        lead_type='buyer' if contexte.get('type_projet') == 'achat' else 'seller',
-        budget_min=float(contexte.get('budget', 0)) * 0.8 if contexte.get('budget') else None,
-        budget_max=float(contexte.get('budget', 0)) * 1.2 if contexte.get('budget') else None,
-        location_interest=contexte.get('localisation'),
-        source='chatbot',
-        notes=f"Lead généré par chatbot. Contexte: {json.dumps(contexte, ensure_ascii=False)}"
-    )
-    
-    # Calculer le score
-    from src.routes.lead import calculate_lead_score
-    lead.score = calculate_lead_score(lead)
-    
-    db.session.add(lead)
-    db.session.commit()
+    champs = champs_lead_depuis_contexte(contexte)
+    lead = Lead.query.filter_by(session_id=session_id).first() if session_id else None
+    
+    if lead is None:
+        lead = Lead(session_id=session_id, **champs)
+        lead.score = calculate_lead_score(lead)
+        db.session.add(lead)
+        try:
+            db.session.commit()
+            return lead
+        except IntegrityError:
+            # Création concurrente pour la même session : on met à jour le lead existant
+            db.session.rollback()
+            lead = Lead.query.filter_by(session_id=session_id).one()
     
+    # Mise à jour en place, uniquement des champs réellement modifiés
+    modifies = [champ for champ, valeur in champs.items() if getattr(lead, champ) != valeur]
+    if not modifies:
+        return lead
+    for champ in modifies:
+        setattr(lead, champ, champs[champ])
+    if any(champ in CHAMPS_SCORE_LEAD for champ in modifies):
+        lead.score = calculate_lead_score(lead)
+    
+    db.session.commit()
     return lead
 
 def generer_suggestions_reponse(intention):
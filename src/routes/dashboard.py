@@ -0,0 +1,13 @@
+from flask import Blueprint, jsonify, request
+from src.services.dashboard import tableau_de_bord
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+@dashboard_bp.route('/dashboard', methods=['GET'])
+def get_dashboard():
+    """Tableau de bord d'accueil en une requête : leads, propriétés, quartiers, cartographie et rapports"""
+    user_id = request.args.get('user_id', type=int)
+    score_min = request.args.get('score_min', type=float)
+    city = request.args.get('city')
+    limite_rapports = min(max(request.args.get('reports_limit', 20, type=int), 0), 200)
+    return jsonify(tableau_de_bord(user_id, score_min, city, limite_rapports))
@@ -1,5 +1,8 @@
 from flask import Blueprint, jsonify, request
+from sqlalchemy import bindparam, select, update
 from src.models.lead import Lead, db
+from src.services.bulk_updates import EcritureMasse, ModificationConcurrente, TAILLE_LOT_IDS
+from src.services.dashboard import statistiques_leads
 from datetime import datetime
 import random
 
@@ -51,6 +54,26 @@ def create_lead():
     db.session.commit()
     return jsonify(lead.to_dict()), 201
 
+@lead_bp.route('/leads', methods=['PATCH'])
+def bulk_update_leads():
+    """Mettre à jour des leads en masse : liste [{id, version?, champs...}] ou {filter, set}"""
+    try:
+        return jsonify(ecriture_leads.patch(request.json))
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    except ModificationConcurrente:
+        return jsonify({'erreur': 'Leads modifiés pendant la mise à jour, réessayer'}), 409
+
+@lead_bp.route('/leads', methods=['DELETE'])
+def bulk_delete_leads():
+    """Supprimer des leads en masse : liste d'ids ou de {id, version}, ou {filter}"""
+    try:
+        return jsonify(ecriture_leads.suppression(request.json))
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    except ModificationConcurrente:
+        return jsonify({'erreur': 'Leads modifiés pendant la suppression, réessayer'}), 409
+
 @lead_bp.route('/leads/<int:lead_id>', methods=['GET'])
 def get_lead(lead_id):
     """Récupérer un lead par son ID"""
@@ -77,7 +100,7 @@ def update_lead(lead_id):
     lead.notes = data.get('notes', lead.notes)
     
     # Recalcul du score si nécessaire
-    if any(key in data for key in ['budget_min', 'budget_max', 'lead_type', 'source']):
+    if any(key in data for key in CHAMPS_SCORE_LEAD):
         lead.score = calculate_lead_score(lead)
     
     db.session.commit()
@@ -102,46 +125,10 @@ def recalculate_lead_score(lead_id):
 @lead_bp.route('/leads/stats', methods=['GET'])
 def get_lead_stats():
     """Obtenir des statistiques sur les leads"""
-    leads = Lead.query.all()
-    
-    if not leads:
-        return jsonify({
-            'total_leads': 0,
-            'by_status': {},
-            'by_type': {},
-            'average_score': 0,
-            'high_score_leads': 0
-        })
-    
-    total_leads = len(leads)
-    
-    # Statistiques par statut
-    by_status = {}
-    for lead in leads:
-        by_status[lead.status] = by_status.get(lead.status, 0) + 1
-    
-    # Statistiques par type
-    by_type = {}
-    for lead in leads:
-        by_type[lead.lead_type] = by_type.get(lead.lead_type, 0) + 1
-    
-    # Score moyen
-    scores = [lead.score for lead in leads if lead.score]
-    average_score = sum(scores) / len(scores) if scores else 0
-    
-    # Leads avec score élevé (> 7)
-    high_score_leads = len([lead for lead in leads if lead.score > 7])
-    
-    return jsonify({
-        'total_leads': total_leads,
-        'by_status': by_status,
-        'by_type': by_type,
-        'average_score': round(average_score, 2),
-        'high_score_leads': high_score_leads
-    })
+    return jsonify(statistiques_leads())
 
-def calculate_lead_score(lead):
-    """Calculer le score d'un lead (simulation d'IA)"""
+def calculate_lead_score(lead, alea=random):
+    """Calculer le score d'un lead (simulation d'IA) ; `alea` fournit la part aléatoire"""
     score = 5.0  # Score de base
     
     # Facteurs positifs
@@ -157,8 +144,32 @@ def calculate_lead_score(lead):
         score += 0.5
     
     # Ajout d'un facteur aléatoire pour simuler l'IA
-    score += random.uniform(-0.5, 1.5)
+    score += alea.uniform(-0.5, 1.5)
     
     # Limiter le score entre 0 et 10
     return max(0, min(10, round(score, 1)))
 
+# Champs du lead qui entrent dans le calcul du score
+CHAMPS_SCORE_LEAD = ('budget_min', 'budget_max', 'phone', 'lead_type', 'source')
+
+def recalculer_scores(ids):
+    """Recalculer le score de leads existants, dans la transaction en cours (mises à jour en masse)"""
+    table = Lead.__table__
+    colonnes = [table.c.id] + [table.c[champ] for champ in CHAMPS_SCORE_LEAD]
+    scores = []
+    for debut in range(0, len(ids), TAILLE_LOT_IDS):
+        for ligne in db.session.execute(select(*colonnes).where(table.c.id.in_(ids[debut:debut + TAILLE_LOT_IDS]))):
+            scores.append({'b_id': ligne.id, 'v_score': calculate_lead_score(ligne)})
+    if scores:
+        # version = version : le recalcul fait partie de la même écriture, sans nouvel incrément
+        db.session.connection().execute(update(table).where(table.c.id == bindparam('b_id'))
+                                        .values(score=bindparam('v_score'), version=table.c.version), scores)
+
+ecriture_leads = EcritureMasse(
+    Lead,
+    champs=('first_name', 'last_name', 'email', 'phone', 'lead_type', 'budget_min', 'budget_max',
+            'property_type_interest', 'location_interest', 'status', 'source', 'notes', 'last_contact_date'),
+    filtrables=('score',),
+    champs_surveilles=CHAMPS_SCORE_LEAD,
+    recalcul=recalculer_scores
+)
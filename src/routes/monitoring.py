@@ -0,0 +1,19 @@
+from flask import Blueprint, Response, abort, current_app, jsonify, request
+from src.services.metrics import metriques
+from src.services.slow_queries import profileur_requetes
+
+monitoring_bp = Blueprint('monitoring', __name__)
+
+@monitoring_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Exposer les métriques HTTP et SQL au format texte Prometheus"""
+    return Response(metriques.exposition(), mimetype='text/plain; version=0.0.4')
+
+@monitoring_bp.route('/debug/slow-queries', methods=['GET'])
+def get_slow_queries():
+    """Dernières requêtes SQL lentes avec leur plan d'exécution"""
+    if not current_app.config['SLOW_QUERY_ENDPOINT']:
+        abort(404)
+    limite = min(max(request.args.get('limit', 50, type=int), 1), 1000)
+    parcours_seulement = request.args.get('scans') in ('1', 'true')
+    return jsonify(profileur_requetes.entrees(limite, parcours_seulement))
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
 from src.models.neighborhood import Neighborhood, db
+from src.services.single_flight import coalescence
 import random
 
 neighborhood_bp = Blueprint('neighborhood', __name__)
@@ -97,9 +98,12 @@ def analyze_neighborhood():
         return jsonify({'erreur': 'ID du quartier requis'}), 400
     
     quartier = Neighborhood.query.get_or_404(quartier_id)
-    
-    # Simulation d'analyse IA avancée
-    analyse = {
+    # Analyse partagée par les demandes simultanées du même quartier
+    return jsonify(coalescence.executer('analyse_quartier', quartier.id, lambda: analyser_quartier(quartier)))
+
+def analyser_quartier(quartier):
+    """Analyse prédictive d'un quartier (simulation d'IA avancée)"""
+    return {
         'quartier': quartier.to_dict(),
         'predictions': {
             'taux_rotation_prevu': round(quartier.rotation_rate_score * 1.2, 2),
@@ -109,32 +113,30 @@ def analyze_neighborhood():
         },
         'confiance': random.uniform(0.75, 0.95)
     }
-    
-    return jsonify(analyse)
 
 @neighborhood_bp.route('/quartiers/cartographie', methods=['GET'])
 def get_neighborhood_map_data():
     """Obtenir les données pour la cartographie interactive"""
     quartiers = Neighborhood.query.all()
     
-    map_data = []
-    for quartier in quartiers:
-        if quartier.latitude and quartier.longitude:
-            map_data.append({
-                'id': quartier.id,
-                'nom': quartier.name,
-                'ville': quartier.city,
-                'latitude': quartier.latitude,
-                'longitude': quartier.longitude,
-                'score_potentiel': quartier.potential_score,
-                'score_rotation': quartier.rotation_rate_score,
-                'indicateur_demande': quartier.demand_indicator,
-                'prix_m2_moyen': quartier.average_price_m2,
-                'couleur': get_score_color(quartier.potential_score)
-            })
-    
+    map_data = [point_cartographie(quartier) for quartier in quartiers if quartier.latitude and quartier.longitude]
     return jsonify(map_data)
 
+def point_cartographie(quartier):
+    """Point de la cartographie interactive pour un quartier"""
+    return {
+        'id': quartier.id,
+        'nom': quartier.name,
+        'ville': quartier.city,
+        'latitude': quartier.latitude,
+        'longitude': quartier.longitude,
+        'score_potentiel': quartier.potential_score,
+        'score_rotation': quartier.rotation_rate_score,
+        'indicateur_demande': quartier.demand_indicator,
+        'prix_m2_moyen': quartier.average_price_m2,
+        'couleur': get_score_color(quartier.potential_score)
+    }
+
 def calculate_rotation_rate_score(quartier):
     """Calculer le score de taux de rotation (simulation d'IA)"""
     score = 5.0
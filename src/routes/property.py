@@ -1,31 +1,75 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, abort, current_app, jsonify, request
+from sqlalchemy import select
 from src.models.property import Property, db
+from src.services.avm import ModeleIndisponible, moteur_avm
+from src.services.bulk_updates import EcritureMasse, ModificationConcurrente
+from src.services.comps import completer, moteur_comparables, synthese
+from src.services.dashboard import statistiques_proprietes
+from src.services import property_analytics
+from src.services.partitions import partitions_ventes
+from src.services.property_snapshot import instantane_proprietes
+from src.services.single_flight import coalescence
 from datetime import datetime
+import math
+import numpy as np
 
 property_bp = Blueprint('property', __name__)
 
+SURFACE_MAX = 100000  # m² : au-delà, les distances des comparables débordent (NaN)
+
+@property_bp.record_once
+def initialiser_instantane(etat):
+    # Enregistré avec le blueprint : numpy n'est importé que par les processus qui servent /properties
+    instantane_proprietes.init_app(etat.app)
+    moteur_comparables.init_app(etat.app)
+    moteur_avm.init_app(etat.app)
+
 @property_bp.route('/properties', methods=['GET'])
 def get_properties():
-    """Récupérer toutes les propriétés avec filtres optionnels"""
+    """Récupérer toutes les propriétés avec filtres optionnels.
+
+    Seules les ventes récentes (table chaude) sont lues, sauf si `min_sale_date` /
+    `max_sale_date` remontent avant la fenêtre chaude ou si `history=1` est passé.
+    """
     city = request.args.get('city')
     property_type = request.args.get('property_type')
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
-    
-    query = Property.query
-    
+    try:
+        min_sale_date, max_sale_date = dates_vente(request.args)
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    historique = request.args.get('history') in ('1', 'true')
+
+    biens = partitions_ventes.source(min_sale_date, max_sale_date, historique)
+    clauses = []
     if city:
-        query = query.filter(Property.city.ilike(f'%{city}%'))
+        clauses.append(biens.c.city.ilike(f'%{city}%'))
     if property_type:
-        query = query.filter(Property.property_type == property_type)
+        clauses.append(biens.c.property_type == property_type)
     if min_price:
-        query = query.filter(Property.price >= min_price)
+        clauses.append(biens.c.price >= min_price)
     if max_price:
-        query = query.filter(Property.price <= max_price)
-    
-    properties = query.all()
+        clauses.append(biens.c.price <= max_price)
+    if min_sale_date:
+        clauses.append(biens.c.sale_date >= min_sale_date)
+    if max_sale_date:
+        clauses.append(biens.c.sale_date <= max_sale_date)
+
+    properties = db.session.execute(select(Property).from_statement(select(*biens.c).where(*clauses))).scalars()
     return jsonify([prop.to_dict() for prop in properties])
 
+def dates_vente(arguments):
+    """Bornes `min_sale_date` / `max_sale_date` (ISO, facultatives) ; ValueError si invalides"""
+    bornes = []
+    for nom in ('min_sale_date', 'max_sale_date'):
+        valeur = arguments.get(nom)
+        try:
+            bornes.append(datetime.fromisoformat(valeur).date() if valeur else None)
+        except ValueError:
+            raise ValueError(f'{nom} invalide (AAAA-MM-JJ attendu)')
+    return bornes
+
 @property_bp.route('/properties', methods=['POST'])
 def create_property():
     """Créer une nouvelle propriété"""
@@ -53,16 +97,40 @@ def create_property():
     db.session.commit()
     return jsonify(property_obj.to_dict()), 201
 
+@property_bp.route('/properties', methods=['PATCH'])
+def bulk_update_properties():
+    """Mettre à jour des propriétés en masse : liste [{id, version?, champs...}] ou {filter, set}"""
+    try:
+        return jsonify(ecriture_proprietes.patch(request.json))
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    except ModificationConcurrente:
+        return jsonify({'erreur': 'Propriétés modifiées pendant la mise à jour, réessayer'}), 409
+
+@property_bp.route('/properties', methods=['DELETE'])
+def bulk_delete_properties():
+    """Supprimer des propriétés en masse : liste d'ids ou de {id, version}, ou {filter}"""
+    try:
+        return jsonify(ecriture_proprietes.suppression(request.json))
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    except ModificationConcurrente:
+        return jsonify({'erreur': 'Propriétés modifiées pendant la suppression, réessayer'}), 409
+
 @property_bp.route('/properties/<int:property_id>', methods=['GET'])
 def get_property(property_id):
-    """Récupérer une propriété par son ID"""
-    property_obj = Property.query.get_or_404(property_id)
+    """Récupérer une propriété par son ID, archives comprises"""
+    property_obj = partitions_ventes.trouver(property_id)
+    if property_obj is None:
+        abort(404)
     return jsonify(property_obj.to_dict())
 
 @property_bp.route('/properties/<int:property_id>', methods=['PUT'])
 def update_property(property_id):
-    """Mettre à jour une propriété"""
-    property_obj = Property.query.get_or_404(property_id)
+    """Mettre à jour une propriété, archivée ou non"""
+    property_obj = partitions_ventes.modifiable(property_id)
+    if property_obj is None:
+        abort(404)
     data = request.json
     
     property_obj.address = data.get('address', property_obj.address)
@@ -78,52 +146,214 @@ def update_property(property_id):
     if data.get('sale_date'):
         property_obj.sale_date = datetime.fromisoformat(data['sale_date']).date()
     
+    db.session.flush()
+    resultat = property_obj.to_dict()  # lu avant que ranger() ne renvoie la ligne aux archives
+    partitions_ventes.ranger([property_id])
     db.session.commit()
-    return jsonify(property_obj.to_dict())
+    return jsonify(resultat)
 
 @property_bp.route('/properties/<int:property_id>', methods=['DELETE'])
 def delete_property(property_id):
-    """Supprimer une propriété"""
-    property_obj = Property.query.get_or_404(property_id)
+    """Supprimer une propriété, archivée ou non"""
+    property_obj = partitions_ventes.modifiable(property_id)
+    if property_obj is None:
+        abort(404)
     db.session.delete(property_obj)
     db.session.commit()
     return '', 204
 
 @property_bp.route('/properties/stats', methods=['GET'])
 def get_property_stats():
-    """Obtenir des statistiques sur les propriétés"""
+    """Obtenir des statistiques sur les propriétés (mêmes règles d'archives que GET /properties)"""
+    try:
+        min_sale_date, max_sale_date = dates_vente(request.args)
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
     city = request.args.get('city')
-    
-    query = Property.query
-    if city:
-        query = query.filter(Property.city.ilike(f'%{city}%'))
-    
-    properties = query.all()
-    
-    if not properties:
-        return jsonify({
-            'total_properties': 0,
-            'average_price': 0,
-            'average_price_m2': 0,
-            'property_types': {}
-        })
-    
-    total_properties = len(properties)
-    prices = [p.price for p in properties if p.price]
-    surfaces = [p.surface for p in properties if p.surface]
-    
-    average_price = sum(prices) / len(prices) if prices else 0
-    average_price_m2 = sum([p.price / p.surface for p in properties if p.price and p.surface]) / len([p for p in properties if p.price and p.surface]) if any(p.price and p.surface for p in properties) else 0
-    
-    # Comptage des types de propriétés
-    property_types = {}
-    for prop in properties:
-        property_types[prop.property_type] = property_types.get(prop.property_type, 0) + 1
-    
-    return jsonify({
-        'total_properties': total_properties,
-        'average_price': round(average_price, 2),
-        'average_price_m2': round(average_price_m2, 2),
-        'property_types': property_types
-    })
+    historique = request.args.get('history') in ('1', 'true')
+    # Vue partagée dans l'équipe : les ouvertures simultanées attendent un seul calcul
+    return jsonify(coalescence.executer(
+        'statistiques_proprietes', [city, min_sale_date, max_sale_date, historique],
+        lambda: statistiques_proprietes(city, min_sale_date, max_sale_date, historique)))
+
+def filtres_analytiques():
+    """Instantané à jour et lignes retenues par les filtres de la requête (ValueError si invalides)"""
+    min_sale_date, max_sale_date = dates_vente(request.args)
+    colonnes = instantane_proprietes.colonnes()
+    retenues = property_analytics.masque(colonnes, request.args.get('city'), request.args.get('property_type'),
+                                         min_sale_date, max_sale_date, request.args.get('history') in ('1', 'true'))
+    return colonnes, retenues
+
+@property_bp.route('/properties/analytics', methods=['GET'])
+def get_property_analytics():
+    """Statistiques de prix calculées sur l'instantané en colonnes, éventuellement groupées"""
+    group_by = request.args.get('group_by')
+    if group_by and group_by not in property_analytics.GROUPEMENTS:
+        return jsonify({'erreur': f"group_by doit être parmi : {', '.join(property_analytics.GROUPEMENTS)}"}), 400
+    try:
+        colonnes, retenues = filtres_analytiques()
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    resultat = property_analytics.statistiques(colonnes, retenues, group_by)
+    resultat['snapshot'] = property_analytics.description(colonnes)
+    return jsonify(resultat)
+
+@property_bp.route('/properties/heatmap', methods=['GET'])
+def get_property_heatmap():
+    """Carte de chaleur des ventes (mailles de `precision` degrés) calculée sur l'instantané"""
+    precision = request.args.get('precision', 0.01, type=float)
+    if not 0.001 <= precision <= 1:
+        return jsonify({'erreur': 'precision doit être comprise entre 0.001 et 1 degré'}), 400
+    try:
+        colonnes, retenues = filtres_analytiques()
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    return jsonify({'precision': precision,
+                    'cells': property_analytics.carte_chaleur(colonnes, retenues, precision),
+                    'snapshot': property_analytics.description(colonnes)})
+
+def parametres_bien(source):
+    """Bien décrit par lat, lon, surface, rooms? et property_type? ; ValueError si invalide"""
+    parametres = {}
+    for nom, cle in (('latitude', 'lat'), ('longitude', 'lon'), ('surface', 'surface')):
+        try:
+            parametres[nom] = float(source[cle])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'{cle} requis (nombre)')
+        if not math.isfinite(parametres[nom]):
+            raise ValueError(f'{cle} doit être un nombre fini')
+    if not (-90 <= parametres['latitude'] <= 90 and -180 <= parametres['longitude'] <= 180):
+        raise ValueError('Coordonnées invalides')
+    if not 0 < parametres['surface'] <= SURFACE_MAX:
+        raise ValueError(f'surface doit être comprise entre 0 et {SURFACE_MAX} m²')
+    try:
+        parametres['rooms'] = int(source['rooms']) if source.get('rooms') not in (None, '') else None
+    except (OverflowError, TypeError, ValueError):
+        raise ValueError('rooms doit être un entier')
+    parametres['property_type'] = texte_facultatif(source, 'property_type')
+    return parametres
+
+def texte_facultatif(source, cle):
+    """Valeur texte facultative (None si absente ou vide) ; ValueError si ce n'est pas un texte"""
+    valeur = source.get(cle)
+    if valeur is not None and not isinstance(valeur, str):
+        raise ValueError(f'{cle} doit être un texte')
+    return valeur or None
+
+def parametres_comps(source):
+    """Bien dont chercher les comparables (parametres_bien et k?) ; ValueError si invalide"""
+    parametres = parametres_bien(source)
+    try:
+        parametres['k'] = int(source.get('k') or 10)
+    except (OverflowError, TypeError, ValueError):
+        raise ValueError('k doit être un entier')
+    k_max = current_app.config['COMPS_K_MAX']
+    if not 1 <= parametres['k'] <= k_max:
+        raise ValueError(f'k doit être compris entre 1 et {k_max}')
+    return parametres
+
+@property_bp.route('/properties/comps', methods=['GET'])
+def get_property_comps():
+    """Ventes comparables les plus semblables à un bien (proximité, surface, pièces, récence)"""
+    try:
+        parametres = parametres_comps(request.args)
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    colonnes = instantane_proprietes.colonnes()
+    comparables = completer(moteur_comparables.chercher(colonnes, **parametres))
+    return jsonify({'comps': comparables, 'summary': synthese(comparables, parametres['surface']),
+                    'snapshot': property_analytics.description(colonnes)})
+
+@property_bp.route('/properties/comps/batch', methods=['POST'])
+def batch_property_comps():
+    """Comparables de plusieurs biens en une requête : {"items": [{"ref", "lat", "lon", "surface", ...}]}"""
+    elements = (request.json or {}).get('items') if isinstance(request.json, dict) else None
+    if not isinstance(elements, list) or not elements:
+        return jsonify({'erreur': 'Liste items requise'}), 400
+    if len(elements) > current_app.config['COMPS_LOT_MAX']:
+        return jsonify({'erreur': f"Au plus {current_app.config['COMPS_LOT_MAX']} biens par requête"}), 400
+
+    colonnes = instantane_proprietes.colonnes()
+    resultats = []
+    for element in elements:
+        if not isinstance(element, dict):
+            resultats.append({'ref': None, 'erreur': 'Objet attendu'})
+            continue
+        try:
+            parametres = parametres_comps(element)
+        except ValueError as erreur:
+            resultats.append({'ref': element.get('ref'), 'erreur': str(erreur)})
+            continue
+        comparables = moteur_comparables.chercher(colonnes, **parametres)
+        resultats.append({'ref': element.get('ref'), 'comps': comparables,
+                          'summary': synthese(comparables, parametres['surface'])})
+    # Adresses de tous les comparables du lot en une seule requête
+    completer([comparable for resultat in resultats for comparable in resultat.get('comps', ())])
+    return jsonify({'results': resultats, 'snapshot': property_analytics.description(colonnes)})
+
+def _estimer(modele, biens):
+    """Estimations d'une liste de biens (parametres_bien et city) en un seul calcul vectorisé"""
+    prix, bas, haut = modele.estimer(
+        np.array([bien['surface'] for bien in biens]),
+        np.array([-1 if bien['rooms'] is None else bien['rooms'] for bien in biens], dtype=np.float64),
+        np.array([bien['latitude'] for bien in biens]), np.array([bien['longitude'] for bien in biens]),
+        [bien['property_type'] for bien in biens], [bien['city'] for bien in biens])
+    return [{'estimated_price': round(valeur, -2), 'price_m2': round(valeur / bien['surface'], 2),
+             'low': round(minimum, -2), 'high': round(maximum, -2)}
+            for bien, valeur, minimum, maximum in zip(biens, prix.tolist(), bas.tolist(), haut.tolist())]
+
+def parametres_estimation(source):
+    """Bien à estimer (parametres_bien et city?) ; ValueError si invalide"""
+    parametres = parametres_bien(source)
+    parametres['city'] = texte_facultatif(source, 'city')
+    return parametres
+
+@property_bp.route('/properties/estimate', methods=['GET'])
+def estimate_property():
+    """Valeur estimée d'un bien par le modèle hédonique, avec un intervalle à 90 %"""
+    try:
+        bien = parametres_estimation(request.args)
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    try:
+        modele = moteur_avm.modele()
+    except ModeleIndisponible as erreur:
+        return jsonify({'erreur': f'Estimation indisponible : {erreur}'}), 503
+    return jsonify(dict(_estimer(modele, [bien])[0], model=modele.description()))
+
+@property_bp.route('/properties/estimate/batch', methods=['POST'])
+def batch_estimate_properties():
+    """Estimations de plusieurs biens en une requête : {"items": [{"ref", "lat", "lon", "surface", ...}]}"""
+    elements = (request.json or {}).get('items') if isinstance(request.json, dict) else None
+    if not isinstance(elements, list) or not elements:
+        return jsonify({'erreur': 'Liste items requise'}), 400
+    if len(elements) > current_app.config['AVM_LOT_MAX']:
+        return jsonify({'erreur': f"Au plus {current_app.config['AVM_LOT_MAX']} biens par requête"}), 400
+    try:
+        modele = moteur_avm.modele()
+    except ModeleIndisponible as erreur:
+        return jsonify({'erreur': f'Estimation indisponible : {erreur}'}), 503
+
+    resultats, valides = [], []
+    for element in elements:
+        if not isinstance(element, dict):
+            resultats.append({'ref': None, 'erreur': 'Objet attendu'})
+            continue
+        try:
+            bien = parametres_estimation(element)
+        except ValueError as erreur:
+            resultats.append({'ref': element.get('ref'), 'erreur': str(erreur)})
+            continue
+        valides.append((len(resultats), bien))
+        resultats.append({'ref': element.get('ref')})
+    if valides:
+        for (position, _), estimation in zip(valides, _estimer(modele, [bien for _, bien in valides])):
+            resultats[position].update(estimation)
+    return jsonify({'results': resultats, 'model': modele.description()})
 
+ecriture_proprietes = EcritureMasse(
+    Property,
+    champs=('address', 'city', 'postal_code', 'property_type', 'surface', 'rooms', 'price', 'sale_date',
+            'latitude', 'longitude'),
+    partitions=partitions_ventes
+)
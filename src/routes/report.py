@@ -1,8 +1,12 @@
-from flask import Blueprint, jsonify, request
-from src.models.report import Report, db
-from src.models.neighborhood import Neighborhood
-from src.models.property import Property
+from flask import Blueprint, Response, current_app, jsonify, redirect, request, send_file, url_for
+from sqlalchemy.orm import undefer_group
+from src.models.report import Report, ReportBatch, db
+from src.services.market_stats import agreger_marche, normaliser_localisation, resume_marche
+from src.services import redaction
+from src.services.report_rendering import FORMATS, chemin_depuis_nom, rendre_artefact
+from src.services.single_flight import coalescence
 import json
+import os
 from datetime import datetime, timedelta
 import random
 
@@ -10,9 +14,12 @@ report_bp = Blueprint('report', __name__)
 
 @report_bp.route('/rapports', methods=['GET'])
 def get_reports():
-    """Récupérer tous les rapports"""
+    """Récupérer tous les rapports (métadonnées seules, contenu sur demande)"""
     user_id = request.args.get('user_id', type=int)
     report_type = request.args.get('type')
+    inclure_contenu = 'content' in request.args.get('include', '').split(',')
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('offset', 0, type=int)
     
     query = Report.query
     
@@ -20,9 +27,15 @@ def get_reports():
         query = query.filter(Report.user_id == user_id)
     if report_type:
         query = query.filter(Report.report_type == report_type)
+    if inclure_contenu:
+        query = query.options(undefer_group('contenu'))
     
-    rapports = query.order_by(Report.created_at.desc()).all()
-    return jsonify([rapport.to_dict() for rapport in rapports])
+    query = query.order_by(Report.created_at.desc())
+    if limit:
+        query = query.limit(limit).offset(offset)
+    
+    rapports = query.all()
+    return jsonify([rapport.to_dict(include_content=inclure_contenu) for rapport in rapports])
 
 @report_bp.route('/rapports', methods=['POST'])
 def create_report():
@@ -58,18 +71,66 @@ def create_report():
 
 @report_bp.route('/rapports/<int:rapport_id>', methods=['GET'])
 def get_report(rapport_id):
-    """Récupérer un rapport par son ID"""
-    rapport = Report.query.get_or_404(rapport_id)
+    """Récupérer un rapport par son ID, contenu décompressé en streaming"""
+    rapport = Report.query.options(undefer_group('contenu')).get_or_404(rapport_id)
     
-    # Convertir le contenu JSON en objet Python
-    rapport_dict = rapport.to_dict()
-    if rapport.content:
-        try:
-            rapport_dict['content'] = json.loads(rapport.content)
-        except json.JSONDecodeError:
-            rapport_dict['content'] = {'erreur': 'Contenu invalide'}
+    rapport_dict = rapport.to_dict(include_content=False)
+    
+    # Les anciens rapports non compressés sont validés avant envoi
+    blocs = rapport.iter_content()
+    if rapport.content_compressed is None:
+        if rapport.content_legacy:
+            try:
+                json.loads(rapport.content_legacy)
+            except json.JSONDecodeError:
+                blocs = iter([json.dumps({'erreur': 'Contenu invalide'}, ensure_ascii=False).encode('utf-8')])
+        else:
+            blocs = iter([b'null'])
+    
+    # Le contenu étant déjà du JSON, il est injecté tel quel dans l'enveloppe
+    entete = json.dumps(rapport_dict, ensure_ascii=False)[:-1] + ', "content": '
     
-    return jsonify(rapport_dict)
+    def generer():
+        yield entete.encode('utf-8')
+        yield from blocs
+        yield b'}'
+    
+    return Response(generer(), mimetype='application/json')
+
+@report_bp.route('/rapports/<int:rapport_id>/fichier', methods=['GET'])
+def get_report_file(rapport_id):
+    """Obtenir la version imprimable (PDF ou HTML) d'un rapport"""
+    format_fichier = request.args.get('format', 'pdf')
+    if format_fichier not in FORMATS:
+        return jsonify({'erreur': 'Format non supporté'}), 400
+    
+    rapport = Report.query.options(undefer_group('contenu')).get_or_404(rapport_id)
+    contenu = rapport.content
+    if not contenu:
+        return jsonify({'erreur': 'Rapport sans contenu'}), 404
+    
+    # Le rendu n'a lieu qu'une fois par contenu, dans le pool de processus
+    chemin = rendre_artefact(dossier_artefacts(), contenu, format_fichier,
+                             workers=current_app.config.get('REPORT_RENDER_WORKERS', 2))
+    if format_fichier == 'pdf' and rapport.file_path != chemin:
+        rapport.file_path = chemin
+        db.session.commit()
+    
+    return redirect(url_for('report.get_report_artifact', nom=os.path.basename(chemin)))
+
+@report_bp.route('/rapports/fichiers/<nom>', methods=['GET'])
+def get_report_artifact(nom):
+    """Servir un artefact de rapport adressé par son empreinte (contenu immuable)"""
+    chemin = chemin_depuis_nom(dossier_artefacts(), nom)
+    if chemin is None or not os.path.exists(chemin):
+        return jsonify({'erreur': 'Fichier introuvable'}), 404
+    
+    empreinte, format_fichier = nom.split('.')
+    reponse = send_file(chemin, mimetype=FORMATS[format_fichier], conditional=True,
+                        etag=empreinte, max_age=31536000, download_name=nom)
+    reponse.cache_control.public = True
+    reponse.cache_control.immutable = True
+    return reponse
 
 @report_bp.route('/rapports/<int:rapport_id>', methods=['DELETE'])
 def delete_report(rapport_id):
@@ -98,8 +159,9 @@ def generate_market_report():
     db.session.add(rapport)
     db.session.commit()
     
-    # Générer le contenu
-    contenu = generer_rapport_marche(location)
+    # Générer le contenu : les demandes simultanées pour la même localisation partagent un seul calcul
+    contenu = coalescence.executer('rapport_marche', normaliser_localisation(location),
+                                   lambda: generer_rapport_marche(location))
     rapport.content = json.dumps(contenu, ensure_ascii=False)
     rapport.status = 'completed'
     
@@ -111,37 +173,76 @@ def generate_market_report():
         'contenu': contenu
     })
 
+@report_bp.route('/rapports/batches', methods=['GET'])
+def get_report_batches():
+    """Récupérer l'historique des générations mensuelles et leurs métriques"""
+    batches = ReportBatch.query.order_by(ReportBatch.period.desc()).all()
+    return jsonify([batch.to_dict() for batch in batches])
+
 @report_bp.route('/rapports/assistant-redaction', methods=['POST'])
 def content_writing_assistant():
     """Assistant de rédaction pour les réseaux sociaux et annonces"""
+    try:
+        # type : post_linkedin, post_facebook, annonce, slogan
+        type_contenu, sujet, quartier, mots_cles = redaction.lire_demande(request.json)
+    except ValueError as erreur:
+        return jsonify({'erreur': str(erreur)}), 400
+    
+    resultat = redaction.rediger(type_contenu, sujet, quartier, mots_cles)
+    resultat['donnees_marche'] = resume_marche(agreger_marche(quartier)) if quartier else None
+    
+    return jsonify(resultat)
+
+@report_bp.route('/rapports/assistant-redaction/batch', methods=['POST'])
+def content_writing_assistant_batch():
+    """Assistant de rédaction en lot pour les campagnes (réponse NDJSON en streaming)"""
     data = request.json
-    type_contenu = data.get('type', 'post_linkedin')  # post_linkedin, post_facebook, annonce, slogan
-    sujet = data.get('sujet', '')
-    quartier = data.get('quartier', '')
-    mots_cles = data.get('mots_cles', [])
+    elements = data.get('items', []) if isinstance(data, dict) else data
+    if not isinstance(elements, list):
+        return jsonify({'erreur': 'Liste de demandes requise'}), 400
     
-    suggestions = generer_suggestions_contenu(type_contenu, sujet, quartier, mots_cles)
+    # Toutes les demandes sont validées avant d'envoyer la première ligne du flux
+    demandes = []
+    for index, element in enumerate(elements):
+        try:
+            demandes.append(redaction.lire_demande(element))
+        except ValueError as erreur:
+            return jsonify({'erreur': f'Demande {index} : {erreur}', 'index': index}), 400
     
-    return jsonify({
-        'type': type_contenu,
-        'suggestions': suggestions,
-        'conseils_seo': generer_conseils_seo(mots_cles),
-        'variantes': generer_variantes_messages(suggestions[0] if suggestions else '')
-    })
+    # Statistiques de marché calculées avant le streaming, une fois par quartier distinct
+    donnees_marche = {}
+    if request.args.get('donnees_marche', '1') != '0':
+        for _, _, quartier, _ in demandes:
+            if quartier and quartier not in donnees_marche:
+                donnees_marche[quartier] = resume_marche(agreger_marche(quartier))
+    
+    def resultats():
+        for index, (type_contenu, sujet, quartier, mots_cles) in enumerate(demandes):
+            resultat = redaction.rediger(type_contenu, sujet, quartier, mots_cles)
+            resultat['index'] = index
+            resultat['quartier'] = quartier
+            resultat['donnees_marche'] = donnees_marche.get(quartier)
+            yield resultat
+    
+    return Response(redaction.ndjson(resultats()), mimetype='application/x-ndjson')
+
+def dossier_artefacts():
+    """Dossier de stockage des rapports rendus (HTML/PDF)"""
+    return current_app.config.get('REPORT_ARTIFACTS_DIR') or os.path.join(current_app.config['DATA_DIR'], 'artifacts')
 
 def generer_rapport_marche(location):
     """Générer le contenu d'un rapport de marché (simulation d'IA)"""
-    # Récupérer des données réelles de la base
-    proprietes = Property.query.filter(Property.city.ilike(f'%{location}%')).all()
-    quartiers = Neighborhood.query.filter(Neighborhood.city.ilike(f'%{location}%')).all()
-    
+    return construire_rapport_marche(location, agreger_marche(location))
+
+def construire_rapport_marche(location, aggregats):
+    """Construire le rapport de marché à partir des statistiques agrégées"""
     # Calculer des statistiques
-    if proprietes:
-        prix_moyen = sum([p.price for p in proprietes if p.price]) / len([p for p in proprietes if p.price])
-        surface_moyenne = sum([p.surface for p in proprietes if p.surface]) / len([p for p in proprietes if p.surface])
+    if aggregats['nombre_proprietes'] and aggregats['prix_moyen']:
+        prix_moyen = aggregats['prix_moyen']
+        nombre_transactions = aggregats['nombre_proprietes']
     else:
         prix_moyen = random.uniform(250000, 450000)
-        surface_moyenne = random.uniform(70, 120)
+        nombre_transactions = aggregats['nombre_proprietes'] or random.randint(150, 300)
     
     return {
         'titre': f'Analyse du Marché Immobilier - {location}',
@@ -149,7 +250,7 @@ def generer_rapport_marche(location):
         'resume_executif': {
             'prix_moyen': round(prix_moyen, 0),
             'evolution_6_mois': round(random.uniform(-3, 8), 1),
-            'nombre_transactions': len(proprietes) if proprietes else random.randint(150, 300),
+            'nombre_transactions': nombre_transactions,
             'delai_vente_moyen': random.randint(45, 90)
         },
         'tendances_marche': [
@@ -158,7 +259,7 @@ def generer_rapport_marche(location):
             'Développement des infrastructures de transport',
             'Intérêt croissant des investisseurs locatifs'
         ],
-        'analyse_quartiers': [q.to_dict() for q in quartiers[:5]] if quartiers else [],
+        'analyse_quartiers': aggregats['quartiers'],
         'recommandations': [
             'Cibler les propriétaires de maisons individuelles',
             'Développer une stratégie marketing axée sur les familles',
@@ -174,9 +275,14 @@ def generer_rapport_marche(location):
 
 def generer_rapport_prediction(location):
     """Générer un rapport de prédiction de quartier (simulation d'IA)"""
+    return construire_rapport_prediction(location, agreger_marche(location))
+
+def construire_rapport_prediction(location, aggregats):
+    """Construire le rapport de prédiction à partir des statistiques agrégées"""
     return {
         'titre': f'Prédictions Immobilières - {location}',
         'date_generation': datetime.now().isoformat(),
+        'donnees_marche': resume_marche(aggregats),
         'modele_ia': 'Vertex AI - Prédiction Immobilière v2.1',
         'confiance': round(random.uniform(0.82, 0.94), 2),
         'predictions': {
@@ -200,9 +306,14 @@ def generer_rapport_prediction(location):
 
 def generer_rapport_profils(location):
     """Générer un rapport de profils d'acquéreurs (simulation d'IA)"""
+    return construire_rapport_profils(location, agreger_marche(location))
+
+def construire_rapport_profils(location, aggregats):
+    """Construire le rapport de profils à partir des statistiques agrégées"""
     return {
         'titre': f'Profils d\'Acquéreurs - {location}',
         'date_generation': datetime.now().isoformat(),
+        'donnees_marche': resume_marche(aggregats),
         'profils_identifies': [
             {
                 'nom': 'Jeunes Couples Actifs',
@@ -242,47 +353,12 @@ def generer_rapport_profils(location):
 
 def generer_suggestions_contenu(type_contenu, sujet, quartier, mots_cles):
     """Générer des suggestions de contenu (simulation d'IA)"""
-    suggestions = []
-    
-    if type_contenu == 'post_linkedin':
-        suggestions = [
-            f"🏡 Découvrez les opportunités immobilières exceptionnelles du quartier {quartier} ! {sujet} - Contactez-moi pour une expertise personnalisée. #ImmobilierToulouse #Investissement",
-            f"💡 Saviez-vous que {quartier} offre un potentiel de plus-value remarquable ? {sujet} - Parlons de votre projet immobilier ! #ConseilImmobilier #Expertise",
-            f"🎯 {sujet} dans le secteur {quartier} : une opportunité à saisir ! Mon expertise locale à votre service. #ImmobilierLocal #Opportunité"
-        ]
-    elif type_contenu == 'post_facebook':
-        suggestions = [
-            f"🌟 Vous cherchez à acheter ou vendre dans le quartier {quartier} ? {sujet} Je connais parfaitement ce secteur et ses spécificités. Contactez-moi !",
-            f"🏘️ Le marché de {quartier} évolue rapidement ! {sujet} Profitez de mon expertise locale pour optimiser votre projet immobilier.",
-            f"💼 {sujet} - Spécialiste du secteur {quartier}, je vous accompagne dans tous vos projets immobiliers avec passion et professionnalisme !"
-        ]
-    elif type_contenu == 'annonce':
-        suggestions = [
-            f"Magnifique opportunité dans le quartier prisé de {quartier} ! {sujet} - Bien d'exception alliant charme et modernité.",
-            f"Coup de cœur assuré pour ce bien situé à {quartier} ! {sujet} - Idéal pour investisseurs avisés ou famille recherchant la qualité.",
-            f"Exclusivité ! {sujet} dans le secteur recherché de {quartier}. Prestations haut de gamme et environnement privilégié."
-        ]
-    
-    return suggestions
+    return redaction.suggestions(type_contenu, sujet, quartier)
 
 def generer_conseils_seo(mots_cles):
     """Générer des conseils SEO (simulation d'IA)"""
-    return [
-        f"Utilisez les mots-clés '{', '.join(mots_cles[:3])}' dans les 100 premiers mots",
-        "Ajoutez des hashtags locaux pour améliorer la visibilité",
-        "Incluez un appel à l'action clair",
-        "Optimisez pour la recherche mobile",
-        "Utilisez des émojis pour augmenter l'engagement"
-    ]
+    return redaction.conseils_seo(mots_cles)
 
 def generer_variantes_messages(message_base):
     """Générer des variantes d'un message (simulation d'IA)"""
-    if not message_base:
-        return []
-    
-    return [
-        message_base.replace('!', '.').replace('🏡', '🏠'),
-        message_base.replace('Découvrez', 'Explorez').replace('exceptionnelles', 'uniques'),
-        message_base.replace('Contactez-moi', 'Appelez-moi').replace('expertise', 'conseil')
-    ]
-
+    return redaction.variantes(message_base)
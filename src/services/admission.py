@@ -0,0 +1,272 @@
+from flask import g, jsonify, request
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # hors POSIX : état limité au processus courant
+    fcntl = None
+
+# Règles par endpoint Flask :
+# - debit : jetons rechargés par seconde et par client, rafale : capacité du seau
+# - concurrence : requêtes simultanées sur l'endpoint (tous clients et processus confondus)
+# - attente : secondes d'attente d'une place avant 503, file : requêtes en attente par processus
+REGLES_PAR_DEFAUT = {
+    'chatbot.handle_conversation': {'debit': 2.0, 'rafale': 20, 'concurrence': 16, 'attente': 2.0, 'file': 32},
+    'chatbot.handle_conversation_stream': {'debit': 2.0, 'rafale': 20, 'concurrence': 16, 'attente': 2.0, 'file': 32},
+    'report.generate_market_report': {'debit': 0.2, 'rafale': 5, 'concurrence': 2, 'attente': 5.0, 'file': 8},
+    'property.get_property_stats': {'debit': 1.0, 'rafale': 10, 'concurrence': 4, 'attente': 2.0, 'file': 16},
+}
+
+# Fichier partagé : en-tête puis table de seaux (empreinte du client, jetons, date de mise à jour)
+MAGIQUE = b'FIADM001'
+EN_TETE = struct.Struct('<8sQ')
+SEAU = struct.Struct('<Qdd')
+SONDES = 8  # emplacements examinés avant d'écraser le seau le plus ancien
+# Octets verrouillés (fcntl) : 0 protège la table des seaux ; au-delà de BASE_CONCURRENCE,
+# un octet par place de concurrence. Les verrous POSIX sont rendus par le noyau à la mort
+# du processus : une place ne peut pas fuir si un worker est tué en pleine requête.
+BASE_CONCURRENCE = 1 << 40
+PLACES_MAX = 4096
+
+class Refus(Exception):
+    """Requête refusée : statut HTTP (429 ou 503) et délai conseillé en secondes"""
+
+    def __init__(self, statut, delai, message):
+        super().__init__(message)
+        self.statut = statut
+        self.delai = delai
+
+class ControleAdmission:
+    """Limitation de débit par client et par endpoint, et plafond de concurrence par endpoint.
+
+    Les seaux à jetons et les places de concurrence sont partagés entre les processus
+    d'un même hôte via ADMISSION_FICHIER (mmap pour les seaux, verrous fcntl sur des
+    plages d'octets pour les places). Sans fichier, l'état reste local au processus.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.regles = {}
+        self._index_regles = {}
+        self._verrou = threading.Lock()
+        self._condition = threading.Condition(self._verrou)
+        self._chemin = None
+        self._descripteur = None
+        self._table = None
+        self._emplacements = 0
+        self._pid = os.getpid()
+        self._tenues = set()
+        self._en_attente = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMISSION_ACTIVE', True)
+        app.config.setdefault('ADMISSION_REGLES', REGLES_PAR_DEFAUT)
+        app.config.setdefault('ADMISSION_FICHIER', os.path.join(app.config['DATA_DIR'], 'admission.bin'))
+        app.config.setdefault('ADMISSION_EMPLACEMENTS', 8192)  # seaux suivis simultanément
+        self.app = app
+        self.regles = dict(app.config['ADMISSION_REGLES'])
+        # Index stable d'un processus à l'autre : position des places de concurrence dans le fichier
+        self._index_regles = {nom: index for index, nom in enumerate(sorted(self.regles))}
+        self._ouvrir(app.config['ADMISSION_FICHIER'], app.config['ADMISSION_EMPLACEMENTS'])
+        app.extensions['controle_admission'] = self
+        app.before_request(self._admettre)
+        app.after_request(self._fin_requete)
+        app.teardown_request(self._liberer_requete)
+
+    # Stockage partagé
+
+    def _ouvrir(self, chemin, emplacements):
+        if chemin and fcntl is None:
+            chemin = None
+        if self._table is not None and chemin == self._chemin and emplacements == self._emplacements:
+            return  # déjà ouvert : fermer le descripteur rendrait les verrous fcntl de ce processus
+        taille = EN_TETE.size + emplacements * SEAU.size
+        if chemin is None:
+            # Table propre à chaque processus : un mmap anonyme partagé (MAP_SHARED, le défaut) serait
+            # hérité par les workers forkés (gunicorn --preload) sans verrou fcntl pour le protéger
+            self._descripteur = None
+            self._table = mmap.mmap(-1, taille, flags=mmap.MAP_PRIVATE) if hasattr(mmap, 'MAP_PRIVATE') \
+                else mmap.mmap(-1, taille)
+        else:
+            os.makedirs(os.path.dirname(chemin), exist_ok=True)
+            self._descripteur = os.open(chemin, os.O_RDWR | os.O_CREAT, 0o600)
+            with self._verrou_table():
+                if os.fstat(self._descripteur).st_size != taille:
+                    os.ftruncate(self._descripteur, 0)
+                    os.ftruncate(self._descripteur, taille)
+                    os.pwrite(self._descripteur, EN_TETE.pack(MAGIQUE, emplacements), 0)
+            self._table = mmap.mmap(self._descripteur, taille)
+        if self._descripteur is None:
+            EN_TETE.pack_into(self._table, 0, MAGIQUE, emplacements)
+        self._chemin = chemin
+        self._emplacements = emplacements
+
+    def _verrou_table(self):
+        return _VerrouFichier(self._descripteur, 0, 1)
+
+    def _apres_fork(self):
+        # Les verrous fcntl ne sont pas hérités : les places tenues appartenaient au parent
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._tenues = set()
+            self._en_attente = {}
+
+    # Seaux à jetons
+
+    def consommer(self, cle, debit, rafale):
+        """Prendre un jeton du seau `cle` ; renvoie (accepté, secondes avant le prochain jeton)"""
+        empreinte = int.from_bytes(hashlib.blake2b(cle.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        maintenant = time.time()
+        with self._verrou, self._verrou_table():
+            position = None
+            plus_ancien = None
+            for sonde in range(SONDES):
+                index = (empreinte + sonde) % self._emplacements
+                decalage = EN_TETE.size + index * SEAU.size
+                occupant, jetons, date = SEAU.unpack_from(self._table, decalage)
+                if occupant == empreinte:
+                    position = decalage
+                    break
+                if occupant == 0:
+                    position, jetons, date = decalage, rafale, maintenant
+                    break
+                if plus_ancien is None or date < plus_ancien[1]:
+                    plus_ancien = (decalage, date)
+            else:
+                # Table pleine autour de l'empreinte : le seau inactif depuis le plus longtemps est repris
+                position, jetons, date = plus_ancien[0], rafale, maintenant
+
+            jetons = min(rafale, jetons + max(0.0, maintenant - date) * debit)
+            accepte = jetons >= 1
+            if accepte:
+                jetons -= 1
+            SEAU.pack_into(self._table, position, empreinte, jetons, maintenant)
+        return accepte, 0.0 if accepte else (1 - jetons) / debit
+
+    # Places de concurrence
+
+    def acquerir(self, nom, capacite, attente, file):
+        """Obtenir une place parmi `capacite` pour l'endpoint `nom`, en attendant au plus `attente` secondes.
+
+        Renvoie l'identifiant de la place, ou None (file pleine ou délai écoulé).
+        """
+        self._apres_fork()
+        with self._verrou:
+            place = self._essayer_place(nom, capacite)
+            if place is not None:
+                return place
+            if self._en_attente.get(nom, 0) >= file:
+                return None
+            self._en_attente[nom] = self._en_attente.get(nom, 0) + 1
+            echeance = time.monotonic() + attente
+            try:
+                while True:
+                    restant = echeance - time.monotonic()
+                    if restant <= 0:
+                        return None
+                    # Réveil immédiat sur libération locale ; sondage court pour les autres processus
+                    self._condition.wait(min(restant, 0.01 if self._descripteur is not None else restant))
+                    place = self._essayer_place(nom, capacite)
+                    if place is not None:
+                        return place
+            finally:
+                self._en_attente[nom] -= 1
+
+    def _essayer_place(self, nom, capacite):
+        base = BASE_CONCURRENCE + self._index_regles.get(nom, 0) * PLACES_MAX
+        for numero in range(min(capacite, PLACES_MAX)):
+            place = (nom, numero)
+            if place in self._tenues:
+                continue
+            if self._descripteur is not None:
+                try:
+                    fcntl.lockf(self._descripteur, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, base + numero)
+                except OSError:
+                    continue
+            self._tenues.add(place)
+            return place
+        return None
+
+    def liberer(self, place):
+        with self._verrou:
+            if place not in self._tenues:
+                return
+            self._tenues.discard(place)
+            if self._descripteur is not None:
+                base = BASE_CONCURRENCE + self._index_regles.get(place[0], 0) * PLACES_MAX
+                fcntl.lockf(self._descripteur, fcntl.LOCK_UN, 1, base + place[1])
+            self._condition.notify()
+
+    # Intégration Flask
+
+    def client(self):
+        """Identifiant du client : adresse IP (derrière un proxy, utiliser ProxyFix)"""
+        return request.remote_addr or 'inconnu'
+
+    def admettre(self, nom):
+        """Appliquer les règles de l'endpoint `nom` à la requête courante (Refus si rejetée)"""
+        regle = self.regles[nom]
+        if 'debit' in regle:
+            accepte, delai = self.consommer(f'{nom}|{self.client()}', regle['debit'], regle['rafale'])
+            if not accepte:
+                raise Refus(429, delai, 'Trop de requêtes, réessayer plus tard')
+        if 'concurrence' in regle:
+            place = self.acquerir(nom, regle['concurrence'], regle.get('attente', 0.0),
+                                  regle.get('file', regle['concurrence']))
+            if place is None:
+                raise Refus(503, max(1.0, regle.get('attente', 0.0)), 'Service surchargé, réessayer plus tard')
+            return place
+        return None
+
+    def _admettre(self):
+        if not self.app.config['ADMISSION_ACTIVE'] or request.endpoint not in self.regles:
+            return None
+        try:
+            g._admission = self.admettre(request.endpoint)
+        except Refus as refus:
+            reponse = jsonify({'erreur': str(refus)})
+            reponse.status_code = refus.statut
+            reponse.headers['Retry-After'] = str(max(1, math.ceil(refus.delai)))
+            return reponse
+        return None
+
+    def _fin_requete(self, reponse):
+        place = g.pop('_admission', None)
+        if place is not None:
+            # Réponses en streaming : la place est tenue jusqu'à la fin de l'envoi
+            reponse.call_on_close(lambda: self.liberer(place))
+        return reponse
+
+    def _liberer_requete(self, exception=None):
+        place = g.pop('_admission', None)
+        if place is not None:
+            self.liberer(place)
+
+class _VerrouFichier:
+    """Verrou fcntl exclusif sur une plage d'octets (sans effet sans fichier)"""
+
+    __slots__ = ('descripteur', 'debut', 'longueur')
+
+    def __init__(self, descripteur, debut, longueur):
+        self.descripteur = descripteur
+        self.debut = debut
+        self.longueur = longueur
+
+    def __enter__(self):
+        if self.descripteur is not None:
+            fcntl.lockf(self.descripteur, fcntl.LOCK_EX, self.longueur, self.debut)
+        return self
+
+    def __exit__(self, *exc):
+        if self.descripteur is not None:
+            fcntl.lockf(self.descripteur, fcntl.LOCK_UN, self.longueur, self.debut)
+
+controle_admission = ControleAdmission()
@@ -0,0 +1,395 @@
+from datetime import date, datetime
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+from src.models.user import db
+from src.models.change_log import ChangeLog
+from src.models.property import Property
+from src.services.property_snapshot import DATE_ABSENTE, VerrouEcriture, instantane_proprietes
+import json
+import os
+import threading
+import time
+import numpy as np
+
+FORMAT = 1  # format des artefacts : un artefact d'un autre format est ignoré et le modèle réentraîné
+# Variables continues, centrées réduites à l'entraînement (u, v : latitude et longitude)
+DENSES = ('constante', 'log_surface', 'rooms', 'u', 'v', 'u2', 'v2', 'uv')
+PRIX_M2_MIN, PRIX_M2_MAX = 100, 50000  # ventes hors de ces bornes exclues de l'entraînement
+VENTES_MIN = 50
+SURFACE_PAR_PIECE = 25.0  # m² : nombre de pièces supposé quand il est inconnu
+Z_90 = 1.645  # quantile de la loi normale pour l'intervalle à 90 %
+
+class ModeleIndisponible(Exception):
+    """Pas assez de ventes utilisables pour entraîner le modèle"""
+
+def _pieces(surface, rooms):
+    return np.where(rooms >= 0, rooms, np.maximum(1.0, np.round(surface / SURFACE_PAR_PIECE)))
+
+class Modele:
+    """Modèle hédonique log-linéaire : log(prix) ~ surface, pièces, position, type, ville, année.
+
+    Les variables catégorielles (type, ville, année de vente) sont codées sans modalité
+    de référence et régularisées (ridge) : une ville peu représentée reste proche de la
+    moyenne. Le modèle garde les statistiques suffisantes (XᵀX, Xᵀy) de l'entraînement,
+    auxquelles s'ajoutent celles des ventes arrivées depuis : la mise à jour se réduit
+    à résoudre un système de la taille du nombre de variables.
+    """
+
+    def __init__(self, meta):
+        self.meta = meta
+        self._index_types = {nom: code for code, nom in enumerate(meta['types'])}
+        self._index_villes = {nom.casefold(): code for code, nom in enumerate(meta['villes'])}
+        self.base = self.increment = None
+        self.coefficients, self.ecart_type = None, 0.0
+
+    @property
+    def version(self):
+        return self.meta['version']
+
+    @property
+    def tailles(self):
+        return len(self.meta['types']), len(self.meta['villes']), len(self.meta['annees'])
+
+    @property
+    def lignes_incrementales(self):
+        return self.increment[3] if self.increment else 0
+
+    # Variables
+
+    def codes_types(self, noms):
+        return np.array([self._index_types.get(nom, -1) for nom in noms], dtype=np.int64)
+
+    def codes_villes(self, noms):
+        return np.array([self._index_villes.get(nom.casefold(), -1) if nom else -1 for nom in noms], dtype=np.int64)
+
+    def codes_annees(self, annees):
+        """Année de vente -> dernière année apprise qui ne la dépasse pas (la première sinon)"""
+        apprises = np.asarray(self.meta['annees'])
+        return (np.searchsorted(apprises, annees, side='right') - 1).clip(0, len(apprises) - 1)
+
+    def variables(self, surface, rooms, latitude, longitude):
+        """Matrice (n, len(DENSES)) des variables continues"""
+        centres, echelles, bornes = self.meta['centres'], self.meta['echelles'], self.meta['bornes']
+        # Hors de la zone des ventes d'entraînement, les termes quadratiques divergent : position ramenée au bord
+        latitude, longitude = np.clip(latitude, *bornes['latitude']), np.clip(longitude, *bornes['longitude'])
+        log_surface = (np.log(surface) - centres['log_surface']) / echelles['log_surface']
+        rooms = (_pieces(surface, rooms) - centres['rooms']) / echelles['rooms']
+        u = (latitude - centres['latitude']) / echelles['latitude']
+        v = (longitude - centres['longitude']) / echelles['longitude']
+        return np.column_stack([np.ones(len(surface)), log_surface, rooms, u, v, u * u, v * v, u * v])
+
+    # Ajustement
+
+    def statistiques(self, denses, categories, log_prix):
+        """(XᵀX, Xᵀy, yᵀy, n) sans matérialiser les indicatrices : sommes par modalité (np.bincount)"""
+        d = denses.shape[1]
+        blocs = []
+        debut = d
+        for codes, taille in zip(categories, self.tailles):
+            blocs.append((codes, taille, debut))
+            debut += taille
+        xtx, xty = np.zeros((debut, debut)), np.zeros(debut)
+        xtx[:d, :d] = denses.T @ denses
+        xty[:d] = denses.T @ log_prix
+        for numero, (codes, taille, debut) in enumerate(blocs):
+            # Modalité non apprise (-1) : la ligne ne compte que dans les variables continues
+            connus = codes >= 0
+            index = codes[connus]
+            bloc = slice(debut, debut + taille)
+            xtx[bloc, bloc] += np.diag(np.bincount(index, minlength=taille).astype(np.float64))
+            croises = np.column_stack([np.bincount(index, weights=denses[connus, j], minlength=taille)
+                                       for j in range(d)])
+            xtx[bloc, :d] += croises
+            xtx[:d, bloc] += croises.T
+            xty[bloc] += np.bincount(index, weights=log_prix[connus], minlength=taille)
+            for autres, taille_autre, debut_autre in blocs[numero + 1:]:
+                paires = connus & (autres >= 0)
+                croisement = np.bincount(codes[paires] * taille_autre + autres[paires],
+                                         minlength=taille * taille_autre).reshape(taille, taille_autre)
+                xtx[bloc, debut_autre:debut_autre + taille_autre] += croisement
+                xtx[debut_autre:debut_autre + taille_autre, bloc] += croisement.T
+        return xtx, xty, float(log_prix @ log_prix), len(log_prix)
+
+    def ajuster(self, base, increment=None):
+        """Résoudre le système régularisé sur les statistiques de base plus l'incrément éventuel"""
+        self.base, self.increment = base, increment
+        xtx, xty, yty, n = base
+        if increment:
+            xtx, xty, yty, n = xtx + increment[0], xty + increment[1], yty + increment[2], n + increment[3]
+        penalite = np.full(len(xty), self.meta['ridge'])
+        penalite[0] = 0.0  # constante non pénalisée
+        self.coefficients = np.linalg.solve(xtx + np.diag(penalite), xty)
+        residus = yty - 2 * self.coefficients @ xty + self.coefficients @ xtx @ self.coefficients
+        self.ecart_type = float(np.sqrt(max(residus, 0.0) / max(n - len(xty), 1)))
+        return self
+
+    def avec_increment(self, denses, categories, log_prix):
+        """Nouveau modèle : ventes d'entraînement plus les ventes fournies (remplace l'incrément précédent)"""
+        increment = self.statistiques(denses, categories, log_prix) if len(log_prix) else None
+        return Modele(self.meta).ajuster(self.base, increment)
+
+    # Prédiction
+
+    def predire_log(self, denses, categories):
+        resultat = denses @ self.coefficients[:denses.shape[1]]
+        debut = denses.shape[1]
+        for codes, taille in zip(categories, self.tailles):
+            # Modalité non apprise : effet nul, c'est-à-dire la moyenne régularisée
+            resultat += np.where(codes >= 0, self.coefficients[debut:debut + taille][codes.clip(0)], 0.0)
+            debut += taille
+        return resultat
+
+    def estimer(self, surface, rooms, latitude, longitude, types, villes, annee=None):
+        """Prix estimés et bornes de l'intervalle à 90 % (tableaux), pour une vente en `annee` (l'année courante)"""
+        denses = self.variables(surface, rooms, latitude, longitude)
+        annees = np.full(len(surface), annee or date.today().year)
+        categories = (self.codes_types(types), self.codes_villes(villes), self.codes_annees(annees))
+        log_prix = self.predire_log(denses, categories)
+        marge = Z_90 * self.ecart_type
+        return np.exp(log_prix), np.exp(log_prix - marge), np.exp(log_prix + marge)
+
+    def description(self):
+        return {'version': self.version, 'trained_at': self.meta['entraine_le'], 'rows': self.base[3],
+                'incremental_rows': self.lignes_incrementales, 'r2': self.meta['r2'], 'mdape': self.meta['mdape']}
+
+    # Artefact
+
+    def enregistrer(self, chemin):
+        xtx, xty, yty, n = self.base
+        temporaire = f'{chemin}.{os.getpid()}.tmp'
+        with open(temporaire, 'wb') as flux:
+            np.savez(flux, xtx=xtx, xty=xty, scalaires=np.array([yty, n]),
+                     meta=np.array(json.dumps(self.meta, ensure_ascii=False)))
+        os.replace(temporaire, chemin)
+
+    @classmethod
+    def charger(cls, chemin):
+        with np.load(chemin, allow_pickle=False) as archive:
+            meta = json.loads(str(archive['meta']))
+            if meta.get('format') != FORMAT:
+                raise ValueError(f'Format d\'artefact {meta.get("format")} non pris en charge')
+            yty, n = archive['scalaires']
+            return cls(meta).ajuster((archive['xtx'], archive['xty'], float(yty), int(n)))
+
+class MoteurAVM:
+    """Estimation automatique de la valeur des biens (AVM).
+
+    Le modèle est entraîné sur l'instantané en colonnes des biens (table chaude et
+    archives) et publié comme artefact versionné dans AVM_DOSSIER (`avm-000042.npz`,
+    le fichier `courant` désignant la version en service). Chaque worker charge
+    l'artefact une fois, puis y ajoute à chaque génération de l'instantané les ventes
+    arrivées depuis l'entraînement.
+
+    Un réentraînement complet (nouvelles villes et années, ventes anciennes corrigées
+    ou supprimées) est lancé en arrière-plan quand l'artefact a plus de AVM_AGE_MAX
+    secondes ou que les ventes modifiées ou ajoutées depuis dépassent la part
+    AVM_REENTRAINEMENT des ventes d'entraînement ; un verrou de fichier le réserve à un
+    seul processus, les autres chargent la nouvelle version à leur prochaine vérification.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._modele = None
+        self._colonnes = None  # génération de l'instantané dont les ventes récentes sont intégrées
+        self._verifie = 0.0
+        self._verrou = threading.Lock()
+        self._tache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AVM_ANNEES', 10)  # ancienneté maximale des ventes d'entraînement
+        app.config.setdefault('AVM_VILLES_MAX', 500)  # villes les plus représentées, avec leur propre effet
+        app.config.setdefault('AVM_RIDGE', 1.0)
+        app.config.setdefault('AVM_AGE_MAX', 24 * 3600)  # secondes
+        app.config.setdefault('AVM_REENTRAINEMENT', 0.05)
+        app.config.setdefault('AVM_INTERVALLE', 5.0)  # secondes entre deux lectures du fichier `courant`
+        app.config.setdefault('AVM_LOT_MAX', 10000)
+        app.config.setdefault('AVM_VERSIONS_CONSERVEES', 5)
+        # Par défaut, à côté de la base principale : app.db -> app_avm/ (rien sur disque en mémoire)
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        base = url.database if url.get_backend_name() == 'sqlite' else None
+        app.config.setdefault('AVM_DOSSIER', f'{os.path.splitext(base)[0]}_avm' if base and base != ':memory:' else None)
+        self.app = app
+        self._modele = None
+        self._colonnes = None
+        app.extensions['moteur_avm'] = self
+
+    # Ventes d'entraînement
+
+    def _utilisables(self, colonnes):
+        """Ventes datées, géolocalisées, récentes et de prix au m² plausible"""
+        premiere_annee = date.today().year - self.app.config['AVM_ANNEES'] + 1
+        prix_m2 = colonnes['price_m2']
+        return (colonnes['price'] > 0) & (prix_m2 >= PRIX_M2_MIN) & (prix_m2 <= PRIX_M2_MAX) \
+            & (colonnes['sale_date'] != DATE_ABSENTE) & (colonnes['sale_month'] >= (premiere_annee - 1970) * 12) \
+            & ~np.isnan(colonnes['latitude']) & ~np.isnan(colonnes['longitude'])
+
+    def _encodage(self, colonnes, utilisables):
+        """Modalités apprises et normalisation des variables continues"""
+        types = np.unique(colonnes['property_type'][utilisables])
+        comptes = np.bincount(colonnes['city'][utilisables], minlength=len(colonnes.villes))
+        villes = [code for code in np.argsort(-comptes, kind='stable')[:self.app.config['AVM_VILLES_MAX']]
+                  if comptes[code]]
+        surface = colonnes['surface'][utilisables]
+        valeurs = {'log_surface': np.log(surface),
+                   'rooms': _pieces(surface, colonnes['rooms'][utilisables].astype(np.float64)),
+                   'latitude': colonnes['latitude'][utilisables], 'longitude': colonnes['longitude'][utilisables]}
+        return {'types': [colonnes.types[code] for code in types],
+                'villes': [colonnes.villes[code] for code in villes],
+                'annees': np.unique(colonnes['sale_month'][utilisables] // 12 + 1970).tolist(),
+                'centres': {nom: float(valeur.mean()) for nom, valeur in valeurs.items()},
+                'echelles': {nom: float(valeur.std()) or 1.0 for nom, valeur in valeurs.items()},
+                'bornes': {nom: [float(valeurs[nom].min()), float(valeurs[nom].max())]
+                           for nom in ('latitude', 'longitude')}}
+
+    def _ventes(self, colonnes, modele, utilisables):
+        """Variables continues, modalités et log(prix) des ventes retenues, dans l'encodage du modèle"""
+        def traduire(codes, noms, traduction):
+            # Codes de l'instantané -> codes du modèle (-1 : modalité non apprise)
+            return traduction(noms)[codes[utilisables]] if noms else np.full(np.count_nonzero(utilisables), -1)
+        categories = (traduire(colonnes['property_type'], colonnes.types, modele.codes_types),
+                      traduire(colonnes['city'], colonnes.villes, modele.codes_villes),
+                      modele.codes_annees(colonnes['sale_month'][utilisables] // 12 + 1970))
+        denses = modele.variables(colonnes['surface'][utilisables], colonnes['rooms'][utilisables].astype(np.float64),
+                                  colonnes['latitude'][utilisables], colonnes['longitude'][utilisables])
+        return denses, categories, np.log(colonnes['price'][utilisables])
+
+    # Entraînement
+
+    def entrainer(self, colonnes=None):
+        """Entraîner un modèle complet sur l'instantané (courant par défaut), publié comme nouvelle version"""
+        debut = time.perf_counter()
+        if colonnes is None:
+            colonnes = instantane_proprietes.colonnes()
+        utilisables = self._utilisables(colonnes)
+        if np.count_nonzero(utilisables) < VENTES_MIN:
+            raise ModeleIndisponible(f'{np.count_nonzero(utilisables)} ventes utilisables, '
+                                     f'{VENTES_MIN} au moins sont nécessaires')
+        meta = {'format': FORMAT, 'version': self._derniere_version() + 1, 'ridge': self.app.config['AVM_RIDGE'],
+                'curseur': colonnes.curseur, 'id_max': int(colonnes['id'][-1])}
+        meta.update(self._encodage(colonnes, utilisables))
+        modele = Modele(meta)
+        denses, categories, log_prix = self._ventes(colonnes, modele, utilisables)
+        modele.ajuster(modele.statistiques(denses, categories, log_prix))
+
+        # Qualité sur les ventes d'entraînement : R² en log, erreur absolue médiane en %
+        residus = log_prix - modele.predire_log(denses, categories)
+        meta['r2'] = round(1 - float(residus @ residus) / max(float(((log_prix - log_prix.mean()) ** 2).sum()), 1e-12), 4)
+        meta['mdape'] = round(float(np.median(np.abs(np.expm1(-residus)))) * 100, 2)
+        meta['entraine_le'] = datetime.utcnow().isoformat(timespec='seconds')
+        meta['duree_s'] = round(time.perf_counter() - debut, 3)
+        self._publier(modele)
+        return modele
+
+    def _derniere_version(self):
+        dossier = self.app.config['AVM_DOSSIER']
+        versions = [int(nom[4:10]) for nom in os.listdir(dossier) if nom.startswith('avm-') and nom.endswith('.npz')] \
+            if dossier and os.path.isdir(dossier) else []
+        return max(versions + [self._modele.version if self._modele else 0])
+
+    def _publier(self, modele):
+        dossier = self.app.config['AVM_DOSSIER']
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+            nom = f'avm-{modele.version:06d}.npz'
+            modele.enregistrer(os.path.join(dossier, nom))
+            temporaire = os.path.join(dossier, f'courant.{os.getpid()}.tmp')
+            with open(temporaire, 'w', encoding='utf-8') as flux:
+                flux.write(nom)
+            os.replace(temporaire, os.path.join(dossier, 'courant'))
+            versions = sorted(fichier for fichier in os.listdir(dossier)
+                              if fichier.startswith('avm-') and fichier.endswith('.npz'))
+            for fichier in versions[:-self.app.config['AVM_VERSIONS_CONSERVEES']]:
+                os.remove(os.path.join(dossier, fichier))
+        with self._verrou:
+            self._modele, self._colonnes = modele, None
+
+    def _charger_courant(self):
+        """Version désignée par `courant` si ce n'est pas celle déjà chargée (None sinon)"""
+        dossier = self.app.config['AVM_DOSSIER']
+        if not dossier:
+            return None
+        try:
+            with open(os.path.join(dossier, 'courant'), encoding='utf-8') as flux:
+                nom = flux.read().strip()
+            if self._modele is not None and nom == f'avm-{self._modele.version:06d}.npz':
+                return None
+            return Modele.charger(os.path.join(dossier, nom))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _verrou_fichier(self, bloquant):
+        dossier = self.app.config['AVM_DOSSIER']
+        return VerrouEcriture(os.path.join(dossier, 'avm') if dossier else None, bloquant=bloquant)
+
+    # Service
+
+    def modele(self):
+        """Modèle à jour des ventes de l'instantané courant, entraîné au premier appel s'il n'existe pas"""
+        colonnes = instantane_proprietes.colonnes()
+        maintenant = time.monotonic()
+        if self._modele is not None and colonnes is self._colonnes \
+                and maintenant - self._verifie < self.app.config['AVM_INTERVALLE']:
+            return self._modele
+
+        if maintenant - self._verifie >= self.app.config['AVM_INTERVALLE'] or self._modele is None:
+            self._verifie = maintenant
+            charge = self._charger_courant()
+            if charge is not None:
+                with self._verrou:
+                    self._modele, self._colonnes = charge, None
+        if self._modele is None:
+            with self._verrou_fichier(bloquant=True):
+                # Un autre processus a pu publier une version pendant l'attente du verrou
+                charge = self._charger_courant()
+                if charge is not None:
+                    with self._verrou:
+                        self._modele, self._colonnes = charge, None
+                else:
+                    self.entrainer()
+
+        with self._verrou:
+            if colonnes is not self._colonnes:
+                self._modele = self._integrer(self._modele, colonnes)
+                self._colonnes = colonnes
+            return self._modele
+
+    def _integrer_ventes(self, modele, colonnes):
+        """Modèle complété des ventes de l'instantané postérieures à son entraînement (identifiants plus grands)"""
+        recentes = np.zeros(colonnes.lignes, dtype=bool)
+        recentes[np.searchsorted(colonnes['id'], modele.meta['id_max'], side='right'):] = True
+        return modele.avec_increment(*self._ventes(colonnes, modele, recentes & self._utilisables(colonnes)))
+
+    def _integrer(self, modele, colonnes):
+        """Intégrer les ventes récentes ; réentraîner en arrière-plan si le modèle a trop vieilli"""
+        modele = self._integrer_ventes(modele, colonnes)
+
+        # Ventes apprises puis modifiées ou supprimées : seul un réentraînement les corrige
+        id_max, curseur = modele.meta['id_max'], modele.meta['curseur']
+        premier = db.session.query(func.min(ChangeLog.seq)).scalar()
+        modifiees = db.session.query(func.count(func.distinct(ChangeLog.row_id))).filter(
+            ChangeLog.table_name == Property.__tablename__, ChangeLog.seq > curseur, ChangeLog.row_id <= id_max
+        ).scalar()
+        age = (datetime.utcnow() - datetime.fromisoformat(modele.meta['entraine_le'])).total_seconds()
+        if age > self.app.config['AVM_AGE_MAX'] or (premier is not None and premier > curseur + 1) \
+                or modifiees + modele.lignes_incrementales > self.app.config['AVM_REENTRAINEMENT'] * modele.base[3]:
+            self._reentrainer_en_arriere_plan()
+        return modele
+
+    def _reentrainer_en_arriere_plan(self):
+        if self._tache is not None and self._tache.is_alive():
+            return
+        self._tache = threading.Thread(target=self._reentrainer, args=(self.app,), name='avm-entrainement',
+                                       daemon=True)
+        self._tache.start()
+
+    def _reentrainer(self, app):
+        with app.app_context(), self._verrou_fichier(bloquant=False) as obtenu:
+            if obtenu:
+                try:
+                    self.entrainer()
+                except ModeleIndisponible:
+                    pass
+
+moteur_avm = MoteurAVM()
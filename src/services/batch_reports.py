@@ -0,0 +1,142 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import insert
+from src.models.user import db
+from src.models.property import Property
+from src.models.neighborhood import Neighborhood
+from src.models.report import Report, ReportBatch, compresser_contenu
+from src.services.data_version import incrementer_version
+from src.services.market_stats import colonnes_aggregats, ligne_vers_aggregats
+from src.services.report_rendering import rendre_fichier
+import json
+import time
+
+# Types de rapports générés chaque mois pour chaque zone de farming
+TYPES_RAPPORTS_MENSUELS = [
+    ('analyse_marche', 'Rapport de Marché'),
+    ('prediction_quartier', 'Prédictions Immobilières'),
+    ('profil_acquereurs', 'Profils d\'Acquéreurs')
+]
+
+def periode_courante():
+    """Période mensuelle courante au format AAAA-MM"""
+    return datetime.utcnow().strftime('%Y-%m')
+
+def agreger_par_ville():
+    """Statistiques de marché de toutes les villes, en un seul parcours de chaque table"""
+    lignes = db.session.query(Property.city, *colonnes_aggregats()) \
+        .group_by(Property.city).all()
+
+    # Les 5 premiers quartiers de chaque ville, comme pour un rapport unitaire
+    quartiers_par_ville = {}
+    for quartier in Neighborhood.query.order_by(Neighborhood.city, Neighborhood.id):
+        quartiers = quartiers_par_ville.setdefault(quartier.city, [])
+        if len(quartiers) < 5:
+            quartiers.append(quartier.to_dict())
+
+    aggregats = {}
+    for ligne in lignes:
+        aggregats[ligne[0]] = ligne_vers_aggregats(ligne[0], ligne[1:], quartiers_par_ville.get(ligne[0], []))
+
+    # Villes connues uniquement par leurs quartiers
+    vide = (0, 0, None, None, None, None, None, None)
+    for ville, quartiers in quartiers_par_ville.items():
+        if ville not in aggregats:
+            aggregats[ville] = ligne_vers_aggregats(ville, vide, quartiers)
+
+    return aggregats
+
+def construire_rapports_ville(tache):
+    """Construire et compresser les rapports mensuels d'une ville (exécuté dans un processus fils)"""
+    from src.routes.report import (construire_rapport_marche, construire_rapport_prediction,
+                                   construire_rapport_profils)
+
+    ville, aggregats, periode, dossier_pdf = tache
+    constructeurs = {
+        'analyse_marche': construire_rapport_marche,
+        'prediction_quartier': construire_rapport_prediction,
+        'profil_acquereurs': construire_rapport_profils
+    }
+
+    rapports = []
+    for report_type, intitule in TYPES_RAPPORTS_MENSUELS:
+        contenu = json.dumps(constructeurs[report_type](ville, aggregats), ensure_ascii=False)
+        compresse, taille = compresser_contenu(contenu)
+        rapports.append({
+            'title': f'{intitule} - {ville} ({periode})',
+            'report_type': report_type,
+            'location': ville,
+            'content_compressed': compresse,
+            'content_size': taille,
+            'file_path': rendre_fichier(dossier_pdf, contenu, 'pdf') if dossier_pdf else None
+        })
+    return rapports
+
+def executer_batch(periode=None, user_id=1, workers=None, taille_lot=50, dossier_pdf=None):
+    """Générer les rapports mensuels de toutes les villes, avec reprise après interruption"""
+    periode = periode or periode_courante()
+    batch = ReportBatch.query.filter_by(period=periode).first()
+    if batch and batch.status == 'completed':
+        return batch
+    if batch is None:
+        batch = ReportBatch(period=periode, user_id=user_id)
+        db.session.add(batch)
+    batch.status = 'running'
+    batch.error = None
+    db.session.commit()
+
+    debut = time.perf_counter()
+    try:
+        aggregats = agreger_par_ville()
+
+        # Reprise : les villes déjà écrites par une exécution précédente sont ignorées
+        deja_faites = {ligne[0] for ligne in db.session.query(Report.location)
+                       .filter(Report.batch_id == batch.id).distinct()}
+        taches = [(ville, aggregats[ville], periode, dossier_pdf) for ville in sorted(aggregats) if ville not in deja_faites]
+        batch.locations_total = len(aggregats)
+        batch.locations_done = len(deja_faites)
+        db.session.commit()
+
+        if workers == 1:
+            resultats = map(construire_rapports_ville, taches)
+            _ecrire_resultats(batch, resultats, taille_lot)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executeur:
+                resultats = executeur.map(construire_rapports_ville, taches, chunksize=max(1, taille_lot // 4))
+                _ecrire_resultats(batch, resultats, taille_lot)
+
+        batch.status = 'completed'
+        batch.finished_at = datetime.utcnow()
+    except Exception as erreur:
+        db.session.rollback()
+        batch.status = 'error'
+        batch.error = str(erreur)
+        raise
+    finally:
+        batch.duration_seconds = (batch.duration_seconds or 0) + time.perf_counter() - debut
+        batch.throughput = round(batch.reports_created / batch.duration_seconds, 2) if batch.duration_seconds else None
+        db.session.commit()
+
+    return batch
+
+def _ecrire_resultats(batch, resultats, taille_lot):
+    """Insérer les rapports en masse, un commit par lot de villes"""
+    lot = []
+    villes_du_lot = 0
+    for rapports in resultats:
+        for rapport in rapports:
+            rapport.update(batch_id=batch.id, user_id=batch.user_id, status='completed')
+        lot.extend(rapports)
+        villes_du_lot += 1
+        if villes_du_lot >= taille_lot:
+            _inserer_lot(batch, lot, villes_du_lot)
+            lot, villes_du_lot = [], 0
+    if lot:
+        _inserer_lot(batch, lot, villes_du_lot)
+
+def _inserer_lot(batch, lot, villes_du_lot):
+    db.session.execute(insert(Report), lot)
+    batch.locations_done += villes_du_lot
+    batch.reports_created = (batch.reports_created or 0) + len(lot)
+    db.session.commit()
+    incrementer_version(Report.__tablename__)
@@ -0,0 +1,262 @@
+from datetime import date, datetime
+from sqlalchemy import bindparam, delete, or_, select, update
+from src.models.user import db
+from src.services.change_feed import journaliser
+from src.services.data_version import incrementer_version
+
+MAX_LIGNES = 10000  # lignes par requête en mode liste
+TAILLE_LOT_IDS = 500  # identifiants par clause IN
+TENTATIVES = 3  # relectures des versions quand un autre écrivain passe entre lecture et écriture
+
+class ModificationConcurrente(Exception):
+    """Les lignes ont encore changé entre la lecture des versions et l'écriture après plusieurs tentatives"""
+
+class EcritureMasse:
+    """Mises à jour et suppressions en masse d'un modèle versionné (colonne `version`).
+
+    Deux formes sont acceptées :
+    - une liste de lignes `[{"id": 1, "version": 3, "champ": valeur}, ...]`, où `version`
+      (facultative) est contrôlée ligne par ligne ; les lignes qui partagent les mêmes
+      champs sont écrites par un seul UPDATE exécuté en executemany ;
+    - un filtre `{"filter": {...}, "set": {...}}`, appliqué par un seul UPDATE ensembliste
+      qui ne touche que les lignes dont une valeur change.
+
+    Tout est écrit dans une transaction, journalisé pour /api/changes, et `recalcul`
+    n'est appelé que pour les lignes dont un champ de `champs_surveilles` a changé.
+    Avec `partitions` (PartitionsVentes), les lignes archivées visées sont ramenées dans
+    la table du modèle avant l'écriture, puis rangées à nouveau avant le commit.
+    """
+
+    def __init__(self, modele, champs, filtrables=(), champs_surveilles=(), recalcul=None, partitions=None):
+        self.modele = modele
+        self.table = modele.__table__
+        self.champs = tuple(champs)
+        self.filtrables = set(self.champs) | set(filtrables)
+        self.champs_surveilles = set(champs_surveilles)
+        self.recalcul = recalcul
+        self.partitions = partitions
+
+    # Validation
+
+    def _valeur(self, champ, valeur):
+        """Valeur JSON convertie au type de la colonne (ValueError si invalide)"""
+        if valeur is None:
+            if not self.table.c[champ].nullable:
+                raise ValueError(f"{champ} ne peut pas être nul")
+            return None
+        type_python = self.table.c[champ].type.python_type
+        try:
+            if type_python in (date, datetime):
+                valeur = datetime.fromisoformat(valeur)
+                return valeur.date() if type_python is date else valeur
+            if type_python in (int, float) and isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+                return type_python(valeur)
+            if type_python is str and isinstance(valeur, str):
+                return valeur
+        except (TypeError, ValueError):
+            pass
+        raise ValueError(f"Valeur invalide pour {champ} : {valeur!r}")
+
+    def _valeurs(self, donnees):
+        inconnus = [champ for champ in donnees if champ not in self.champs]
+        if inconnus:
+            raise ValueError(f"Champs non modifiables : {', '.join(inconnus)}")
+        return {champ: self._valeur(champ, valeur) for champ, valeur in donnees.items()}
+
+    def _lignes(self, donnees, champs_requis=True):
+        if not isinstance(donnees, list) or not donnees:
+            raise ValueError('Liste de lignes requise')
+        if len(donnees) > MAX_LIGNES:
+            raise ValueError(f'Au plus {MAX_LIGNES} lignes par requête')
+        lignes, vus = [], set()
+        for element in donnees:
+            if isinstance(element, int) and not isinstance(element, bool) and not champs_requis:
+                element = {'id': element}
+            if not isinstance(element, dict) or not isinstance(element.get('id'), int):
+                raise ValueError('Chaque ligne doit avoir un id entier')
+            element = dict(element)
+            ligne_id = element.pop('id')
+            version = element.pop('version', None)
+            if version is not None and not isinstance(version, int):
+                raise ValueError(f'Version invalide pour la ligne {ligne_id}')
+            if ligne_id in vus:
+                raise ValueError(f'Ligne {ligne_id} en double')
+            vus.add(ligne_id)
+            valeurs = self._valeurs(element)
+            if champs_requis and not valeurs:
+                raise ValueError(f'Aucun champ à modifier pour la ligne {ligne_id}')
+            lignes.append((ligne_id, version, valeurs))
+        return lignes
+
+    def _filtre(self, filtre, table=None):
+        """Clauses du filtre sur la table du modèle, ou sur une table de même schéma"""
+        if not isinstance(filtre, dict) or not filtre:
+            raise ValueError('Filtre requis (objet non vide)')
+        table = self.table if table is None else table
+        clauses = []
+        for cle, valeur in filtre.items():
+            if cle == 'ids':
+                if not isinstance(valeur, list) or not all(isinstance(i, int) for i in valeur) \
+                        or len(valeur) > MAX_LIGNES:
+                    raise ValueError(f'ids : liste d\'au plus {MAX_LIGNES} entiers attendue')
+                clauses.append(table.c.id.in_(valeur))
+            elif cle[:4] in ('min_', 'max_') and cle[4:] in self.filtrables:
+                colonne = table.c[cle[4:]]
+                borne = self._valeur(cle[4:], valeur)
+                clauses.append(colonne >= borne if cle.startswith('min_') else colonne <= borne)
+            elif cle in self.filtrables:
+                colonne = table.c[cle]
+                clauses.append(colonne.is_(None) if valeur is None else colonne == self._valeur(cle, valeur))
+            else:
+                raise ValueError(f'Filtre inconnu : {cle}')
+        return clauses
+
+    # Écriture
+
+    def _versions(self, ids, champs=()):
+        """Version courante (et champs demandés) des lignes existantes parmi `ids`, archivées comprises"""
+        colonnes = [self.table.c.id, self.table.c.version] + [self.table.c[champ] for champ in champs]
+        existantes = {}
+        a_lire = ids
+        while a_lire:
+            for debut in range(0, len(a_lire), TAILLE_LOT_IDS):
+                lot = a_lire[debut:debut + TAILLE_LOT_IDS]
+                for ligne in db.session.execute(select(*colonnes).where(self.table.c.id.in_(lot))):
+                    existantes[ligne.id] = ligne
+            absentes = [ligne_id for ligne_id in a_lire if ligne_id not in existantes]
+            a_lire = self.partitions.rechauffer(absentes) if self.partitions is not None and absentes else []
+        return existantes
+
+    def _terminer(self, modifiees, operation, lues=()):
+        """Recalcul, rangement des lignes `lues` dans leur partition, journal et commit ;
+        renvoie le nombre de lignes recalculées"""
+        recalculees = 0
+        if operation == 'update' and self.recalcul and modifiees['a_recalculer']:
+            self.recalcul(modifiees['a_recalculer'])
+            recalculees = len(modifiees['a_recalculer'])
+        if self.partitions is not None:
+            self.partitions.ranger(lues)
+        journaliser(self.table.name, modifiees['ids'], operation)
+        db.session.commit()
+        incrementer_version(self.table.name)
+        return recalculees
+
+    def mettre_a_jour(self, donnees):
+        """Appliquer une liste de mises à jour partielles"""
+        lignes = self._lignes(donnees)
+        champs_lus = sorted({champ for _, _, valeurs in lignes for champ in valeurs} & self.champs_surveilles)
+        for _ in range(TENTATIVES):
+            existantes = self._versions([ligne_id for ligne_id, _, _ in lignes], champs_lus)
+            introuvables = [ligne_id for ligne_id, _, _ in lignes if ligne_id not in existantes]
+            conflits = [{'id': ligne_id, 'version': existantes[ligne_id].version} for ligne_id, version, _ in lignes
+                        if ligne_id in existantes and version is not None and version != existantes[ligne_id].version]
+            exclues = set(introuvables) | {conflit['id'] for conflit in conflits}
+            a_ecrire = [ligne for ligne in lignes if ligne[0] not in exclues]
+
+            # Un UPDATE par forme de ligne (champs modifiés, version contrôlée ou non), en executemany
+            groupes = {}
+            for ligne_id, version, valeurs in a_ecrire:
+                parametres = {f'v_{champ}': valeur for champ, valeur in valeurs.items()}
+                parametres['b_id'] = ligne_id
+                if version is not None:
+                    parametres['b_version'] = version
+                groupes.setdefault((tuple(sorted(valeurs)), version is not None), []).append(parametres)
+            ecrites = 0
+            for (champs, avec_version), parametres in groupes.items():
+                requete = update(self.table).where(self.table.c.id == bindparam('b_id')) \
+                    .values({champ: bindparam(f'v_{champ}') for champ in champs})
+                if avec_version:
+                    requete = requete.where(self.table.c.version == bindparam('b_version'))
+                ecrites += db.session.connection().execute(requete, parametres).rowcount
+            if ecrites != len(a_ecrire):
+                # Un autre écrivain a modifié des lignes depuis la lecture des versions : on relit
+                db.session.rollback()
+                continue
+
+            a_recalculer = [ligne_id for ligne_id, _, valeurs in a_ecrire
+                            if any(getattr(existantes[ligne_id], champ) != valeur
+                                   for champ, valeur in valeurs.items() if champ in self.champs_surveilles)]
+            ids = [ligne_id for ligne_id, _, _ in a_ecrire]
+            recalculees = self._terminer({'ids': ids, 'a_recalculer': a_recalculer}, 'update', list(existantes))
+            return {'updated': len(ids), 'conflicts': conflits, 'not_found': introuvables,
+                    'recomputed': recalculees}
+        raise ModificationConcurrente()
+
+    def mettre_a_jour_filtre(self, filtre, valeurs):
+        """Appliquer les mêmes valeurs à toutes les lignes du filtre"""
+        clauses = self._filtre(filtre)
+        if not isinstance(valeurs, dict) or not valeurs:
+            raise ValueError('Valeurs à appliquer requises (set)')
+        valeurs = self._valeurs(valeurs)
+
+        def differe(champs):
+            return or_(*(self.table.c[champ].is_not(valeurs[champ]) for champ in champs))
+
+        connexion = db.session.connection()
+        rechauffees = []
+        if self.partitions is not None:
+            rechauffees = self.partitions.rechauffer(clauses=lambda table: self._filtre(filtre, table))
+        a_recalculer = []
+        surveilles = [champ for champ in valeurs if champ in self.champs_surveilles]
+        if surveilles:
+            # D'abord les lignes dont une entrée du recalcul change, pour ne recalculer qu'elles
+            a_recalculer = connexion.execute(update(self.table).where(*clauses, differe(surveilles))
+                                             .values(valeurs).returning(self.table.c.id)).scalars().all()
+        autres = connexion.execute(update(self.table).where(*clauses, differe(valeurs))
+                                   .values(valeurs).returning(self.table.c.id)).scalars().all()
+        ids = a_recalculer + autres
+        recalculees = self._terminer({'ids': ids, 'a_recalculer': a_recalculer}, 'update', rechauffees + ids)
+        return {'updated': len(ids), 'conflicts': [], 'not_found': [], 'recomputed': recalculees}
+
+    def supprimer(self, donnees):
+        """Supprimer une liste de lignes (`[id, ...]` ou `[{"id", "version"}, ...]`)"""
+        lignes = self._lignes(donnees, champs_requis=False)
+        for _ in range(TENTATIVES):
+            existantes = self._versions([ligne_id for ligne_id, _, _ in lignes])
+            introuvables = [ligne_id for ligne_id, _, _ in lignes if ligne_id not in existantes]
+            conflits = [{'id': ligne_id, 'version': existantes[ligne_id].version} for ligne_id, version, _ in lignes
+                        if ligne_id in existantes and version is not None and version != existantes[ligne_id].version]
+            exclues = set(introuvables) | {conflit['id'] for conflit in conflits}
+            a_supprimer = [(ligne_id, version) for ligne_id, version, _ in lignes if ligne_id not in exclues]
+
+            supprimees = 0
+            connexion = db.session.connection()
+            sans_version = [{'b_id': ligne_id} for ligne_id, version in a_supprimer if version is None]
+            avec_version = [{'b_id': ligne_id, 'b_version': version} for ligne_id, version in a_supprimer
+                            if version is not None]
+            requete = delete(self.table).where(self.table.c.id == bindparam('b_id'))
+            if sans_version:
+                supprimees += connexion.execute(requete, sans_version).rowcount
+            if avec_version:
+                supprimees += connexion.execute(requete.where(self.table.c.version == bindparam('b_version')),
+                                                avec_version).rowcount
+            if supprimees != len(a_supprimer):
+                db.session.rollback()
+                continue
+
+            ids = [ligne_id for ligne_id, _ in a_supprimer]
+            self._terminer({'ids': ids}, 'delete', [conflit['id'] for conflit in conflits])
+            return {'deleted': len(ids), 'conflicts': conflits, 'not_found': introuvables}
+        raise ModificationConcurrente()
+
+    def supprimer_filtre(self, filtre):
+        """Supprimer toutes les lignes du filtre"""
+        clauses = self._filtre(filtre)
+        if self.partitions is not None:
+            self.partitions.rechauffer(clauses=lambda table: self._filtre(filtre, table))
+        ids = db.session.connection().execute(delete(self.table).where(*clauses)
+                                              .returning(self.table.c.id)).scalars().all()
+        self._terminer({'ids': ids}, 'delete')
+        return {'deleted': len(ids), 'conflicts': [], 'not_found': []}
+
+    def patch(self, donnees):
+        """Corps d'un PATCH : liste de lignes ou {"filter", "set"}"""
+        if isinstance(donnees, dict) and 'filter' in donnees:
+            return self.mettre_a_jour_filtre(donnees['filter'], donnees.get('set'))
+        return self.mettre_a_jour(donnees)
+
+    def suppression(self, donnees):
+        """Corps d'un DELETE : liste d'identifiants ou {"filter"}"""
+        if isinstance(donnees, dict) and 'filter' in donnees:
+            return self.supprimer_filtre(donnees['filter'])
+        return self.supprimer(donnees)
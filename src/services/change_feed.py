@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, insert
+from sqlalchemy.orm import Session
+from src.models.user import db
+from src.models.change_log import ChangeLog
+from src.models.lead import Lead
+from src.models.neighborhood import Neighborhood
+from src.models.property import Property
+from src.services.partitions import partitions_ventes
+import threading
+
+# Tables publiées dans le flux de modifications : nom de table -> modèle
+TABLES_SUIVIES = {
+    'property': Property,
+    'lead': Lead,
+    'neighborhood': Neighborhood,
+}
+
+class FluxChangements:
+    """Flux de modifications des tables suivies, lu par curseur (seq du journal).
+
+    Le journal est alimenté dans la transaction de l'écriture (événement after_flush),
+    donc une modification n'apparaît dans le flux qu'une fois commitée. SQLite
+    n'acceptant qu'un écrivain à la fois, les seq sont visibles dans l'ordre : un
+    client qui a lu jusqu'à N ne peut pas manquer une entrée < N commitée plus tard.
+
+    Les lecteurs en attente (long-poll) sont réveillés à chaque commit de ce
+    processus ; les commits des autres processus sont vus par sondage.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._condition = threading.Condition()
+        self._generation = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHANGES_LIMITE_DEFAUT', 500)
+        app.config.setdefault('CHANGES_LIMITE_MAX', 5000)
+        app.config.setdefault('CHANGES_ATTENTE_MAX', 30)  # secondes de long-poll au plus
+        app.config.setdefault('CHANGES_INTERVALLE_SONDAGE', 1.0)  # secondes : commits des autres processus
+        app.config.setdefault('CHANGES_RETENTION_JOURS', 30)
+        self.app = app
+        app.extensions['flux_changements'] = self
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def notifier(self):
+        """Réveiller les lecteurs en attente après un commit"""
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def attendre(self, generation, delai):
+        """Attendre un commit postérieur à `generation` (au plus `delai` secondes)"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._generation != generation, timeout=delai)
+
+    def curseur_courant(self):
+        """Dernier seq du journal (0 si vide) : point de départ d'une synchronisation"""
+        return db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+
+    def curseur_minimal(self):
+        """Plus petit curseur encore servi ; en deçà, des entrées ont été purgées"""
+        premier = db.session.query(func.min(ChangeLog.seq)).scalar()
+        return premier - 1 if premier else 0
+
+    def lire(self, depuis, tables, limite):
+        """Modifications postérieures au curseur `depuis`.
+
+        Renvoie (changements, curseur suivant, reste des entrées). Une ligne modifiée
+        plusieurs fois dans le lot n'apparaît qu'une fois, avec son état courant ;
+        une ligne absente de la base est publiée comme supprimée.
+        """
+        entrees = ChangeLog.query.with_entities(ChangeLog.seq, ChangeLog.table_name, ChangeLog.row_id,
+                                                ChangeLog.operation) \
+            .filter(ChangeLog.seq > depuis, ChangeLog.table_name.in_(tables)) \
+            .order_by(ChangeLog.seq).limit(limite + 1).all()
+        reste = len(entrees) > limite
+        entrees = entrees[:limite]
+        if not entrees:
+            return [], depuis, False
+
+        dernieres = {}
+        for seq, table, row_id, operation in entrees:
+            dernieres.pop((table, row_id), None)  # réinsérée en fin : ordre de la dernière modification
+            dernieres[(table, row_id)] = (seq, operation)
+
+        lignes = {}
+        for table in tables:
+            ids = [row_id for (nom, row_id), (_, operation) in dernieres.items() if nom == table and operation != 'delete']
+            if ids:
+                modele = TABLES_SUIVIES[table]
+                lignes[table] = {ligne.id: ligne for ligne in modele.query.filter(modele.id.in_(ids))}
+                absentes = [row_id for row_id in ids if row_id not in lignes[table]]
+                if modele is Property and absentes:
+                    # Biens modifiés puis rendus aux archives (services/partitions.py)
+                    lignes[table].update(partitions_ventes.trouver_archives(absentes))
+
+        changements = []
+        for (table, row_id), (seq, operation) in dernieres.items():
+            ligne = lignes.get(table, {}).get(row_id) if operation != 'delete' else None
+            changement = {'seq': seq, 'table': table, 'id': row_id,
+                          'operation': operation if ligne is not None else 'delete'}
+            if ligne is not None:
+                changement['data'] = ligne.to_dict()
+            changements.append(changement)
+        return changements, entrees[-1][0], reste
+
+    def purger(self, jours=None):
+        """Supprimer les entrées plus anciennes que la rétention ; renvoie le nombre d'entrées supprimées"""
+        jours = self.app.config['CHANGES_RETENTION_JOURS'] if jours is None else jours
+        limite = datetime.utcnow() - timedelta(days=jours)
+        dernier = self.curseur_courant()
+        # La dernière entrée est conservée : le curseur minimal reste connu même si rien ne change
+        supprimees = ChangeLog.query.filter(ChangeLog.created_at < limite, ChangeLog.seq < dernier) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return supprimees
+
+flux_changements = FluxChangements()
+
+def journaliser(table, ids, operation='update'):
+    """Journaliser des écritures faites hors unité de travail ORM (insertions et upserts en masse).
+
+    À appeler dans la transaction de l'écriture, avant le commit.
+    """
+    if table not in TABLES_SUIVIES or not ids:
+        return
+    maintenant = datetime.utcnow()
+    db.session.connection().execute(insert(ChangeLog.__table__), [
+        {'table_name': table, 'row_id': row_id, 'operation': operation, 'created_at': maintenant} for row_id in ids])
+    db.session.info['changements_journalises'] = True
+
+@event.listens_for(Session, 'after_flush')
+def _journaliser_flush(session, flush_context):
+    """Ajouter au journal, dans la même transaction, les lignes suivies écrites par le flush"""
+    maintenant = datetime.utcnow()
+    lignes = []
+    for operation, objets in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objets:
+            if obj.__table__.name not in TABLES_SUIVIES:
+                continue
+            if operation == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+            lignes.append({'table_name': obj.__table__.name, 'row_id': obj.id, 'operation': operation,
+                           'created_at': maintenant})
+    if lignes:
+        session.connection().execute(insert(ChangeLog.__table__), lignes)
+        session.info['changements_journalises'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _reveiller_lecteurs(session):
+    if session.info.pop('changements_journalises', None):
+        flux_changements.notifier()
+
+@event.listens_for(Session, 'after_rollback')
+def _oublier_changements(session):
+    session.info.pop('changements_journalises', None)
@@ -0,0 +1,263 @@
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.user import db
+from src.models.chat import ChatSession, ChatTurn
+import atexit
+import json
+import threading
+import time
+
+class EtatSession:
+    """État en mémoire d'une conversation active (empreinte bornée : pas d'historique)"""
+
+    __slots__ = ('session_id', 'contexte', 'nb_messages', 'lead_id', 'vu_le')
+
+    def __init__(self, session_id, contexte=None, nb_messages=0, lead_id=None):
+        self.session_id = session_id
+        self.contexte = contexte or {}
+        self.nb_messages = nb_messages
+        self.lead_id = lead_id
+        self.vu_le = time.monotonic()
+
+class SessionStore:
+    """Sessions du chatbot : cache LRU+TTL en mémoire, persistance différée par lots en base"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._sessions = OrderedDict()
+        self._tours_a_ecrire = []
+        self._tours_en_ecriture = []
+        self._sessions_a_ecrire = {}
+        self._sessions_en_ecriture = {}
+        self._verrou = threading.Lock()
+        self._verrou_ecriture = threading.Lock()
+        self._reveil = threading.Event()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHATBOT_SESSION_TTL', 1800)  # secondes d'inactivité
+        app.config.setdefault('CHATBOT_SESSION_MAX', 50000)  # sessions actives en mémoire
+        app.config.setdefault('CHATBOT_FLUSH_SIZE', 200)  # tours en attente avant écriture
+        app.config.setdefault('CHATBOT_FLUSH_INTERVAL', 2.0)  # secondes entre deux écritures
+        self.app = app
+        app.extensions['chat_sessions'] = self
+        atexit.register(self.vider)
+
+    def obtenir(self, session_id):
+        """État d'une session, depuis la mémoire ou à défaut depuis la base
+
+        Sans affinité de session, le tour précédent a pu être traité par un autre worker :
+        un état en mémoire n'est réutilisé que si la base ne connaît pas plus de messages.
+        """
+        maintenant = time.monotonic()
+        with self._verrou:
+            etat = self._sessions.get(session_id)
+            if etat is not None:
+                if maintenant - etat.vu_le <= self.app.config['CHATBOT_SESSION_TTL']:
+                    etat.vu_le = maintenant
+                    self._sessions.move_to_end(session_id)
+                else:
+                    del self._sessions[session_id]
+                    etat = None
+        if etat is not None:
+            persistes = db.session.query(ChatSession.nb_messages).filter_by(session_id=session_id).scalar()
+            if (persistes or 0) <= etat.nb_messages:
+                return etat
+
+        # Session inconnue, expirée ou plus ancienne que la base : état le plus avancé entre
+        # l'écriture en attente de ce worker et la ligne persistée
+        with self._verrou:
+            en_attente = self._sessions_a_ecrire.get(session_id) or self._sessions_en_ecriture.get(session_id)
+        ligne = ChatSession.query.filter_by(session_id=session_id).first()
+        if ligne is not None and (en_attente is None or (ligne.nb_messages or 0) > en_attente['nb_messages']):
+            etat = EtatSession(session_id, json.loads(ligne.contexte or '{}'), ligne.nb_messages or 0,
+                               ligne.lead_id)
+        elif en_attente is not None:
+            etat = EtatSession(session_id, json.loads(en_attente['contexte']), en_attente['nb_messages'],
+                               en_attente['lead_id'])
+        else:
+            etat = EtatSession(session_id)
+
+        with self._verrou:
+            self._sessions[session_id] = etat
+            self._evincer(maintenant)
+        return etat
+
+    def enregistrer_tour(self, etat, contexte, message, intention, reponse):
+        """Mettre à jour la session et planifier l'écriture du tour de conversation"""
+        maintenant = datetime.utcnow()
+        with self._verrou:
+            etat.contexte = contexte
+            etat.nb_messages += 1
+            etat.vu_le = time.monotonic()
+            self._tours_a_ecrire.append({
+                'session_id': etat.session_id,
+                'message': message,
+                'intention': intention,
+                'reponse': reponse,
+                'created_at': maintenant
+            })
+            # Instantané sérialisé : une session évincée de la mémoire n'est jamais perdue
+            self._sessions_a_ecrire[etat.session_id] = {
+                'session_id': etat.session_id,
+                'contexte': json.dumps(contexte, ensure_ascii=False),
+                'nb_messages': etat.nb_messages,
+                'lead_id': etat.lead_id,
+                'statut': 'qualifie' if etat.lead_id else 'en_cours',
+                'created_at': maintenant,
+                'updated_at': maintenant
+            }
+            en_attente = len(self._tours_a_ecrire)
+        self._demarrer()
+        if en_attente >= self.app.config['CHATBOT_FLUSH_SIZE']:
+            self._reveil.set()
+
+    def associer_lead(self, etat, lead_id):
+        """Rattacher à la session un lead écrit après l'enregistrement du tour"""
+        with self._verrou:
+            etat.lead_id = lead_id
+            instantane = self._sessions_a_ecrire.get(etat.session_id)
+            if instantane is None:
+                instantane = {
+                    'session_id': etat.session_id,
+                    'contexte': json.dumps(etat.contexte, ensure_ascii=False),
+                    'nb_messages': etat.nb_messages,
+                    'created_at': datetime.utcnow()
+                }
+                self._sessions_a_ecrire[etat.session_id] = instantane
+            instantane.update(lead_id=lead_id, statut='qualifie', updated_at=datetime.utcnow())
+        self._demarrer()
+
+    def vider(self):
+        """Écrire en base les tours et sessions en attente"""
+        with self._verrou_ecriture:
+            with self._verrou:
+                self._tours_en_ecriture, self._tours_a_ecrire = self._tours_a_ecrire, []
+                tours = self._tours_en_ecriture
+                self._sessions_en_ecriture, self._sessions_a_ecrire = self._sessions_a_ecrire, {}
+                sessions = list(self._sessions_en_ecriture.values())
+            if not tours and not sessions:
+                return
+
+            try:
+                with self.app.app_context():
+                    if sessions:
+                        requete = sqlite_insert(ChatSession)
+                        # Un instantané n'écrase jamais une session déjà plus avancée (autre worker)
+                        db.session.execute(requete.on_conflict_do_update(
+                            index_elements=['session_id'],
+                            set_={colonne: requete.excluded[colonne]
+                                  for colonne in ('contexte', 'nb_messages', 'lead_id', 'statut', 'updated_at')},
+                            where=ChatSession.nb_messages <= requete.excluded.nb_messages
+                        ), sessions)
+                    if tours:
+                        db.session.execute(insert(ChatTurn), tours)
+                    db.session.commit()
+            except Exception:
+                # Remise en file pour la prochaine écriture, sans écraser un état plus récent
+                with self._verrou:
+                    self._tours_a_ecrire[:0] = tours
+                    for session in sessions:
+                        self._sessions_a_ecrire.setdefault(session['session_id'], session)
+                    self._sessions_en_ecriture, self._tours_en_ecriture = {}, []
+                raise
+            finally:
+                with self._verrou:
+                    self._sessions_en_ecriture = {}
+                    self._tours_en_ecriture = []
+
+    def lister(self, page=1, par_page=20):
+        """Sessions de la plus récente à la plus ancienne : celles de la base, complétées par les
+        écritures en attente (sans les forcer : une lecture n'échoue pas avec l'écriture différée)"""
+        en_attente = self._sessions_en_attente()
+        requete = ChatSession.query.order_by(ChatSession.updated_at.desc())
+        if en_attente:
+            requete = requete.filter(ChatSession.session_id.notin_([session.session_id for session in en_attente]))
+        total = requete.count() + len(en_attente)
+        debut, fin = (page - 1) * par_page, page * par_page
+
+        # Fusion de deux listes triées : seules les lignes de la base voisines de la page sont lues
+        decalage = max(debut - len(en_attente), 0)
+        persistees = requete.offset(decalage).limit(fin - decalage).all()
+        if decalage and persistees:
+            limite = persistees[0].updated_at
+            origine = decalage + sum(session.updated_at > limite for session in en_attente)
+            en_attente = [session for session in en_attente if session.updated_at <= limite]
+        else:
+            origine = 0
+        fusion = sorted(persistees + en_attente, key=lambda session: session.updated_at, reverse=True)
+        return fusion[debut - origine:fin - origine], total
+
+    def conversation(self, session_id):
+        """Session et tours d'une conversation, écritures en attente comprises (None si inconnue)"""
+        with self._verrou:
+            instantane = self._sessions_a_ecrire.get(session_id) or self._sessions_en_ecriture.get(session_id)
+            tours_en_attente = [tour for tour in self._tours_en_ecriture + self._tours_a_ecrire
+                                if tour['session_id'] == session_id]
+        session = ChatSession.query.filter_by(session_id=session_id).first()
+        if instantane is not None:
+            session = _session_en_attente(instantane, session)
+        if session is None:
+            return None
+        tours = ChatTurn.query.filter_by(session_id=session_id).order_by(ChatTurn.id).all()
+        # Un lot peut avoir été écrit entre la copie des tours en attente et la requête
+        ecrits = {(tour.created_at, tour.message) for tour in tours}
+        tours += [ChatTurn(**tour) for tour in tours_en_attente if (tour['created_at'], tour['message']) not in ecrits]
+        return session, tours
+
+    def _sessions_en_attente(self):
+        """Sessions pas encore écrites en base, en objets détachés, de la plus récente à la plus ancienne"""
+        with self._verrou:
+            instantanes = {**self._sessions_en_ecriture, **self._sessions_a_ecrire}
+        if not instantanes:
+            return []
+        existantes = {ligne.session_id: ligne for ligne in
+                      db.session.query(ChatSession.session_id, ChatSession.id, ChatSession.created_at)
+                      .filter(ChatSession.session_id.in_(list(instantanes)))}
+        sessions = [_session_en_attente(instantane, existantes.get(session_id))
+                    for session_id, instantane in instantanes.items()]
+        return sorted(sessions, key=lambda session: session.updated_at, reverse=True)
+
+    def _evincer(self, maintenant):
+        """Retirer de la mémoire les sessions expirées puis les moins récemment utilisées"""
+        ttl = self.app.config['CHATBOT_SESSION_TTL']
+        while self._sessions:
+            etat = next(iter(self._sessions.values()))
+            if maintenant - etat.vu_le <= ttl and len(self._sessions) <= self.app.config['CHATBOT_SESSION_MAX']:
+                break
+            self._sessions.popitem(last=False)
+
+    def _demarrer(self):
+        """Démarrer le thread d'écriture différée à la première écriture"""
+        if self._thread is None:
+            with self._verrou:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._boucle, name='chat-sessions-writer', daemon=True)
+                    self._thread.start()
+
+    def _boucle(self):
+        while True:
+            self._reveil.wait(self.app.config['CHATBOT_FLUSH_INTERVAL'])
+            self._reveil.clear()
+            try:
+                self.vider()
+                with self._verrou:
+                    self._evincer(time.monotonic())
+            except Exception:
+                self.app.logger.exception("Échec de l'écriture des sessions du chatbot")
+
+def _session_en_attente(instantane, ligne):
+    """Session détachée (jamais ajoutée à db.session) depuis une écriture en attente"""
+    colonnes = ('session_id', 'contexte', 'nb_messages', 'lead_id', 'statut', 'updated_at')
+    session = ChatSession(**{colonne: instantane.get(colonne) for colonne in colonnes})
+    if ligne is not None:
+        session.id, session.created_at = ligne.id, ligne.created_at
+    else:
+        session.created_at = instantane.get('created_at')
+    return session
+
+session_store = SessionStore()
@@ -0,0 +1,134 @@
+from flask import request
+import re
+import zlib
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : gzip et deflate restent proposés
+    brotli = None
+
+# Types compressés : JSON, NDJSON et texte. Le flux SSE du chatbot est exclu : certains
+# proxys et clients EventSource retiennent les évènements d'un flux compressé
+TYPES_COMPRESSIBLES = re.compile(r'^(text/(?!event-stream)|application/(json|x-ndjson|javascript|xml))')
+
+# Encodages proposés, par ordre de préférence à qualité égale dans Accept-Encoding
+ENCODAGES = ('br', 'gzip', 'deflate')
+
+class Compresseur:
+    """Compression incrémentale d'un encodage HTTP (gzip, deflate au format zlib, br)"""
+
+    def __init__(self, encodage, niveau, niveau_brotli):
+        self.encodage = encodage
+        if encodage == 'br':
+            self._brotli = brotli.Compressor(quality=niveau_brotli)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(niveau, zlib.DEFLATED, zlib.MAX_WBITS | (16 if encodage == 'gzip' else 0))
+
+    def compresser(self, donnees, vider=False):
+        """Octets compressés disponibles ; `vider` les force à sortir (réponses en streaming)"""
+        if self._brotli is not None:
+            return self._brotli.process(donnees) + (self._brotli.flush() if vider else b'')
+        return self._zlib.compress(donnees) + (self._zlib.flush(zlib.Z_SYNC_FLUSH) if vider else b'')
+
+    def terminer(self):
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+class CompressionReponses:
+    """Compression des réponses de l'API selon Accept-Encoding (br, gzip, deflate).
+
+    Les réponses d'un type compressible (JSON, NDJSON, texte) d'au moins
+    COMPRESSION_MIN octets sont compressées au niveau COMPRESSION_NIVEAU
+    (COMPRESSION_NIVEAU_BROTLI pour br, si le module brotli est installé). Les
+    réponses en streaming sont compressées morceau par morceau, chaque morceau étant
+    vidé aussitôt pour que le client le reçoive sans attendre la fin du flux.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESSION_ACTIVE', True)
+        app.config.setdefault('COMPRESSION_MIN', 1024)  # octets : en dessous, l'en-tête gzip coûte plus qu'il ne gagne
+        app.config.setdefault('COMPRESSION_NIVEAU', 6)  # zlib, 1 (rapide) à 9 (compact)
+        app.config.setdefault('COMPRESSION_NIVEAU_BROTLI', 4)  # 0 à 11 ; au-delà de 5, trop lent pour du dynamique
+        self.app = app
+        app.extensions['compression_reponses'] = self
+        # Enregistré après les autres extensions : exécuté en premier parmi les after_request,
+        # les métriques mesurent donc la taille compressée
+        app.after_request(self._compresser)
+
+    def encodages(self):
+        """Encodages disponibles, par ordre de préférence"""
+        return tuple(encodage for encodage in ENCODAGES if encodage != 'br' or brotli is not None)
+
+    def negocier(self, accept_encodings):
+        """Encodage retenu pour un en-tête Accept-Encoding analysé (None : pas de compression)"""
+        meilleur, qualite_max = None, 0
+        for encodage in self.encodages():
+            qualite = accept_encodings[encodage]
+            if qualite > qualite_max:
+                meilleur, qualite_max = encodage, qualite
+        return meilleur
+
+    def compresseur(self, encodage):
+        return Compresseur(encodage, self.app.config['COMPRESSION_NIVEAU'], self.app.config['COMPRESSION_NIVEAU_BROTLI'])
+
+    def _eligible(self, reponse):
+        if not self.app.config['COMPRESSION_ACTIVE'] or request.method == 'HEAD':
+            return False
+        if reponse.status_code < 200 or reponse.status_code in (204, 206, 304):
+            return False
+        if reponse.direct_passthrough or 'Content-Encoding' in reponse.headers:
+            return False  # fichiers envoyés tels quels, variantes statiques déjà compressées
+        if 'no-transform' in reponse.headers.get('Cache-Control', ''):
+            return False
+        return bool(TYPES_COMPRESSIBLES.match(reponse.mimetype or ''))
+
+    def _compresser(self, reponse):
+        if not self._eligible(reponse):
+            return reponse
+        if not reponse.is_streamed and (reponse.calculate_content_length() or 0) < self.app.config['COMPRESSION_MIN']:
+            return reponse
+
+        # La représentation dépend désormais d'Accept-Encoding, même pour un client qui n'en veut pas
+        reponse.vary.add('Accept-Encoding')
+        encodage = self.negocier(request.accept_encodings)
+        if encodage is None:
+            return reponse
+        compresseur = self.compresseur(encodage)
+
+        if reponse.is_streamed:
+            reponse.response = _flux_compresse(reponse.iter_encoded(), reponse.response, compresseur)
+            reponse.headers.pop('Content-Length', None)
+        else:
+            donnees = reponse.get_data()
+            compresse = compresseur.compresser(donnees) + compresseur.terminer()
+            if len(compresse) >= len(donnees):
+                return reponse
+            reponse.set_data(compresse)
+        reponse.headers['Content-Encoding'] = encodage
+        etag, faible = reponse.get_etag()
+        if etag:
+            reponse.set_etag(f'{etag}-{encodage}', faible)  # ETag distinct par représentation
+        return reponse
+
+def _flux_compresse(morceaux, source, compresseur):
+    """Morceaux compressés d'une réponse en streaming ; ferme l'itérable d'origine (contextes Flask)"""
+    try:
+        for morceau in morceaux:
+            if morceau:
+                sortie = compresseur.compresser(morceau, vider=True)
+                if sortie:
+                    yield sortie
+        yield compresseur.terminer()
+    finally:
+        fermer = getattr(source, 'close', None)
+        if fermer is not None:
+            fermer()
+
+compression_reponses = CompressionReponses()
@@ -0,0 +1,334 @@
+from datetime import date
+from sqlalchemy import func, select
+from src.models.user import db
+from src.models.change_log import ChangeLog
+from src.models.property import Property
+from src.services.bulk_updates import TAILLE_LOT_IDS
+from src.services.partitions import partitions_ventes
+from src.services.property_snapshot import DATE_ABSENTE, EPOQUE
+import copy
+import heapq
+import math
+import numpy as np
+import threading
+
+# Dimensions des caractéristiques, dans l'ordre des colonnes de l'arbre
+DIMENSIONS = ('x_km', 'y_km', 'surface', 'rooms', 'anciennete')
+
+# Écarts jugés équivalents par défaut : 2 km ~ 25 % de surface ~ 1 pièce ~ 2 ans d'ancienneté
+ECHELLES_PAR_DEFAUT = {'distance_km': 2.0, 'surface': 0.25, 'rooms': 1.0, 'anciennete_jours': 730}
+KM_PAR_DEGRE = 111.32
+SURFACE_PAR_PIECE = 25.0  # m² : nombre de pièces supposé quand il est inconnu
+# Projection équirectangulaire à latitude fixe (France métropolitaine) : une latitude par point
+# fausserait les écarts est-ouest ; l'erreur reste sous 7 % entre Marseille et Lille
+COSINUS_REFERENCE = math.cos(math.radians(46.5))
+
+class ArbreKD:
+    """Arbre k-d équilibré sur des points (n, d), feuilles contiguës pour un calcul vectorisé.
+
+    Les nœuds sont stockés dans des listes Python (accès scalaires bien plus rapides
+    que l'indexation numpy) ; `ordre[i]` est l'indice d'origine du i-ème point rangé.
+    """
+
+    def __init__(self, points, taille_feuille=64):
+        n = len(points)
+        ordre = np.arange(n)
+        self.axes, self.seuils, self.enfants, self.plages = [], [], [], []
+        pile = [(0, n, None, 0)] if n else []
+        while pile:
+            debut, fin, parent, cote = pile.pop()
+            noeud = len(self.axes)
+            if parent is not None:
+                self.enfants[parent][cote] = noeud
+            self.plages.append((debut, fin))
+            self.enfants.append([-1, -1])
+            if fin - debut <= taille_feuille:
+                self.axes.append(-1)
+                self.seuils.append(0.0)
+                continue
+            bloc = points[ordre[debut:fin]]
+            axe = int(np.argmax(bloc.max(axis=0) - bloc.min(axis=0)))
+            milieu = (debut + fin) // 2
+            partition = np.argpartition(bloc[:, axe], milieu - debut)
+            ordre[debut:fin] = ordre[debut:fin][partition]
+            self.axes.append(axe)
+            self.seuils.append(float(points[ordre[milieu], axe]))
+            pile.append((milieu, fin, noeud, 1))
+            pile.append((debut, milieu, noeud, 0))
+        self.ordre = ordre
+        self.points = np.ascontiguousarray(points[ordre])
+
+    def voisins(self, requete, poids, k, exclus=None):
+        """k plus proches points (distance euclidienne pondérée) : liste de (distance², position rangée)"""
+        meilleurs = []  # tas de (-distance², position)
+        if not self.axes:
+            return []
+        points, axes, seuils, enfants, plages = self.points, self.axes, self.seuils, self.enfants, self.plages
+        requete_liste, poids_liste = requete.tolist(), poids.tolist()
+
+        def visiter(noeud):
+            axe = axes[noeud]
+            if axe < 0:
+                debut, fin = plages[noeud]
+                distances = ((points[debut:fin] - requete) ** 2 * poids).sum(axis=1)
+                if exclus is not None:
+                    distances[exclus[debut:fin]] = np.inf
+                if len(meilleurs) == k:
+                    candidats = np.flatnonzero(distances < -meilleurs[0][0])
+                else:
+                    candidats = np.arange(len(distances))
+                if len(candidats) > k:
+                    candidats = candidats[np.argpartition(distances[candidats], k - 1)[:k]]
+                for position in candidats.tolist():
+                    distance = float(distances[position])
+                    if distance == math.inf:
+                        continue
+                    if len(meilleurs) < k:
+                        heapq.heappush(meilleurs, (-distance, debut + position))
+                    elif distance < -meilleurs[0][0]:
+                        heapq.heapreplace(meilleurs, (-distance, debut + position))
+                return
+            ecart = requete_liste[axe] - seuils[noeud]
+            proche, loin = enfants[noeud] if ecart < 0 else enfants[noeud][::-1]
+            visiter(proche)
+            if len(meilleurs) < k or poids_liste[axe] * ecart * ecart < -meilleurs[0][0]:
+                visiter(loin)
+
+        visiter(0)
+        return sorted((-distance, position) for distance, position in meilleurs)
+
+class IndexType:
+    """Ventes d'un type de bien : arbre k-d de la génération de base, lignes retirées depuis
+    (modifiées ou supprimées) et lignes ajoutées ou modifiées, cherchées par force brute"""
+
+    def __init__(self, valeurs, caracteristiques, taille_feuille):
+        self.arbre = ArbreKD(caracteristiques, taille_feuille)
+        self.valeurs = {nom: tableau[self.arbre.ordre] for nom, tableau in valeurs.items()}
+        self.exclus = np.zeros(len(caracteristiques), dtype=bool)
+        self.delta_valeurs = None
+        self.delta_points = None
+
+class MoteurComparables:
+    """Recherche de ventes comparables (« comps ») pour l'estimation d'un bien.
+
+    Les ventes utilisables (coordonnées, surface, prix et date de vente connus) de
+    l'instantané en colonnes sont projetées sur DIMENSIONS, chaque écart étant divisé
+    par son échelle (COMPS_ECHELLES) : la distance euclidienne combine ainsi proximité,
+    surface (en rapport logarithmique), pièces et ancienneté de la vente. Un arbre k-d
+    par type de bien répond aux requêtes.
+
+    Les écritures sont suivies par le journal des modifications : les lignes modifiées
+    depuis la construction des arbres en sont retirées et cherchées à part, jusqu'à ce
+    qu'elles dépassent COMPS_RECONSTRUCTION des ventes, où les arbres sont reconstruits.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._colonnes = None  # génération de l'instantané prise en compte
+        self._curseur_base = None  # curseur du journal à la construction des arbres
+        self._index = {}
+        self._base = None  # (ids triés, type, position rangée) des lignes des arbres
+        self._verrou = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPS_ECHELLES', ECHELLES_PAR_DEFAUT)
+        app.config.setdefault('COMPS_K_MAX', 50)
+        app.config.setdefault('COMPS_LOT_MAX', 1000)  # biens par requête du mode lot
+        app.config.setdefault('COMPS_TAILLE_FEUILLE', 64)
+        app.config.setdefault('COMPS_RECONSTRUCTION', 0.05)  # part de lignes modifiées avant reconstruction
+        self.app = app
+        self._colonnes = None
+        self._index = {}
+        app.extensions['moteur_comparables'] = self
+
+    # Caractéristiques
+
+    def echelles(self):
+        echelles = self.app.config['COMPS_ECHELLES']
+        return np.array([echelles['distance_km'], echelles['distance_km'], echelles['surface'], echelles['rooms'],
+                         echelles['anciennete_jours']], dtype=np.float64)
+
+    def caracteristiques(self, latitude, longitude, surface, rooms, jour_vente):
+        """Points (n, 5) normalisés ; pièces inconnues (< 0) supposées d'après la surface"""
+        rooms = np.where(rooms >= 0, rooms, np.maximum(1.0, np.round(surface / SURFACE_PAR_PIECE)))
+        points = np.column_stack([
+            longitude * COSINUS_REFERENCE * KM_PAR_DEGRE,
+            latitude * KM_PAR_DEGRE,
+            np.log(surface),
+            rooms.astype(np.float64),
+            # Ancienneté mesurée depuis l'origine : la requête se place au jour courant
+            jour_vente.astype(np.float64),
+        ])
+        return points / self.echelles()
+
+    def _ventes(self, colonnes, selection=None):
+        """Valeurs (dictionnaire de tableaux) et points des ventes utilisables de l'instantané"""
+        prix, surface = colonnes['price'], colonnes['surface']
+        utilisables = (prix > 0) & (surface > 0) & (colonnes['sale_date'] != DATE_ABSENTE) \
+            & ~np.isnan(colonnes['latitude']) & ~np.isnan(colonnes['longitude'])
+        if selection is not None:
+            utilisables &= selection
+        valeurs = {nom: colonnes[nom][utilisables] for nom in
+                   ('id', 'price', 'surface', 'rooms', 'sale_date', 'latitude', 'longitude', 'property_type')}
+        valeurs['type'] = np.array(colonnes.types, dtype=object)[valeurs.pop('property_type')] \
+            if len(valeurs['id']) else np.array([], dtype=object)
+        points = self.caracteristiques(valeurs['latitude'], valeurs['longitude'], valeurs['surface'],
+                                       valeurs['rooms'], valeurs['sale_date'])
+        return valeurs, points
+
+    # Index
+
+    def index(self, colonnes):
+        """Index à jour pour la génération `colonnes` de l'instantané"""
+        if colonnes is self._colonnes:
+            return self._index
+        with self._verrou:
+            if colonnes is not self._colonnes:
+                if not self._mettre_a_jour(colonnes):
+                    self._construire(colonnes)
+                self._colonnes = colonnes
+            return self._index
+
+    def _construire(self, colonnes):
+        valeurs, points = self._ventes(colonnes)
+        index, ids, types, positions = {}, [], [], []
+        for numero, nom in enumerate(sorted(set(valeurs['type'].tolist()))):
+            selection = valeurs['type'] == nom
+            index[nom] = IndexType({cle: tableau[selection] for cle, tableau in valeurs.items()},
+                                   points[selection], self.app.config['COMPS_TAILLE_FEUILLE'])
+            ids.append(index[nom].valeurs['id'])
+            types.append(np.full(len(index[nom].valeurs['id']), numero))
+            positions.append(np.arange(len(index[nom].valeurs['id'])))
+        if ids:
+            ids, types, positions = np.concatenate(ids), np.concatenate(types), np.concatenate(positions)
+            tri = np.argsort(ids, kind='stable')
+            self._base = (ids[tri], types[tri], positions[tri], sorted(index))
+        else:
+            self._base = (np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.int64), [])
+        self._index = index
+        self._curseur_base = colonnes.curseur
+
+    def _mettre_a_jour(self, colonnes):
+        """Appliquer les lignes journalisées depuis la construction ; False si une reconstruction s'impose"""
+        if self._colonnes is None or self._curseur_base is None or colonnes.curseur < self._curseur_base:
+            return False
+        premier = db.session.query(func.min(ChangeLog.seq)).scalar()
+        if premier is None or premier > self._curseur_base + 1:
+            return False  # journal purgé au-delà du curseur des arbres
+        ids = np.array(sorted(row_id for (row_id,) in db.session.query(ChangeLog.row_id).filter(
+            ChangeLog.seq > self._curseur_base, ChangeLog.seq <= colonnes.curseur,
+            ChangeLog.table_name == Property.__tablename__).distinct()), dtype=np.int64)
+        ids_base, types_base, positions_base, noms = self._base
+        if len(ids) > max(1000, len(ids_base) * self.app.config['COMPS_RECONSTRUCTION']):
+            return False
+
+        # Nouvelles vues des index (les requêtes en cours gardent les anciennes) : lignes des arbres
+        # modifiées depuis la construction retirées, leur état courant cherché par force brute
+        index = {nom: copy.copy(index_type) for nom, index_type in self._index.items()}
+        for index_type in index.values():
+            index_type.exclus = np.zeros(len(index_type.exclus), dtype=bool)
+            index_type.delta_valeurs = index_type.delta_points = None
+        if len(ids_base) and len(ids):
+            rangs = np.searchsorted(ids_base, ids).clip(0, len(ids_base) - 1)
+            presents = ids_base[rangs] == ids
+            for numero, nom in enumerate(noms):
+                du_type = presents & (types_base[rangs] == numero)
+                index[nom].exclus[positions_base[rangs[du_type]]] = True
+
+        rangs = np.searchsorted(colonnes['id'], ids).clip(0, max(colonnes.lignes - 1, 0))
+        selection = np.zeros(colonnes.lignes, dtype=bool)
+        if colonnes.lignes and len(ids):
+            selection[rangs[colonnes['id'][rangs] == ids]] = True
+        valeurs, points = self._ventes(colonnes, selection)
+        for nom in set(valeurs['type'].tolist()):
+            if nom not in index:
+                return False  # nouveau type de bien : il lui faut son arbre
+            du_type = valeurs['type'] == nom
+            index[nom].delta_valeurs = {cle: tableau[du_type] for cle, tableau in valeurs.items()}
+            index[nom].delta_points = points[du_type]
+        self._index = index
+        return True
+
+    # Recherche
+
+    def chercher(self, colonnes, latitude, longitude, surface, rooms=None, property_type=None, k=10):
+        """k ventes les plus semblables au bien décrit, triées par distance combinée croissante"""
+        index = self.index(colonnes)
+        aujourd_hui = date.today().toordinal() - EPOQUE
+        requete = self.caracteristiques(np.array([latitude]), np.array([longitude]), np.array([surface]),
+                                        np.array([rooms if rooms is not None else -1]), np.array([aujourd_hui]))[0]
+        poids = np.ones(len(DIMENSIONS))
+        if rooms is None:
+            poids[DIMENSIONS.index('rooms')] = 0.0
+        types = [property_type] if property_type else list(index)
+
+        candidats = []
+        for nom in types:
+            index_type = index.get(nom)
+            if index_type is None:
+                continue
+            for distance, position in index_type.arbre.voisins(requete, poids, k, index_type.exclus):
+                candidats.append((distance, index_type.valeurs, position))
+            if index_type.delta_points is not None and len(index_type.delta_points):
+                distances = ((index_type.delta_points - requete) ** 2 * poids).sum(axis=1)
+                for position in np.argsort(distances)[:k].tolist():
+                    candidats.append((float(distances[position]), index_type.delta_valeurs, position))
+        candidats.sort(key=lambda candidat: candidat[0])
+
+        comparables = []
+        for distance, valeurs, position in candidats[:k]:
+            latitude_vente = float(valeurs['latitude'][position])
+            longitude_vente = float(valeurs['longitude'][position])
+            jour_vente = int(valeurs['sale_date'][position])
+            comparables.append({
+                'id': int(valeurs['id'][position]),
+                'property_type': valeurs['type'][position],
+                'price': float(valeurs['price'][position]),
+                'surface': float(valeurs['surface'][position]),
+                'rooms': int(valeurs['rooms'][position]) if valeurs['rooms'][position] >= 0 else None,
+                'sale_date': date.fromordinal(jour_vente + EPOQUE).isoformat(),
+                'latitude': latitude_vente,
+                'longitude': longitude_vente,
+                'distance_km': round(distance_km(latitude, longitude, latitude_vente, longitude_vente), 3),
+                'age_days': aujourd_hui - jour_vente,
+                'similarity': round(1 / (1 + math.sqrt(distance)), 4),
+            })
+        return comparables
+
+def distance_km(latitude, longitude, latitude_b, longitude_b):
+    """Distance approchée (projection équirectangulaire), suffisante à l'échelle d'une ville"""
+    x = math.radians(longitude_b - longitude) * math.cos(math.radians((latitude + latitude_b) / 2))
+    y = math.radians(latitude_b - latitude)
+    return 6371.0 * math.hypot(x, y)
+
+def synthese(comparables, surface):
+    """Prix au m² pondéré par la similarité et valeur qu'il implique pour `surface`"""
+    poids = sum(comparable['similarity'] for comparable in comparables)
+    if not poids:
+        return {'weighted_price_m2': None, 'estimated_price': None}
+    prix_m2 = sum(comparable['similarity'] * comparable['price'] / comparable['surface']
+                  for comparable in comparables) / poids
+    return {'weighted_price_m2': round(prix_m2, 2), 'estimated_price': round(prix_m2 * surface, -2)}
+
+def completer(comparables):
+    """Adresse, ville et code postal des comparables, par lots d'identifiants (table chaude et archives)"""
+    ids = sorted({comparable['id'] for comparable in comparables})
+    if not ids:
+        return comparables
+    biens = partitions_ventes.source(historique=True)
+    lignes = {}
+    # Lots bornés : un lot de 1 000 biens × 50 comparables dépasserait la limite de variables de SQLite
+    for debut in range(0, len(ids), TAILLE_LOT_IDS):
+        lot = ids[debut:debut + TAILLE_LOT_IDS]
+        lignes.update((ligne.id, ligne) for ligne in db.session.execute(
+            select(biens.c.id, biens.c.address, biens.c.city, biens.c.postal_code).where(biens.c.id.in_(lot))))
+    for comparable in comparables:
+        ligne = lignes.get(comparable['id'])
+        comparable['address'] = ligne.address if ligne else None
+        comparable['city'] = ligne.city if ligne else None
+        comparable['postal_code'] = ligne.postal_code if ligne else None
+    return comparables
+
+moteur_comparables = MoteurComparables()
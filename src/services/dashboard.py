@@ -0,0 +1,169 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import case, func, select
+from src.models.user import db
+from src.models.lead import Lead
+from src.models.neighborhood import Neighborhood
+from src.models.property import Property
+from src.models.report import Report
+from src.services.data_version import version_donnees
+from src.services.partitions import partitions_ventes
+import threading
+import time
+
+TTL_PAR_DEFAUT = 30  # secondes : délai maximal pour voir les écritures des autres processus
+TAILLE_MAX_CACHE = 1024
+TABLES = (Lead.__tablename__, Property.__tablename__, Neighborhood.__tablename__, Report.__tablename__)
+
+_cache = {}
+_verrou = threading.Lock()
+_verrou_executeur = threading.Lock()
+
+def statistiques_leads():
+    """Statistiques des leads (format de /leads/stats) en une requête groupée"""
+    score = func.nullif(Lead.score, 0)
+    lignes = db.session.query(Lead.status, Lead.lead_type, func.count(Lead.id), func.sum(score), func.count(score),
+                              func.sum(case((Lead.score > 7, 1), else_=0))) \
+        .group_by(Lead.status, Lead.lead_type).all()
+
+    by_status, by_type = {}, {}
+    total = somme_scores = nb_scores = scores_eleves = 0
+    for statut, type_lead, nombre, somme, nb, eleves in lignes:
+        by_status[statut] = by_status.get(statut, 0) + nombre
+        by_type[type_lead] = by_type.get(type_lead, 0) + nombre
+        total += nombre
+        somme_scores += somme or 0
+        nb_scores += nb
+        scores_eleves += eleves or 0
+    return {
+        'total_leads': total,
+        'by_status': by_status,
+        'by_type': by_type,
+        'average_score': round(somme_scores / nb_scores, 2) if nb_scores else 0,
+        'high_score_leads': scores_eleves
+    }
+
+def statistiques_proprietes(city=None, date_min=None, date_max=None, historique=False):
+    """Statistiques des propriétés (format de /properties/stats) en une requête groupée par type.
+
+    Seule la table chaude est lue, sauf si les dates de vente ou `historique` demandent les archives.
+    """
+    biens = partitions_ventes.source(date_min, date_max, historique)
+    prix = func.nullif(biens.c.price, 0)
+    prix_m2 = prix / func.nullif(biens.c.surface, 0)
+    requete = select(biens.c.property_type, func.count(biens.c.id), func.sum(prix), func.count(prix),
+                     func.sum(prix_m2), func.count(prix_m2))
+    if city:
+        requete = requete.where(biens.c.city.ilike(f'%{city}%'))
+    if date_min:
+        requete = requete.where(biens.c.sale_date >= date_min)
+    if date_max:
+        requete = requete.where(biens.c.sale_date <= date_max)
+
+    property_types = {}
+    total = somme_prix = nb_prix = somme_m2 = nb_m2 = 0
+    for type_bien, nombre, somme, nb, somme_metre, nb_metre in db.session.execute(requete.group_by(biens.c.property_type)):
+        property_types[type_bien] = nombre
+        total += nombre
+        somme_prix += somme or 0
+        nb_prix += nb
+        somme_m2 += somme_metre or 0
+        nb_m2 += nb_metre
+    return {
+        'total_properties': total,
+        'average_price': round(somme_prix / nb_prix, 2) if nb_prix else 0,
+        'average_price_m2': round(somme_m2 / nb_m2, 2) if nb_m2 else 0,
+        'property_types': property_types
+    }
+
+def quartiers_et_cartographie(score_min=None):
+    """Liste des quartiers (format de /quartiers?score_min=) et cartographie, depuis une seule lecture"""
+    from src.routes.neighborhood import point_cartographie
+
+    quartiers = Neighborhood.query.order_by(Neighborhood.potential_score.desc()).all()
+    liste = [quartier.to_dict() for quartier in quartiers
+             if not score_min or (quartier.potential_score is not None and quartier.potential_score >= score_min)]
+    carte = [point_cartographie(quartier) for quartier in sorted(quartiers, key=lambda quartier: quartier.id)
+             if quartier.latitude and quartier.longitude]
+    return liste, carte
+
+def rapports_utilisateur(user_id, limite):
+    """Derniers rapports d'un utilisateur (métadonnées) et leur nombre total"""
+    requete = Report.query.filter(Report.user_id == user_id) if user_id else Report.query
+    total = requete.with_entities(func.count(Report.id)).scalar()
+    rapports = requete.order_by(Report.created_at.desc()).limit(limite).all()
+    return {'total': total, 'derniers': [rapport.to_dict(include_content=False) for rapport in rapports]}
+
+def executeur(app):
+    """Pool de threads des parties indépendantes du tableau de bord, créé à la première utilisation"""
+    pool = app.extensions.get('dashboard_executeur')
+    if pool is None:
+        with _verrou_executeur:
+            pool = app.extensions.get('dashboard_executeur')
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=app.config.get('DASHBOARD_WORKERS', 3),
+                                          thread_name_prefix='dashboard')
+                app.extensions['dashboard_executeur'] = pool
+    return pool
+
+def _dans_contexte(app, fonction, *arguments):
+    # Contexte d'application propre au thread : session et connexion SQLite dédiées
+    with app.app_context():
+        return fonction(*arguments)
+
+def calculer_tableau_de_bord(user_id=None, score_min=None, city=None, limite_rapports=20):
+    """Tableau de bord complet. Les statistiques des leads, des propriétés et les rapports
+    sont calculés en parallèle pendant que le thread de la requête lit les quartiers."""
+    app = current_app._get_current_object()
+    if app.config.get('DASHBOARD_WORKERS', 3) > 0:
+        pool = executeur(app)
+        leads = pool.submit(_dans_contexte, app, statistiques_leads)
+        proprietes = pool.submit(_dans_contexte, app, statistiques_proprietes, city)
+        rapports = pool.submit(_dans_contexte, app, rapports_utilisateur, user_id, limite_rapports)
+        quartiers, carte = quartiers_et_cartographie(score_min)
+        leads, proprietes, rapports = leads.result(), proprietes.result(), rapports.result()
+    else:
+        leads, proprietes = statistiques_leads(), statistiques_proprietes(city)
+        rapports = rapports_utilisateur(user_id, limite_rapports)
+        quartiers, carte = quartiers_et_cartographie(score_min)
+    return {
+        'user_id': user_id,
+        'leads': leads,
+        'properties': proprietes,
+        'quartiers': quartiers,
+        'cartographie': carte,
+        'rapports': rapports,
+        'generated_at': datetime.utcnow().isoformat()
+    }
+
+def tableau_de_bord(user_id=None, score_min=None, city=None, limite_rapports=20):
+    """Tableau de bord mémorisé par paramètres et par version des tables lues.
+
+    Toute écriture de ce processus sur l'une des tables change la clé ; celles des
+    autres processus sont visibles au plus tard après DASHBOARD_TTL secondes.
+    """
+    cle = (user_id, score_min, (city or '').casefold(), limite_rapports, version_donnees(*TABLES))
+    maintenant = time.monotonic()
+
+    with _verrou:
+        entree = _cache.get(cle)
+        if entree and entree[0] > maintenant:
+            return entree[1]
+
+    resultat = calculer_tableau_de_bord(user_id, score_min, city, limite_rapports)
+    ttl = current_app.config.get('DASHBOARD_TTL', TTL_PAR_DEFAUT)
+
+    with _verrou:
+        if len(_cache) >= TAILLE_MAX_CACHE:
+            # Les entrées les plus anciennes sont en tête du dictionnaire
+            for ancienne_cle in list(_cache)[:TAILLE_MAX_CACHE // 4]:
+                del _cache[ancienne_cle]
+        _cache[cle] = (maintenant + ttl, resultat)
+
+    return resultat
+
+def vider_cache():
+    """Vider le cache du tableau de bord"""
+    with _verrou:
+        _cache.clear()
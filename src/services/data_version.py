@@ -0,0 +1,36 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import itertools
+import threading
+
+# Compteurs de version par table, incrémentés à chaque commit qui modifie la table
+_versions = {}
+_verrou = threading.Lock()
+
+def version_donnees(*tables):
+    """Obtenir la version courante des données pour une ou plusieurs tables"""
+    return tuple(_versions.get(table, 0) for table in tables)
+
+def incrementer_version(*tables):
+    """Signaler une modification des tables (écritures hors ORM, imports en masse...)"""
+    with _verrou:
+        for table in tables:
+            _versions[table] = _versions.get(table, 0) + 1
+
+@event.listens_for(Session, 'after_flush')
+def _noter_tables_modifiees(session, flush_context):
+    """Mémoriser les tables touchées par le flush jusqu'au commit"""
+    tables = session.info.setdefault('tables_modifiees', set())
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        tables.add(obj.__table__.name)
+
+@event.listens_for(Session, 'after_commit')
+def _publier_versions(session):
+    """Incrémenter les versions une fois les données visibles des autres lecteurs"""
+    tables = session.info.pop('tables_modifiees', None)
+    if tables:
+        incrementer_version(*tables)
+
+@event.listens_for(Session, 'after_rollback')
+def _oublier_tables_modifiees(session):
+    session.info.pop('tables_modifiees', None)
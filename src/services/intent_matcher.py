@@ -0,0 +1,114 @@
+import codecs
+import unicodedata
+
+# Caractères non ASCII conservés après pliage (les autres, émojis compris, sont ignorés)
+_REMPLACEMENTS_NON_ASCII = {'œ': 'oe', 'æ': 'ae', '’': "'", '€': '\x01'}
+
+def _pliage_erreur(erreur):
+    """Gestionnaire d'encodage : remplace les caractères que NFKD ne ramène pas à l'ASCII"""
+    morceau = erreur.object[erreur.start:erreur.end]
+    return ''.join(_REMPLACEMENTS_NON_ASCII.get(c, '') for c in morceau), erreur.end
+
+codecs.register_error('ferme_immo_pliage', _pliage_erreur)
+
+def plier_accents(texte):
+    """Mettre un texte en minuscules sans accents ('Marché' -> 'marche')"""
+    if texte.isascii():
+        return texte.lower()
+    decompose = unicodedata.normalize('NFKD', texte.lower())
+    return decompose.encode('ascii', 'ferme_immo_pliage').decode('ascii')
+
+class MatcheurIntentions:
+    """Automate d'Aho-Corasick sur les mots-clés de toutes les intentions.
+
+    L'automate est compilé une seule fois ; une analyse parcourt le message en une
+    seule passe et retrouve tous les mots-clés présents, y compris imbriqués.
+    """
+
+    __slots__ = ('intentions', 'transitions', 'sorties')
+
+    def __init__(self, intentions_mots_cles):
+        self.intentions = list(intentions_mots_cles)
+
+        # Poids d'un mot-clé : nombre de mots (plus spécifique), partagé entre
+        # les intentions qui l'utilisent ('prix' compte pour moitié dans chacune)
+        proprietaires = {}
+        for index, mots_cles in enumerate(intentions_mots_cles.values()):
+            for mot in mots_cles:
+                proprietaires.setdefault(plier_accents(mot), set()).add(index)
+
+        transitions = [{}]
+        sorties = [()]
+        for mot, intentions in proprietaires.items():
+            etat = 0
+            for caractere in mot:
+                suivant = transitions[etat].get(caractere)
+                if suivant is None:
+                    transitions.append({})
+                    sorties.append(())
+                    suivant = len(transitions) - 1
+                    transitions[etat][caractere] = suivant
+                etat = suivant
+            poids = len(mot.split()) / len(intentions)
+            sorties[etat] = tuple((mot, index, poids) for index in sorted(intentions))
+
+        # Liens d'échec (parcours en largeur), puis déterminisation : chaque état
+        # connaît directement sa transition pour tout caractère de l'alphabet
+        echecs = [0] * len(transitions)
+        alphabet = {c for etat in transitions for c in etat}
+        file_attente = list(transitions[0].values())
+        ordre = []
+        while file_attente:
+            etat = file_attente.pop(0)
+            ordre.append(etat)
+            for caractere, suivant in transitions[etat].items():
+                repli = echecs[etat]
+                while repli and caractere not in transitions[repli]:
+                    repli = echecs[repli]
+                cible = transitions[repli].get(caractere, 0)
+                echecs[suivant] = cible if cible != suivant else 0
+                sorties[suivant] = sorties[suivant] + sorties[echecs[suivant]]
+                file_attente.append(suivant)
+
+        for etat in ordre:
+            repli = transitions[echecs[etat]]
+            for caractere in alphabet:
+                if caractere not in transitions[etat] and caractere in repli:
+                    transitions[etat][caractere] = repli[caractere]
+
+        self.transitions = transitions
+        self.sorties = sorties
+
+    def mots_trouves(self, message):
+        """Tous les mots-clés présents dans le message, avec leurs intentions"""
+        transitions = self.transitions
+        sorties = self.sorties
+        trouves = []
+        etat = 0
+        for caractere in plier_accents(message):
+            etat = transitions[etat].get(caractere, 0)
+            if sorties[etat]:
+                trouves.extend(sorties[etat])
+        return trouves
+
+    def classer(self, message):
+        """Intentions présentes dans le message, triées par score décroissant"""
+        scores = {}
+        vus = set()
+        for mot, index, poids in self.mots_trouves(message):
+            if (mot, index) not in vus:
+                vus.add((mot, index))
+                scores[index] = scores.get(index, 0.0) + poids
+        if not scores:
+            return []
+
+        total = sum(scores.values())
+        # À score égal, l'ordre de déclaration des intentions départage
+        classement = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [{'intention': self.intentions[index], 'score': round(score / total, 3)}
+                for index, score in classement]
+
+    def meilleure(self, message, defaut='autre'):
+        """Intention la plus probable du message"""
+        classement = self.classer(message)
+        return classement[0]['intention'] if classement else defaut
@@ -0,0 +1,102 @@
+from flask import current_app
+from sqlalchemy import func
+from src.models.user import db
+from src.models.change_log import ChangeLog
+from src.models.property import Property
+from src.models.neighborhood import Neighborhood
+from src.services.data_version import version_donnees
+import threading
+import time
+
+TTL_PAR_DEFAUT = 300  # secondes
+TAILLE_MAX_CACHE = 1024
+
+_cache = {}
+_verrou = threading.Lock()
+
+def normaliser_localisation(location):
+    """Normaliser une localisation (espaces, casse) pour la clé de cache"""
+    return ' '.join((location or '').split())
+
+def agreger_marche(location):
+    """Statistiques de marché d'une localisation, mémorisées par version des données"""
+    terme = normaliser_localisation(location)
+    # La séquence du journal des modifications est commune aux workers : une écriture commitée
+    # ailleurs invalide aussi l'entrée. Le compteur local couvre les écritures hors journal (archivage)
+    sequence = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+    cle = (terme.casefold(), sequence, version_donnees(Property.__tablename__, Neighborhood.__tablename__))
+    maintenant = time.monotonic()
+    
+    with _verrou:
+        entree = _cache.get(cle)
+        if entree and entree[0] > maintenant:
+            return entree[1]
+    
+    aggregats = calculer_aggregats(terme)
+    ttl = current_app.config.get('MARKET_STATS_TTL', TTL_PAR_DEFAUT)
+    
+    with _verrou:
+        if len(_cache) >= TAILLE_MAX_CACHE:
+            # Les entrées les plus anciennes sont en tête du dictionnaire
+            for ancienne_cle in list(_cache)[:TAILLE_MAX_CACHE // 4]:
+                del _cache[ancienne_cle]
+        _cache[cle] = (maintenant + ttl, aggregats)
+    
+    return aggregats
+
+def calculer_aggregats(terme):
+    """Calculer toutes les statistiques d'une localisation en une passe SQL"""
+    motif = f'%{terme}%'
+    ligne = db.session.query(*colonnes_aggregats()).filter(Property.city.ilike(motif)).one()
+    
+    quartiers = Neighborhood.query.filter(Neighborhood.city.ilike(motif)) \
+        .order_by(Neighborhood.id).limit(5).all()
+    
+    return ligne_vers_aggregats(terme, ligne, [q.to_dict() for q in quartiers])
+
+def colonnes_aggregats():
+    """Expressions SQL des statistiques de marché, utilisables avec ou sans GROUP BY"""
+    prix = func.nullif(Property.price, 0)
+    surface = func.nullif(Property.surface, 0)
+    return [
+        func.count(Property.id),
+        func.count(prix),
+        func.avg(prix),
+        func.min(prix),
+        func.max(prix),
+        func.avg(surface),
+        func.avg(prix / surface),
+        func.max(Property.sale_date)
+    ]
+
+def ligne_vers_aggregats(terme, ligne, quartiers):
+    """Convertir une ligne de résultat de colonnes_aggregats() en dictionnaire"""
+    derniere_vente = ligne[7]
+    if derniere_vente is not None and not isinstance(derniere_vente, str):
+        derniere_vente = derniere_vente.isoformat()
+    return {
+        'location': terme,
+        'nombre_proprietes': ligne[0],
+        'nombre_prix': ligne[1],
+        'prix_moyen': ligne[2],
+        'prix_min': ligne[3],
+        'prix_max': ligne[4],
+        'surface_moyenne': ligne[5],
+        'prix_m2_moyen': ligne[6],
+        'derniere_vente': derniere_vente,
+        'quartiers': quartiers
+    }
+
+def resume_marche(aggregats):
+    """Résumé compact des statistiques, pour les rapports et l'assistant de rédaction"""
+    return {
+        'nombre_transactions': aggregats['nombre_proprietes'],
+        'prix_moyen': round(aggregats['prix_moyen'], 0) if aggregats['prix_moyen'] else None,
+        'prix_m2_moyen': round(aggregats['prix_m2_moyen'], 0) if aggregats['prix_m2_moyen'] else None,
+        'surface_moyenne': round(aggregats['surface_moyenne'], 1) if aggregats['surface_moyenne'] else None
+    }
+
+def vider_cache():
+    """Vider le cache des statistiques de marché"""
+    with _verrou:
+        _cache.clear()
@@ -0,0 +1,301 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+PREFIXE = 'ferme_immo'
+
+# Bornes des histogrammes (Prometheus : compteurs cumulés par borne supérieure)
+BORNES_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BORNES_TAILLE = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+BORNES_NB_SQL = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# Description des séries exposées : nom -> (type, aide, bornes)
+SERIES = {
+    'http_requetes_total': ('counter', 'Requêtes HTTP traitées', None),
+    'http_duree_secondes': ('histogram', 'Durée de traitement des requêtes HTTP', BORNES_DUREE),
+    'http_taille_reponse_octets': ('histogram', 'Taille des réponses HTTP (hors réponses en streaming)', BORNES_TAILLE),
+    'sql_requetes_total': ('counter', 'Instructions SQL exécutées', None),
+    'sql_duree_secondes_total': ('counter', 'Temps passé dans les instructions SQL', None),
+    'sql_par_requete': ('histogram', 'Instructions SQL par requête HTTP', BORNES_NB_SQL),
+    'sql_duree_par_requete_secondes': ('histogram', 'Temps SQL par requête HTTP', BORNES_DUREE),
+    'n_plus_un_total': ('counter', 'Requêtes HTTP répétant une même instruction SQL (motif N+1)', None),
+    'coalescence_total': ('counter', 'Calculs coûteux demandés, par issue (calculé, partagé, attente expirée)', None),
+}
+
+HORS_REQUETE = 'hors_requete'
+
+class EtatRequete:
+    """Mesures SQL de la requête HTTP en cours"""
+
+    __slots__ = ('debut', 'nb_sql', 'duree_sql', 'instructions')
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.nb_sql = 0
+        self.duree_sql = 0.0
+        self.instructions = {}
+
+class Metriques:
+    """Métriques HTTP et SQL par route, au format texte Prometheus.
+
+    Chaque processus tient ses compteurs en mémoire et en écrit un instantané dans
+    METRICS_DIR (DATA_DIR/metrics par défaut), au plus toutes les METRICS_ECRITURE_INTERVALLE
+    secondes ; l'exposition additionne les instantanés de tous les processus. METRICS_DIR
+    vide : compteurs du seul processus qui répond.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._verrou = threading.Lock()
+        self._ecoute_sql = False
+        self._reinitialiser()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_DIR', os.environ.get('FERME_IMMO_METRICS_DIR')
+                              or os.path.join(app.config['DATA_DIR'], 'metrics'))
+        app.config.setdefault('METRICS_ECRITURE_INTERVALLE', 5.0)  # secondes entre deux instantanés
+        app.config.setdefault('METRICS_RETENTION', 3600)  # secondes sans écriture avant qu'un instantané soit oublié
+        app.config.setdefault('METRICS_N_PLUS_UN_SEUIL', 10)  # exécutions d'une même instruction par requête
+        self.app = app
+        app.extensions['metriques'] = self
+        app.before_request(self._debut_requete)
+        app.after_request(self._fin_requete)
+        if not self._ecoute_sql:
+            # Évènements de tous les moteurs SQLAlchemy, branchés une seule fois
+            event.listen(Engine, 'before_cursor_execute', self._avant_execution)
+            event.listen(Engine, 'after_cursor_execute', self._apres_execution)
+            self._ecoute_sql = True
+
+    def _reinitialiser(self):
+        # Après un fork, les compteurs hérités appartiennent au processus parent
+        self._pid = os.getpid()
+        self._jeton = uuid.uuid4().hex[:8]
+        self._compteurs = {}
+        self._histogrammes = {}
+        self._n_plus_un_signales = set()
+        self._derniere_ecriture = 0.0
+
+    def _verifier_processus(self):
+        if self._pid != os.getpid():
+            with self._verrou:
+                if self._pid != os.getpid():
+                    self._reinitialiser()
+
+    def incrementer(self, nom, etiquettes, valeur=1):
+        cle = (nom, etiquettes)
+        self._compteurs[cle] = self._compteurs.get(cle, 0) + valeur
+
+    def compter(self, nom, etiquettes, valeur=1):
+        """Incrémenter un compteur depuis un autre module (verrou et processus vérifiés)"""
+        self._verifier_processus()
+        with self._verrou:
+            self.incrementer(nom, etiquettes, valeur)
+
+    def observer(self, nom, etiquettes, valeur):
+        bornes = SERIES[nom][2]
+        cle = (nom, etiquettes)
+        serie = self._histogrammes.get(cle)
+        if serie is None:
+            # Un compteur par borne, puis la somme et le nombre d'observations
+            serie = self._histogrammes[cle] = [0] * len(bornes) + [0.0, 0]
+        for index, borne in enumerate(bornes):
+            if valeur <= borne:
+                serie[index] += 1
+                break
+        serie[-2] += valeur
+        serie[-1] += 1
+
+    def _debut_requete(self):
+        g._metriques = EtatRequete()
+
+    def _fin_requete(self, response):
+        etat = g.pop('_metriques', None)
+        if etat is None:
+            return response
+        duree = time.perf_counter() - etat.debut
+        route = request.url_rule.rule if request.url_rule is not None else 'non_trouvee'
+        methode = request.method
+
+        self._verifier_processus()
+        with self._verrou:
+            self.incrementer('http_requetes_total', (route, methode, str(response.status_code)))
+            self.observer('http_duree_secondes', (route, methode), duree)
+            if not response.is_streamed:
+                self.observer('http_taille_reponse_octets', (route, methode), response.calculate_content_length() or 0)
+            self.observer('sql_par_requete', (route,), etat.nb_sql)
+            self.observer('sql_duree_par_requete_secondes', (route,), etat.duree_sql)
+
+            repetee = self._instruction_repetee(etat)
+            if repetee is not None:
+                self.incrementer('n_plus_un_total', (route,))
+                nouveau = (route, repetee[0]) not in self._n_plus_un_signales
+                self._n_plus_un_signales.add((route, repetee[0]))
+        if repetee is not None and nouveau:
+            self.app.logger.warning("N+1 probable sur %s %s : %d exécutions de « %s »",
+                                    methode, route, repetee[1], repetee[0])
+
+        self._ecrire_instantane_si_necessaire()
+        return response
+
+    def _instruction_repetee(self, etat):
+        """Instruction la plus répétée de la requête si elle dépasse le seuil N+1"""
+        if etat.nb_sql < self.app.config['METRICS_N_PLUS_UN_SEUIL']:
+            return None
+        instruction, nombre = max(etat.instructions.items(), key=lambda item: item[1])
+        return (instruction, nombre) if nombre >= self.app.config['METRICS_N_PLUS_UN_SEUIL'] else None
+
+    def _avant_execution(self, conn, cursor, statement, parameters, context, executemany):
+        # Début porté par le contexte de l'instruction : rien ne reste sur la connexion si elle échoue
+        if context is not None:
+            context.debut_metriques = time.perf_counter()
+
+    def _apres_execution(self, conn, cursor, statement, parameters, context, executemany):
+        debut = getattr(context, 'debut_metriques', None)
+        if debut is not None:
+            self.enregistrer_sql(statement, time.perf_counter() - debut)
+
+    def enregistrer_sql(self, instruction, duree):
+        """Comptabiliser une instruction SQL exécutée (appelé par les évènements du moteur)"""
+        etat = g.get('_metriques') if has_request_context() else None
+        if etat is not None:
+            etat.nb_sql += 1
+            etat.duree_sql += duree
+            etat.instructions[instruction] = etat.instructions.get(instruction, 0) + 1
+            route = request.url_rule.rule if request.url_rule is not None else 'non_trouvee'
+        else:
+            route = HORS_REQUETE
+
+        self._verifier_processus()
+        with self._verrou:
+            self.incrementer('sql_requetes_total', (route,))
+            self.incrementer('sql_duree_secondes_total', (route,), duree)
+
+    def instantane(self):
+        """Compteurs et histogrammes du processus, sérialisables en JSON"""
+        self._verifier_processus()
+        with self._verrou:
+            return {
+                'compteurs': [[nom, list(etiquettes), valeur] for (nom, etiquettes), valeur in self._compteurs.items()],
+                'histogrammes': [[nom, list(etiquettes), list(serie)]
+                                 for (nom, etiquettes), serie in self._histogrammes.items()]
+            }
+
+    def _ecrire_instantane_si_necessaire(self):
+        dossier = self.app.config['METRICS_DIR']
+        if not dossier:
+            return
+        maintenant = time.monotonic()
+        if maintenant - self._derniere_ecriture < self.app.config['METRICS_ECRITURE_INTERVALLE']:
+            return
+        self._derniere_ecriture = maintenant
+        self.ecrire_instantane(dossier)
+
+    def ecrire_instantane(self, dossier):
+        """Écrire atomiquement l'instantané du processus dans le dossier partagé"""
+        os.makedirs(dossier, exist_ok=True)
+        chemin = os.path.join(dossier, f'metriques-{os.getpid()}-{self._jeton}.json')
+        temporaire = f'{chemin}.tmp'
+        with open(temporaire, 'w', encoding='utf-8') as fichier:
+            json.dump(self.instantane(), fichier)
+        os.replace(temporaire, chemin)
+
+    def agreger(self):
+        """Instantanés de tous les processus (ou du seul processus courant), additionnés"""
+        dossier = self.app.config['METRICS_DIR']
+        if not dossier:
+            instantanes = [self.instantane()]
+        else:
+            self.ecrire_instantane(dossier)
+            instantanes = []
+            for chemin in glob.glob(os.path.join(dossier, 'metriques-*.json')):
+                try:
+                    if self._perime(chemin):
+                        os.remove(chemin)
+                        continue
+                    with open(chemin, encoding='utf-8') as fichier:
+                        instantanes.append(json.load(fichier))
+                except (OSError, ValueError):
+                    continue  # instantané en cours de remplacement, illisible ou déjà supprimé
+
+        compteurs = {}
+        histogrammes = {}
+        for instantane in instantanes:
+            for nom, etiquettes, valeur in instantane['compteurs']:
+                cle = (nom, tuple(etiquettes))
+                compteurs[cle] = compteurs.get(cle, 0) + valeur
+            for nom, etiquettes, serie in instantane['histogrammes']:
+                cle = (nom, tuple(etiquettes))
+                cumul = histogrammes.get(cle)
+                histogrammes[cle] = serie if cumul is None else [a + b for a, b in zip(cumul, serie)]
+        return compteurs, histogrammes
+
+    def _perime(self, chemin):
+        """Instantané d'un processus arrêté, ou non réécrit depuis METRICS_RETENTION secondes"""
+        pid = os.path.basename(chemin).split('-')[1]
+        if pid.isdigit() and int(pid) != os.getpid():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass  # processus vivant d'un autre utilisateur
+        return time.time() - os.path.getmtime(chemin) > self.app.config['METRICS_RETENTION']
+
+    def exposition(self):
+        """Métriques au format texte Prometheus (version 0.0.4)"""
+        compteurs, histogrammes = self.agreger()
+        lignes = []
+        for nom, (type_serie, aide, bornes) in SERIES.items():
+            nom_complet = f'{PREFIXE}_{nom}'
+            lignes.append(f'# HELP {nom_complet} {aide}')
+            lignes.append(f'# TYPE {nom_complet} {type_serie}')
+            noms_etiquettes = ETIQUETTES[nom]
+            if type_serie == 'counter':
+                for (serie_nom, etiquettes), valeur in sorted(compteurs.items()):
+                    if serie_nom == nom:
+                        lignes.append(f'{nom_complet}{{{_etiquettes(noms_etiquettes, etiquettes)}}} {_nombre(valeur)}')
+                continue
+            for (serie_nom, etiquettes), serie in sorted(histogrammes.items()):
+                if serie_nom != nom:
+                    continue
+                base = _etiquettes(noms_etiquettes, etiquettes)
+                cumul = 0
+                for borne, nombre in zip(bornes, serie):
+                    cumul += nombre
+                    lignes.append(f'{nom_complet}_bucket{{{base},le="{_nombre(borne)}"}} {cumul}')
+                lignes.append(f'{nom_complet}_bucket{{{base},le="+Inf"}} {serie[-1]}')
+                lignes.append(f'{nom_complet}_sum{{{base}}} {_nombre(serie[-2])}')
+                lignes.append(f'{nom_complet}_count{{{base}}} {serie[-1]}')
+        return '\n'.join(lignes) + '\n'
+
+# Noms des étiquettes de chaque série, dans l'ordre des tuples stockés
+ETIQUETTES = {
+    'http_requetes_total': ('route', 'methode', 'statut'),
+    'http_duree_secondes': ('route', 'methode'),
+    'http_taille_reponse_octets': ('route', 'methode'),
+    'sql_requetes_total': ('route',),
+    'sql_duree_secondes_total': ('route',),
+    'sql_par_requete': ('route',),
+    'sql_duree_par_requete_secondes': ('route',),
+    'n_plus_un_total': ('route',),
+    'coalescence_total': ('calcul', 'issue'),
+}
+
+def _etiquettes(noms, valeurs):
+    return ','.join(f'{nom}="{_echapper(valeur)}"' for nom, valeur in zip(noms, valeurs))
+
+def _echapper(valeur):
+    return str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _nombre(valeur):
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+metriques = Metriques()
@@ -0,0 +1,249 @@
+from datetime import date
+from sqlalchemy import MetaData, delete, event, func, insert, select, text, union_all
+from src.models.user import db
+from src.models.property import Property
+from src.services.data_version import incrementer_version
+import functools
+import os
+import threading
+
+SCHEMA_ARCHIVES = 'archives'
+TAILLE_LOT_IDS = 500  # identifiants par clause IN
+
+class PartitionsVentes:
+    """Partitionnement des biens par année de vente.
+
+    La table `property` (table chaude) garde les ventes des PROPERTY_ANNEES_CHAUDES
+    dernières années et les biens sans date de vente. Les années plus anciennes sont
+    déplacées par `archiver()` dans des tables `property_AAAA` d'un fichier SQLite
+    attaché à chaque connexion sous le nom `archives` (PROPERTY_ARCHIVES_FICHIER,
+    par défaut `<base>_archives.db` à côté de la base principale).
+
+    Les requêtes courantes ne lisent que la table chaude ; `source()` ajoute les
+    archives des seules années couvertes par les dates demandées, ou toutes si
+    l'historique est demandé. Pour être modifié ou supprimé, un bien archivé est
+    ramené dans la table chaude (`rechauffer()`) dans la transaction de l'écriture,
+    puis `ranger()` le renvoie dans l'archive de son année.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._metadata = MetaData()
+        self._tables = {}
+        self._annees = (None, ())  # ((fichier, schema_version) des archives, années archivées)
+        self._verrou = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROPERTY_ANNEES_CHAUDES', 3)  # année courante comprise
+        self.app = app
+        app.extensions['partitions_ventes'] = self
+        with app.app_context():
+            if db.engine.dialect.name != 'sqlite':
+                app.config['PROPERTY_ARCHIVES_FICHIER'] = None
+                return
+            # Par défaut, à côté de la base principale : app.db -> app_archives.db (désactivé en mémoire)
+            base = db.engine.url.database
+            app.config.setdefault('PROPERTY_ARCHIVES_FICHIER',
+                                  f'{os.path.splitext(base)[0]}_archives.db' if base and base != ':memory:' else None)
+            fichier = app.config['PROPERTY_ARCHIVES_FICHIER']
+            if fichier:
+                event.listen(db.engine, 'connect', functools.partial(_attacher_archives, os.path.abspath(fichier)))
+
+    @property
+    def actif(self):
+        return bool(self.app.config['PROPERTY_ARCHIVES_FICHIER'])
+
+    def annee_limite(self, annees_chaudes=None):
+        """Première année conservée dans la table chaude"""
+        annees_chaudes = annees_chaudes or self.app.config['PROPERTY_ANNEES_CHAUDES']
+        return date.today().year - annees_chaudes + 1
+
+    def table_archive(self, annee):
+        """Table d'archive d'une année (même colonnes que `property`)"""
+        with self._verrou:
+            table = self._tables.get(annee)
+            if table is None:
+                table = Property.__table__.to_metadata(self._metadata, schema=SCHEMA_ARCHIVES,
+                                                       name=f'{Property.__tablename__}_{annee}')
+                self._tables[annee] = table
+            return table
+
+    def annees_archivees(self, connexion=None):
+        """Années présentes dans les archives, relues seulement si leur schéma a changé"""
+        if not self.actif:
+            return ()
+        connexion = connexion or db.session
+        version = (self.app.config['PROPERTY_ARCHIVES_FICHIER'],
+                   connexion.execute(text(f'PRAGMA {SCHEMA_ARCHIVES}.schema_version')).scalar())
+        if self._annees[0] == version:
+            return self._annees[1]
+        noms = connexion.execute(text(f"SELECT name FROM {SCHEMA_ARCHIVES}.sqlite_master "
+                                      f"WHERE type = 'table' AND name LIKE '{Property.__tablename__}\\_%' ESCAPE '\\'"))
+        annees = tuple(sorted(int(nom[len(Property.__tablename__) + 1:]) for (nom,) in noms
+                              if nom[len(Property.__tablename__) + 1:].isdigit()))
+        self._annees = (version, annees)
+        return annees
+
+    def partitions(self, date_min=None, date_max=None, historique=False):
+        """Tables à lire pour un intervalle de dates de vente (élagage par année)"""
+        tables = [Property.__table__]
+        sans_dates = date_min is None and date_max is None
+        if not historique and (sans_dates or (date_min is not None and date_min.year >= self.annee_limite())):
+            return tables
+        for annee in self.annees_archivees():
+            if (date_min is None or annee >= date_min.year) and (date_max is None or annee <= date_max.year):
+                tables.append(self.table_archive(annee))
+        return tables
+
+    def source(self, date_min=None, date_max=None, historique=False):
+        """Table chaude, ou union des partitions utiles, à filtrer via `.c` comme une table"""
+        tables = self.partitions(date_min, date_max, historique)
+        if len(tables) == 1:
+            return tables[0]
+        return union_all(*(select(*table.c) for table in tables)).subquery(Property.__tablename__)
+
+    def trouver(self, property_id):
+        """Bien par identifiant, dans la table chaude puis dans les archives (None si absent)"""
+        propriete = db.session.get(Property, property_id)
+        if propriete is not None or not self.actif:
+            return propriete
+        for annee in reversed(self.annees_archivees()):
+            table = self.table_archive(annee)
+            requete = select(*table.c).where(table.c.id == property_id)
+            propriete = db.session.execute(select(Property).from_statement(requete)).scalars().first()
+            if propriete is not None:
+                return propriete
+        return None
+
+    def trouver_archives(self, ids):
+        """Biens archivés parmi `ids`, par identifiant"""
+        if not self.actif or not self.annees_archivees():
+            return {}
+        biens = self.source(historique=True)
+        requete = select(*biens.c).where(biens.c.id.in_(ids))
+        return {propriete.id: propriete for propriete in
+                db.session.execute(select(Property).from_statement(requete)).scalars()}
+
+    def modifiable(self, property_id):
+        """Bien à modifier ou supprimer, ramené dans la table chaude s'il est archivé (None si absent)"""
+        propriete = db.session.get(Property, property_id)
+        if propriete is None and self.rechauffer([property_id]):
+            propriete = db.session.get(Property, property_id)
+        return propriete
+
+    def rechauffer(self, ids=(), clauses=None):
+        """Ramener dans la table chaude, dans la transaction de la session, les biens archivés
+        d'identifiant `ids` ou retenus par `clauses(table)` ; renvoie les identifiants déplacés.
+
+        Les écritures ne portent ensuite que sur la table chaude (ORM et écritures en masse) ;
+        `ranger()` doit être appelé avant le commit pour rendre aux archives ceux qui y restent.
+        """
+        if not self.actif:
+            return []
+        connexion = db.session.connection()
+        chaude = Property.__table__
+        ids = list(ids)
+        deplaces = []
+        for annee in reversed(self.annees_archivees(connexion)):
+            table = self.table_archive(annee)
+            if clauses is not None:
+                selections = [clauses(table)]
+            else:
+                selections = [(table.c.id.in_(ids[debut:debut + TAILLE_LOT_IDS]),)
+                              for debut in range(0, len(ids), TAILLE_LOT_IDS)]
+            for selection in selections:
+                lignes = connexion.execute(delete(table).where(*selection).returning(*table.c)).mappings().all()
+                if lignes:
+                    connexion.execute(insert(chaude), [dict(ligne) for ligne in lignes])
+                    deplaces.extend(ligne['id'] for ligne in lignes)
+            if clauses is None and len(deplaces) == len(ids):
+                break
+        return deplaces
+
+    def ranger(self, ids):
+        """Renvoyer aux archives, dans la transaction de la session, les biens de `ids` dont la
+        vente est antérieure à la fenêtre chaude ; renvoie les identifiants déplacés"""
+        if not self.actif or not ids:
+            return []
+        connexion = db.session.connection()
+        chaude = Property.__table__
+        ids = list(ids)
+        clauses = [chaude.c.sale_date < date(self.annee_limite(), 1, 1)]
+        plafond = _plafond(connexion)
+        if plafond is not None:
+            clauses.append(chaude.c.id != plafond)
+        par_annee = {}
+        for debut in range(0, len(ids), TAILLE_LOT_IDS):
+            lot = ids[debut:debut + TAILLE_LOT_IDS]
+            for ligne in connexion.execute(delete(chaude).where(chaude.c.id.in_(lot), *clauses)
+                                           .returning(*chaude.c)).mappings().all():
+                par_annee.setdefault(ligne['sale_date'].year, []).append(dict(ligne))
+        for annee, lignes in par_annee.items():
+            table = self.table_archive(annee)
+            table.create(connexion, checkfirst=True)
+            connexion.execute(insert(table), lignes)
+        return [ligne['id'] for lignes in par_annee.values() for ligne in lignes]
+
+    def archiver(self, annees_chaudes=None):
+        """Déplacer en masse les ventes entre table chaude et archives selon la fenêtre.
+
+        Une transaction par année : INSERT ... SELECT puis DELETE. Les années redevenues
+        chaudes (fenêtre élargie) sont réintégrées. Renvoie {année: lignes déplacées}.
+        """
+        if not self.actif:
+            raise RuntimeError('Archives désactivées (PROPERTY_ARCHIVES_FICHIER)')
+        limite = self.annee_limite(annees_chaudes)
+        chaude = Property.__table__
+        annee_vente = func.substr(chaude.c.sale_date, 1, 4)
+        deplacements = {}
+
+        with db.engine.connect() as connexion:
+            plafond = _plafond(connexion)
+
+            annees = [int(annee) for (annee,) in connexion.execute(
+                select(annee_vente).where(chaude.c.sale_date < date(limite, 1, 1)).distinct())]
+            connexion.rollback()  # fin de la lecture : chaque année a ensuite sa propre transaction
+            for annee in sorted(annees):
+                table = self.table_archive(annee)
+                with connexion.begin():
+                    table.create(connexion, checkfirst=True)
+                    clauses = [chaude.c.sale_date >= date(annee, 1, 1), chaude.c.sale_date < date(annee + 1, 1, 1)]
+                    if plafond is not None:
+                        clauses.append(chaude.c.id != plafond)
+                    connexion.execute(insert(table).from_select(list(chaude.c.keys()), select(*chaude.c).where(*clauses)))
+                    deplacements[annee] = connexion.execute(delete(chaude).where(*clauses)).rowcount
+
+            rechauffees = [annee for annee in self.annees_archivees(connexion) if annee >= limite]
+            connexion.rollback()
+            for annee in rechauffees:
+                table = self.table_archive(annee)
+                with connexion.begin():
+                    connexion.execute(insert(chaude).from_select(list(table.c.keys()), select(*table.c)))
+                    deplacements[annee] = -connexion.execute(delete(table)).rowcount
+                    table.drop(connexion)
+
+        if deplacements:
+            incrementer_version(Property.__tablename__)
+        return deplacements
+
+def _plafond(connexion):
+    """Identifiant à garder dans la table chaude (None si la table est en AUTOINCREMENT).
+
+    Sans AUTOINCREMENT, SQLite réattribue max(id) + 1 : le bien d'id maximal reste dans la
+    table chaude pour qu'aucun identifiant archivé ne soit réutilisé.
+    """
+    chaude = Property.__table__
+    ddl = connexion.execute(text("SELECT sql FROM main.sqlite_master WHERE name = :nom"),
+                            {'nom': chaude.name}).scalar() or ''
+    return None if 'AUTOINCREMENT' in ddl.upper() else connexion.execute(select(func.max(chaude.c.id))).scalar()
+
+def _attacher_archives(fichier, connexion_dbapi, enregistrement):
+    """Attacher le fichier d'archives à chaque nouvelle connexion SQLite"""
+    os.makedirs(os.path.dirname(fichier), exist_ok=True)
+    curseur = connexion_dbapi.cursor()
+    curseur.execute(f'ATTACH DATABASE ? AS {SCHEMA_ARCHIVES}', (fichier,))
+    curseur.close()
+
+partitions_ventes = PartitionsVentes()
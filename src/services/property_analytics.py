@@ -0,0 +1,136 @@
+from datetime import date
+from src.services.partitions import partitions_ventes
+from src.services.property_snapshot import DATE_ABSENTE, jour
+import numpy as np
+
+GROUPEMENTS = ('property_type', 'city', 'month', 'year')
+MAILLES_MAX = 20000  # cellules renvoyées au plus par la carte de chaleur
+MAILLES_GRILLE_MAX = 4_000_000  # au-delà, les mailles occupées sont dédoublonnées par tri
+
+def masque(colonnes, city=None, property_type=None, date_min=None, date_max=None, historique=False):
+    """Lignes retenues par les filtres, avec les règles de GET /properties.
+
+    Sans dates ni `historique`, seules les ventes de la fenêtre chaude et les biens
+    sans date de vente sont comptés, comme dans la table chaude.
+    """
+    retenues = np.ones(colonnes.lignes, dtype=bool)
+    if city:
+        retenues &= colonnes.appartient('city', colonnes.codes('villes', city), len(colonnes.villes))
+    if property_type:
+        code = colonnes.types.index(property_type) if property_type in colonnes.types else -2
+        retenues &= colonnes['property_type'] == code
+    ventes = colonnes['sale_date']
+    if date_min:
+        retenues &= ventes >= jour(date_min)
+    if date_max:
+        retenues &= (ventes <= jour(date_max)) & (ventes != DATE_ABSENTE)
+    if not (date_min or date_max or historique):
+        retenues &= (ventes >= jour(date(partitions_ventes.annee_limite(), 1, 1))) | (ventes == DATE_ABSENTE)
+    return retenues
+
+def _moyenne(somme, nombre):
+    return round(float(somme) / int(nombre), 2) if nombre else 0
+
+def statistiques(colonnes, retenues, groupement=None):
+    """Nombre, prix (moyen, médian, min, max), prix au m² et surface moyens, éventuellement par groupe.
+
+    Mêmes conventions que les statistiques SQL : prix et surfaces nuls ou absents ignorés.
+    """
+    prix, surface = colonnes['price'], colonnes['surface']
+    prix_retenus = prix[retenues & (prix > 0)]
+    prix_m2 = colonnes['price_m2'][retenues]
+    prix_m2 = prix_m2[~np.isnan(prix_m2)]
+    surfaces = surface[retenues & (surface > 0)]
+    resultat = {
+        'total': int(np.count_nonzero(retenues)),
+        'average_price': _moyenne(prix_retenus.sum(), len(prix_retenus)),
+        'median_price': round(float(np.median(prix_retenus)), 2) if len(prix_retenus) else 0,
+        'min_price': float(prix_retenus.min()) if len(prix_retenus) else None,
+        'max_price': float(prix_retenus.max()) if len(prix_retenus) else None,
+        'average_price_m2': _moyenne(prix_m2.sum(), len(prix_m2)),
+        'average_surface': _moyenne(surfaces.sum(), len(surfaces)),
+    }
+    if groupement:
+        resultat['groups'] = grouper(colonnes, retenues, groupement)
+    return resultat
+
+def _cles(colonnes, groupement):
+    """(clé entière par ligne, libellé d'une clé) pour un groupement"""
+    if groupement == 'property_type':
+        return colonnes['property_type'], colonnes.types.__getitem__
+    if groupement == 'city':
+        return colonnes['city'], colonnes.villes.__getitem__
+    if groupement == 'month':
+        return colonnes['sale_month'], lambda cle: str(np.datetime64(cle, 'M'))
+    # Division entière : DATE_ABSENTE reste très négatif et ces lignes sont exclues plus bas
+    return colonnes['sale_month'] // 12, lambda cle: str(np.datetime64(cle, 'Y'))
+
+def grouper(colonnes, retenues, groupement):
+    """Agrégats par groupe en une passe (np.bincount sur les clés décalées)"""
+    cles, libelle = _cles(colonnes, groupement)
+    if groupement in ('month', 'year'):
+        retenues = retenues & (colonnes['sale_date'] != DATE_ABSENTE)
+    prix, prix_m2 = colonnes['price'], colonnes['price_m2']
+    if not retenues.all():
+        cles, prix, prix_m2 = cles[retenues], prix[retenues], prix_m2[retenues]
+    if not len(cles):
+        return []
+    base = int(cles.min())
+    index = (cles - base).astype(np.intp)  # type attendu par np.bincount : évite une conversion par appel
+    taille = int(index.max()) + 1
+
+    avec_prix = prix > 0
+    avec_m2 = ~np.isnan(prix_m2)
+    # Comptes sur les index filtrés : des poids booléens seraient convertis en flottants, bien plus lent
+    nombres = np.bincount(index, minlength=taille)
+    nb_prix = np.bincount(index[avec_prix], minlength=taille)
+    somme_prix = np.bincount(index, weights=np.where(avec_prix, prix, 0.0), minlength=taille)
+    nb_m2 = np.bincount(index[avec_m2], minlength=taille)
+    somme_m2 = np.bincount(index, weights=np.where(avec_m2, prix_m2, 0.0), minlength=taille)
+    groupes = [{'key': libelle(base + int(position)),
+                'count': int(nombres[position]),
+                'average_price': _moyenne(somme_prix[position], nb_prix[position]),
+                'average_price_m2': _moyenne(somme_m2[position], nb_m2[position])}
+               for position in np.flatnonzero(nombres)]
+    if groupement in ('property_type', 'city'):
+        groupes.sort(key=lambda groupe: groupe['count'], reverse=True)
+    return groupes
+
+def carte_chaleur(colonnes, retenues, precision):
+    """Ventes par maille de `precision` degrés : nombre et prix au m² moyen (MAILLES_MAX mailles les plus denses)"""
+    latitude, longitude = colonnes['latitude'], colonnes['longitude']
+    retenues = retenues & ~np.isnan(latitude) & ~np.isnan(longitude)
+    if not retenues.any():
+        return []
+    lignes = np.floor(latitude[retenues] / precision).astype(np.int64)
+    colonnes_maille = np.floor(longitude[retenues] / precision).astype(np.int64)
+    ligne_min, colonne_min = int(lignes.min()), int(colonnes_maille.min())
+    largeur = int(colonnes_maille.max()) - colonne_min + 1
+    mailles = (lignes - ligne_min) * largeur + (colonnes_maille - colonne_min)
+    if (int(lignes.max()) - ligne_min + 1) * largeur <= MAILLES_GRILLE_MAX:
+        # Grille dense autour des ventes : comptage direct, sans tri
+        inverse, mailles = mailles, np.arange((int(lignes.max()) - ligne_min + 1) * largeur)
+    else:
+        mailles, inverse = np.unique(mailles, return_inverse=True)
+
+    prix_m2 = colonnes['price_m2'][retenues]
+    avec_m2 = ~np.isnan(prix_m2)
+    nombres = np.bincount(inverse, minlength=len(mailles))
+    nb_m2 = np.bincount(inverse[avec_m2], minlength=len(mailles))
+    somme_m2 = np.bincount(inverse, weights=np.where(avec_m2, prix_m2, 0.0), minlength=len(mailles))
+
+    occupees = np.flatnonzero(nombres)
+    ordre = occupees[np.argsort(-nombres[occupees], kind='stable')][:MAILLES_MAX]
+    # Mise en forme vectorisée : jusqu'à MAILLES_MAX cellules, la boucle Python coûterait plus que le calcul
+    cellules = mailles[ordre]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        moyennes = np.where(nb_m2[ordre] > 0, np.round(somme_m2[ordre] / nb_m2[ordre], 2), 0)
+    return [{'latitude': latitude_maille, 'longitude': longitude_maille, 'count': nombre, 'average_price_m2': moyenne}
+            for latitude_maille, longitude_maille, nombre, moyenne in zip(
+                np.round((ligne_min + cellules // largeur) * precision, 6).tolist(),
+                np.round((colonne_min + cellules % largeur) * precision, 6).tolist(),
+                nombres[ordre].tolist(), moyennes.tolist())]
+
+def description(colonnes):
+    """Métadonnées de la génération lue (curseur du journal, lignes, âge)"""
+    return {'cursor': colonnes.curseur, 'rows': colonnes.lignes, 'built_at': colonnes.construit_le}
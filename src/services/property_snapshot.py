@@ -0,0 +1,318 @@
+from datetime import date
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from src.models.user import db
+from src.models.change_log import ChangeLog
+from src.models.property import Property
+from src.services.data_version import version_donnees
+from src.services.partitions import partitions_ventes
+import json
+import mmap
+import numpy as np
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # hors POSIX : pas de coordination entre processus, chacun reconstruit son fichier
+    fcntl = None
+
+# Fichier : en-tête fixe, en-tête JSON (dictionnaires, position des colonnes), puis colonnes alignées
+MAGIQUE = b'FICOL001'
+EN_TETE = struct.Struct('<8sI')
+ALIGNEMENT = 64
+
+# Colonnes lues dans `property` : nom -> type numpy. Valeurs absentes : NaN pour les flottants,
+# -1 pour rooms, DATE_ABSENTE pour sale_date (jours depuis 1970)
+COLONNES_BASE = {
+    'id': np.int64,
+    'price': np.float64,
+    'surface': np.float64,
+    'rooms': np.int16,
+    'sale_date': np.int32,
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'city': np.int32,
+    'property_type': np.int32,
+}
+# Colonnes dérivées, calculées une fois à la publication plutôt qu'à chaque requête :
+# mois de vente (mois depuis janvier 1970, DATE_ABSENTE si inconnu) et prix au m²
+# (NaN sans prix ou surface strictement positifs, comme les NULLIF des statistiques SQL)
+COLONNES = dict(COLONNES_BASE, sale_month=np.int32, price_m2=np.float64)
+DATE_ABSENTE = np.iinfo(np.int32).min
+EPOQUE = date(1970, 1, 1).toordinal()
+TAILLE_LOT_IDS = 500
+
+class Colonnes:
+    """Une génération de l'instantané, en lecture seule : tableaux numpy adossés au mmap du fichier"""
+
+    def __init__(self, tampon, identite=None):
+        magique, longueur = EN_TETE.unpack_from(tampon, 0)
+        if magique != MAGIQUE:
+            raise ValueError('Fichier d\'instantané invalide')
+        entete = json.loads(bytes(tampon[EN_TETE.size:EN_TETE.size + longueur]))
+        self.identite = identite
+        self.curseur = entete['curseur']
+        self.lignes = entete['lignes']
+        self.construit_le = entete['construit_le']
+        self.villes = entete['villes']
+        self.types = entete['types']
+        self.tableaux = {nom: np.frombuffer(tampon, dtype=COLONNES[nom], count=self.lignes, offset=decalage)
+                         for nom, decalage in entete['colonnes'].items()}
+        self._tampon = tampon
+
+    def __getitem__(self, nom):
+        return self.tableaux[nom]
+
+    def codes(self, dictionnaire, motif):
+        """Codes des valeurs du dictionnaire qui contiennent `motif` (comme ILIKE '%motif%')"""
+        motif = motif.casefold()
+        valeurs = getattr(self, dictionnaire)
+        return np.array([code for code, valeur in enumerate(valeurs) if motif in valeur.casefold()], dtype=np.int32)
+
+    def appartient(self, colonne, codes, taille):
+        """Masque des lignes dont le code est dans `codes` (table de correspondance, plus rapide que np.isin)"""
+        table = np.zeros(taille, dtype=bool)
+        table[codes] = True
+        return table[self[colonne]]
+
+def deriver(tableaux):
+    """Ajouter les colonnes dérivées (sale_month, price_m2) aux colonnes de base"""
+    ventes = tableaux['sale_date']
+    connues = ventes != DATE_ABSENTE
+    mois = np.full(len(ventes), DATE_ABSENTE, dtype=np.int32)
+    mois[connues] = ventes[connues].astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+    prix, surface = tableaux['price'], tableaux['surface']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        prix_m2 = np.where((prix > 0) & (surface > 0), prix / surface, np.nan)
+    return dict(tableaux, sale_month=mois, price_m2=prix_m2)
+
+def serialiser(tableaux, villes, types, curseur):
+    """Octets d'un instantané (en-tête puis colonnes alignées sur ALIGNEMENT)"""
+    tableaux = deriver(tableaux)
+    lignes = len(tableaux['id'])
+    colonnes, decalage = {}, 0
+    entete = {'curseur': curseur, 'lignes': lignes, 'construit_le': time.time(), 'villes': villes, 'types': types}
+    # Deux passes : la taille de l'en-tête JSON dépend des décalages, qui dépendent de sa taille
+    for _ in range(2):
+        entete['colonnes'] = colonnes
+        contenu = json.dumps(entete, ensure_ascii=False).encode('utf-8')
+        decalage = -(-(EN_TETE.size + len(contenu) + 32) // ALIGNEMENT) * ALIGNEMENT
+        colonnes = {}
+        for nom, type_numpy in COLONNES.items():
+            colonnes[nom] = decalage
+            decalage += -(-lignes * np.dtype(type_numpy).itemsize // ALIGNEMENT) * ALIGNEMENT
+    entete['colonnes'] = colonnes
+    contenu = json.dumps(entete, ensure_ascii=False).encode('utf-8')
+
+    tampon = bytearray(decalage)
+    EN_TETE.pack_into(tampon, 0, MAGIQUE, len(contenu))
+    tampon[EN_TETE.size:EN_TETE.size + len(contenu)] = contenu
+    for nom, position in colonnes.items():
+        valeurs = np.ascontiguousarray(tableaux[nom], dtype=COLONNES[nom])
+        tampon[position:position + valeurs.nbytes] = valeurs.tobytes()
+    return tampon
+
+class InstantaneProprietes:
+    """Instantané en colonnes des biens (table chaude et archives) pour les calculs analytiques.
+
+    Les colonnes numériques de `property` sont écrites dans un fichier (INSTANTANE_FICHIER)
+    projeté en mémoire par chaque worker : les pages sont partagées par le cache du
+    système, sans copie. city et property_type sont codés par dictionnaire.
+
+    L'instantané est mis à jour à partir du journal des modifications (change_log) :
+    seules les lignes modifiées depuis son curseur sont relues, puis une nouvelle
+    génération remplace atomiquement le fichier (les lecteurs en cours gardent l'ancienne).
+    La vérification a lieu au plus toutes les INSTANTANE_INTERVALLE secondes, ou dès
+    qu'une écriture de ce processus a touché `property`. Une seule mise à jour à la
+    fois entre processus (verrou fcntl) ; les autres lisent la génération courante.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._colonnes = None
+        self._verifie = (0.0, None)  # (date monotone, version_donnees) de la dernière vérification
+        self._verrou = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('INSTANTANE_INTERVALLE', 2.0)  # secondes : écritures des autres processus
+        app.config.setdefault('INSTANTANE_RECONSTRUCTION', 0.25)  # part de lignes modifiées au-delà de laquelle tout est relu
+        # Par défaut, à côté de la base principale : app.db -> app_proprietes.col (en mémoire sinon).
+        # L'URL est lue dans la configuration : le blueprint est enregistré avant db.init_app
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        base = url.database if url.get_backend_name() == 'sqlite' else None
+        app.config.setdefault('INSTANTANE_FICHIER',
+                              f'{os.path.splitext(base)[0]}_proprietes.col' if base and base != ':memory:' else None)
+        self.app = app
+        self._colonnes = None
+        app.extensions['instantane_proprietes'] = self
+
+    # Lecture
+
+    def colonnes(self):
+        """Génération à jour de l'instantané (construite au premier appel si absente)"""
+        maintenant = time.monotonic()
+        version = version_donnees(Property.__tablename__)
+        dernier, version_vue = self._verifie
+        colonnes = self._colonnes
+        if colonnes is not None and version == version_vue \
+                and maintenant - dernier < self.app.config['INSTANTANE_INTERVALLE']:
+            return colonnes
+        with self._verrou:
+            if self._colonnes is not colonnes:
+                return self._colonnes
+            self._colonnes = self._rafraichir(self._colonnes)
+            self._verifie = (maintenant, version)
+            return self._colonnes
+
+    def _charger(self):
+        """Génération présente sur disque (None si absente ou illisible)"""
+        fichier = self.app.config['INSTANTANE_FICHIER']
+        if not fichier:
+            return None
+        try:
+            with open(fichier, 'rb') as flux:
+                etat = os.fstat(flux.fileno())
+                identite = (etat.st_ino, etat.st_mtime_ns, etat.st_size)
+                if self._colonnes is not None and self._colonnes.identite == identite:
+                    return self._colonnes
+                return Colonnes(mmap.mmap(flux.fileno(), 0, access=mmap.ACCESS_READ), identite)
+        except (OSError, ValueError):
+            return None
+
+    # Mise à jour
+
+    def _rafraichir(self, colonnes):
+        courant = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+        colonnes = self._charger() or colonnes
+        if colonnes is not None and colonnes.curseur >= courant:
+            return colonnes
+        with VerrouEcriture(self.app.config['INSTANTANE_FICHIER'], bloquant=colonnes is None) as obtenu:
+            if not obtenu:
+                return colonnes  # un autre processus écrit la génération suivante
+            colonnes = self._charger() or colonnes
+            if colonnes is not None and colonnes.curseur >= courant:
+                return colonnes
+            return self._publier(*self.construire(colonnes))
+
+    def construire(self, colonnes=None):
+        """Tableaux de la génération suivante : (tableaux, villes, types, curseur).
+
+        Incrémental depuis `colonnes` si le journal couvre encore son curseur et que peu de
+        lignes ont changé ; sinon relecture complète.
+        """
+        courant = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+        if colonnes is not None:
+            premier = db.session.query(func.min(ChangeLog.seq)).scalar()
+            if premier is not None and premier <= colonnes.curseur + 1:
+                ids = [row_id for (row_id,) in db.session.query(ChangeLog.row_id).filter(
+                    ChangeLog.seq > colonnes.curseur, ChangeLog.seq <= courant,
+                    ChangeLog.table_name == Property.__tablename__).distinct()]
+                if len(ids) <= max(1000, colonnes.lignes * self.app.config['INSTANTANE_RECONSTRUCTION']):
+                    return self._appliquer(colonnes, ids) + (courant,)
+        return self._tout_lire() + (courant,)
+
+    def _lignes(self, clauses=()):
+        # Table chaude et archives : l'archivage déplace des lignes sans les modifier ni les journaliser
+        biens = partitions_ventes.source(historique=True)
+        colonnes = [biens.c[nom] for nom in COLONNES_BASE]
+        return db.session.execute(select(*colonnes).where(*clauses(biens) if clauses else ()).order_by(biens.c.id))
+
+    def _tout_lire(self):
+        villes, types = {}, {}
+        lignes = self._lignes().all()
+        return _encoder(lignes, villes, types), list(villes), list(types)
+
+    def _appliquer(self, colonnes, ids):
+        villes = {ville: code for code, ville in enumerate(colonnes.villes)}
+        types = {nom: code for code, nom in enumerate(colonnes.types)}
+        modifiees = []
+        for debut in range(0, len(ids), TAILLE_LOT_IDS):
+            lot = ids[debut:debut + TAILLE_LOT_IDS]
+            modifiees.extend(self._lignes(lambda biens: (biens.c.id.in_(lot),)))
+        nouvelles = _encoder(modifiees, villes, types)
+
+        # Lignes conservées : toutes sauf celles du journal (réécrites ou supprimées), puis fusion par id
+        # (les ids de l'instantané sont triés : recherche dichotomique plutôt que np.isin)
+        garder = np.ones(colonnes.lignes, dtype=bool)
+        ids_journal = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(colonnes['id'], ids_journal).clip(0, max(colonnes.lignes - 1, 0))
+        if colonnes.lignes:
+            garder[positions[colonnes['id'][positions] == ids_journal]] = False
+        tableaux = {nom: np.concatenate([colonnes[nom][garder], nouvelles[nom]]) for nom in COLONNES_BASE}
+        if len(nouvelles['id']) and garder.any() and nouvelles['id'].min() < colonnes['id'][garder].max():
+            ordre = np.argsort(tableaux['id'], kind='stable')
+            tableaux = {nom: valeurs[ordre] for nom, valeurs in tableaux.items()}
+        return tableaux, list(villes), list(types)
+
+    def _publier(self, tableaux, villes, types, curseur):
+        tampon = serialiser(tableaux, villes, types, curseur)
+        fichier = self.app.config['INSTANTANE_FICHIER']
+        if not fichier:
+            return Colonnes(tampon)
+        temporaire = f'{fichier}.{os.getpid()}.tmp'
+        with open(temporaire, 'wb') as flux:
+            flux.write(tampon)
+        os.replace(temporaire, fichier)
+        return self._charger()
+
+    def reconstruire(self):
+        """Relire entièrement la base et publier une nouvelle génération"""
+        with self._verrou, VerrouEcriture(self.app.config['INSTANTANE_FICHIER'], bloquant=True):
+            self._colonnes = self._publier(*self.construire(None))
+            self._verifie = (time.monotonic(), version_donnees(Property.__tablename__))
+            return self._colonnes
+
+def _encoder(lignes, villes, types):
+    """Lignes SQL (ordre de COLONNES_BASE) -> tableaux numpy ; complète les dictionnaires"""
+    ids, prix, surfaces, pieces, dates, latitudes, longitudes, codes_villes, codes_types = \
+        (list(colonne) for colonne in zip(*lignes)) if lignes else ([] for _ in COLONNES_BASE)
+    return {
+        'id': np.array(ids, dtype=np.int64),
+        'price': np.array(prix, dtype=np.float64),  # None -> NaN
+        'surface': np.array(surfaces, dtype=np.float64),
+        'rooms': np.array([-1 if valeur is None else valeur for valeur in pieces], dtype=np.int16),
+        'sale_date': np.array([DATE_ABSENTE if valeur is None else jour(valeur) for valeur in dates], dtype=np.int32),
+        'latitude': np.array(latitudes, dtype=np.float64),
+        'longitude': np.array(longitudes, dtype=np.float64),
+        'city': np.array([villes.setdefault(valeur, len(villes)) for valeur in codes_villes], dtype=np.int32),
+        'property_type': np.array([types.setdefault(valeur, len(types)) for valeur in codes_types], dtype=np.int32),
+    }
+
+def jour(valeur):
+    """Date -> jours depuis le 1er janvier 1970 (format de la colonne sale_date)"""
+    if isinstance(valeur, str):
+        valeur = date.fromisoformat(valeur[:10])
+    return valeur.toordinal() - EPOQUE
+
+class VerrouEcriture:
+    """Verrou fcntl exclusif sur `<fichier>.verrou` (sans effet sans fichier ou hors POSIX)"""
+
+    def __init__(self, fichier, bloquant):
+        self.chemin = f'{fichier}.verrou' if fichier and fcntl is not None else None
+        self.bloquant = bloquant
+        self.descripteur = None
+
+    def __enter__(self):
+        if self.chemin is None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.chemin)), exist_ok=True)
+        self.descripteur = os.open(self.chemin, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(self.descripteur, fcntl.LOCK_EX | (0 if self.bloquant else fcntl.LOCK_NB))
+        except OSError:
+            os.close(self.descripteur)
+            self.descripteur = None
+            return False
+        return True
+
+    def __exit__(self, *exc):
+        if self.descripteur is not None:
+            os.close(self.descripteur)  # rend aussi le verrou
+            self.descripteur = None
+
+instantane_proprietes = InstantaneProprietes()
@@ -0,0 +1,152 @@
+import json
+import string
+
+# Gabarits de suggestions par type de contenu ({quartier} et {sujet} sont les seuls champs)
+SUGGESTIONS = {
+    'post_linkedin': [
+        "🏡 Découvrez les opportunités immobilières exceptionnelles du quartier {quartier} ! {sujet} - Contactez-moi pour une expertise personnalisée. #ImmobilierToulouse #Investissement",
+        "💡 Saviez-vous que {quartier} offre un potentiel de plus-value remarquable ? {sujet} - Parlons de votre projet immobilier ! #ConseilImmobilier #Expertise",
+        "🎯 {sujet} dans le secteur {quartier} : une opportunité à saisir ! Mon expertise locale à votre service. #ImmobilierLocal #Opportunité"
+    ],
+    'post_facebook': [
+        "🌟 Vous cherchez à acheter ou vendre dans le quartier {quartier} ? {sujet} Je connais parfaitement ce secteur et ses spécificités. Contactez-moi !",
+        "🏘️ Le marché de {quartier} évolue rapidement ! {sujet} Profitez de mon expertise locale pour optimiser votre projet immobilier.",
+        "💼 {sujet} - Spécialiste du secteur {quartier}, je vous accompagne dans tous vos projets immobiliers avec passion et professionnalisme !"
+    ],
+    'annonce': [
+        "Magnifique opportunité dans le quartier prisé de {quartier} ! {sujet} - Bien d'exception alliant charme et modernité.",
+        "Coup de cœur assuré pour ce bien situé à {quartier} ! {sujet} - Idéal pour investisseurs avisés ou famille recherchant la qualité.",
+        "Exclusivité ! {sujet} dans le secteur recherché de {quartier}. Prestations haut de gamme et environnement privilégié."
+    ]
+}
+
+# Remplacements appliqués pour produire chaque variante d'un message
+VARIANTES = [
+    (('!', '.'), ('🏡', '🏠')),
+    (('Découvrez', 'Explorez'), ('exceptionnelles', 'uniques')),
+    (('Contactez-moi', 'Appelez-moi'), ('expertise', 'conseil'))
+]
+
+CONSEILS_SEO = [
+    "Ajoutez des hashtags locaux pour améliorer la visibilité",
+    "Incluez un appel à l'action clair",
+    "Optimisez pour la recherche mobile",
+    "Utilisez des émojis pour augmenter l'engagement"
+]
+
+def appliquer_remplacements(texte, remplacements):
+    """Appliquer une série de remplacements à un texte"""
+    for ancien, nouveau in remplacements:
+        texte = texte.replace(ancien, nouveau)
+    return texte
+
+def decouper_gabarit(gabarit):
+    """Morceaux de texte d'un gabarit et positions de ses champs ({sujet} et {quartier} uniquement)"""
+    morceaux, champs = [], []
+    for fixe, champ, format_champ, conversion in string.Formatter().parse(gabarit):
+        morceaux.append(fixe)
+        if champ is None:
+            continue
+        if champ not in ('sujet', 'quartier') or format_champ or conversion:
+            raise ValueError(f"Champ de gabarit non pris en charge : {{{champ}}}")
+        champs.append((len(morceaux), champ))
+        morceaux.append('')
+    return morceaux, champs
+
+def compiler_gabarits(gabarits):
+    """Compiler une liste de gabarits en une fonction (sujet, quartier) -> liste de textes"""
+    # Gabarits découpés une seule fois ; le rendu place les valeurs et concatène, sans évaluer de code
+    modeles = [decouper_gabarit(gabarit) for gabarit in gabarits]
+
+    def rendre(sujet, quartier):
+        valeurs = {'sujet': sujet, 'quartier': quartier}
+        textes = []
+        for morceaux, champs in modeles:
+            texte = morceaux.copy()
+            for position, champ in champs:
+                texte[position] = valeurs[champ]
+            textes.append(''.join(texte))
+        return textes
+
+    return rendre
+
+# Compilation au chargement du module : suggestions, et variantes de la première suggestion
+# dont les remplacements sont appliqués une fois pour toutes sur le texte fixe du gabarit
+_SUGGESTIONS_COMPILEES = {
+    type_contenu: compiler_gabarits(gabarits) for type_contenu, gabarits in SUGGESTIONS.items()
+}
+_VARIANTES_COMPILEES = {
+    type_contenu: compiler_gabarits([appliquer_remplacements(gabarits[0], remplacements) for remplacements in VARIANTES])
+    for type_contenu, gabarits in SUGGESTIONS.items()
+}
+_MOTIFS_VARIANTES = tuple(ancien for remplacements in VARIANTES for ancien, _ in remplacements)
+
+def suggestions(type_contenu, sujet, quartier):
+    """Suggestions de contenu pour un type donné (liste vide si type inconnu)"""
+    gabarits = _SUGGESTIONS_COMPILEES.get(type_contenu)
+    return gabarits(sujet, quartier) if gabarits else []
+
+def conseils_seo(mots_cles):
+    """Conseils SEO pour une liste de mots-clés"""
+    return [f"Utilisez les mots-clés '{', '.join(mots_cles[:3])}' dans les 100 premiers mots", *CONSEILS_SEO]
+
+def variantes(message_base):
+    """Variantes d'un message quelconque"""
+    if not message_base:
+        return []
+    return [appliquer_remplacements(message_base, remplacements) for remplacements in VARIANTES]
+
+def variantes_premiere_suggestion(type_contenu, sujet, quartier):
+    """Variantes de la première suggestion, rendues directement depuis les gabarits précompilés"""
+    gabarits = _VARIANTES_COMPILEES.get(type_contenu)
+    if not gabarits:
+        return []
+    if not any(motif in sujet or motif in quartier for motif in _MOTIFS_VARIANTES):
+        return gabarits(sujet, quartier)
+    # Les valeurs saisies contiennent un motif à remplacer : chaque variante reçoit ses propres valeurs
+    textes = gabarits(sujet, quartier)
+    for index, remplacements in enumerate(VARIANTES):
+        textes[index] = gabarits(appliquer_remplacements(sujet, remplacements),
+                                 appliquer_remplacements(quartier, remplacements))[index]
+    return textes
+
+def rediger(type_contenu, sujet, quartier, mots_cles):
+    """Produire suggestions, conseils SEO et variantes pour une demande de rédaction"""
+    return {
+        'type': type_contenu,
+        'suggestions': suggestions(type_contenu, sujet, quartier),
+        'conseils_seo': conseils_seo(mots_cles),
+        'variantes': variantes_premiere_suggestion(type_contenu, sujet, quartier)
+    }
+
+def lire_demande(element):
+    """Normaliser une demande de rédaction (objet ou tableau [type, sujet, quartier, mots_cles]).
+
+    Lève ValueError si la demande n'a pas la forme attendue : textes pour le type, le sujet
+    et le quartier, liste de textes pour les mots-clés.
+    """
+    if isinstance(element, dict):
+        type_contenu, sujet, quartier, mots_cles = (element.get('type'), element.get('sujet'),
+                                                    element.get('quartier'), element.get('mots_cles'))
+    elif isinstance(element, list):
+        type_contenu, sujet, quartier, mots_cles = (element + [None] * 4)[:4]
+    else:
+        raise ValueError('objet ou tableau [type, sujet, quartier, mots_cles] attendu')
+    for nom, valeur in (('type', type_contenu), ('sujet', sujet), ('quartier', quartier)):
+        if valeur is not None and not isinstance(valeur, str):
+            raise ValueError(f'{nom} : texte attendu')
+    if mots_cles is not None and (not isinstance(mots_cles, list)
+                                  or not all(isinstance(mot, str) for mot in mots_cles)):
+        raise ValueError('mots_cles : liste de textes attendue')
+    return type_contenu or 'post_linkedin', sujet or '', quartier or '', mots_cles or []
+
+def ndjson(resultats, taille_paquet=200):
+    """Sérialiser des résultats en NDJSON, par paquets de lignes"""
+    paquet = []
+    for resultat in resultats:
+        paquet.append(json.dumps(resultat, ensure_ascii=False))
+        if len(paquet) >= taille_paquet:
+            yield '\n'.join(paquet) + '\n'
+            paquet = []
+    if paquet:
+        yield '\n'.join(paquet) + '\n'
@@ -0,0 +1,212 @@
+from concurrent.futures import ProcessPoolExecutor
+from jinja2 import Environment
+import functools
+import hashlib
+import json
+import os
+import re
+import tempfile
+import textwrap
+import threading
+import zlib
+
+# À incrémenter à chaque modification des gabarits : invalide les artefacts en cache
+VERSION_GABARIT = '1'
+
+FORMATS = {
+    'html': 'text/html; charset=utf-8',
+    'pdf': 'application/pdf'
+}
+
+NOM_ARTEFACT = re.compile(r'^[0-9a-f]{64}\.(html|pdf)$')
+
+GABARIT_HTML = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<title>{{ titre }}</title>
+<style>
+body { font-family: Helvetica, Arial, sans-serif; margin: 2cm; color: #1f2937; }
+h1 { font-size: 22pt; border-bottom: 2px solid #22c55e; padding-bottom: 6pt; }
+h2 { font-size: 14pt; margin-top: 18pt; color: #15803d; }
+dl { display: grid; grid-template-columns: max-content auto; gap: 2pt 12pt; }
+dt { font-weight: bold; }
+.date { color: #6b7280; }
+@media print { body { margin: 1cm; } }
+</style>
+</head>
+<body>
+{%- macro valeur(v) -%}
+{%- if v is mapping -%}
+<dl>{% for cle, sous_valeur in v.items() %}<dt>{{ cle | libelle }}</dt><dd>{{ valeur(sous_valeur) }}</dd>{% endfor %}</dl>
+{%- elif v is iterable and v is not string -%}
+<ul>{% for element in v %}<li>{{ valeur(element) }}</li>{% endfor %}</ul>
+{%- else -%}
+{{ v }}
+{%- endif -%}
+{%- endmacro %}
+<h1>{{ titre }}</h1>
+{% if date_generation %}<p class="date">Généré le {{ date_generation }}</p>{% endif %}
+{% for cle, section in sections %}
+<h2>{{ cle | libelle }}</h2>
+{{ valeur(section) }}
+{% endfor %}
+</body>
+</html>
+"""
+
+def libelle(cle):
+    """Transformer une clé JSON en libellé lisible"""
+    texte = str(cle).replace('_', ' ')
+    return texte[:1].upper() + texte[1:]
+
+@functools.cache
+def _gabarit():
+    """Gabarit HTML compilé à la première utilisation (et non au démarrage de chaque worker)"""
+    environnement = Environment(autoescape=True)
+    environnement.filters['libelle'] = libelle
+    return environnement.from_string(GABARIT_HTML)
+
+def empreinte(contenu, format_fichier):
+    """Empreinte d'un artefact : contenu du rapport + format + version du gabarit"""
+    h = hashlib.sha256(f'{VERSION_GABARIT}\0{format_fichier}\0'.encode('utf-8'))
+    h.update(contenu.encode('utf-8'))
+    return h.hexdigest()
+
+def chemin_artefact(dossier, contenu, format_fichier):
+    """Chemin sur disque de l'artefact, adressé par son empreinte"""
+    nom = f'{empreinte(contenu, format_fichier)}.{format_fichier}'
+    return os.path.join(dossier, nom[:2], nom)
+
+def chemin_depuis_nom(dossier, nom):
+    """Chemin d'un artefact à partir de son nom, None si le nom est invalide"""
+    if not NOM_ARTEFACT.match(nom):
+        return None
+    return os.path.join(dossier, nom[:2], nom)
+
+def rendre_fichier(dossier, contenu, format_fichier):
+    """Produire l'artefact s'il n'existe pas encore et retourner son chemin"""
+    chemin = chemin_artefact(dossier, contenu, format_fichier)
+    if os.path.exists(chemin):
+        return chemin
+
+    donnees = json.loads(contenu) if contenu else {}
+    if not isinstance(donnees, dict):
+        donnees = {'contenu': donnees}
+    if format_fichier == 'html':
+        octets = rendre_html(donnees).encode('utf-8')
+    else:
+        octets = rendre_pdf(donnees)
+
+    # Écriture atomique : un lecteur concurrent ne voit jamais de fichier partiel
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    descripteur, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix='.tmp')
+    with os.fdopen(descripteur, 'wb') as fichier:
+        fichier.write(octets)
+    os.replace(temporaire, chemin)
+    return chemin
+
+def rendre_html(donnees):
+    """Rendre le contenu d'un rapport en page HTML imprimable"""
+    return _gabarit().render(
+        titre=donnees.get('titre', 'Rapport'),
+        date_generation=donnees.get('date_generation'),
+        sections=[(cle, valeur) for cle, valeur in donnees.items() if cle not in ('titre', 'date_generation')]
+    )
+
+def _lignes_texte(valeur, indentation=0):
+    """Aplatir une valeur JSON en lignes de texte (style, texte)"""
+    marge = '  ' * indentation
+    if isinstance(valeur, dict):
+        for cle, sous_valeur in valeur.items():
+            if isinstance(sous_valeur, (dict, list)):
+                yield 'gras', f'{marge}{libelle(cle)} :'
+                yield from _lignes_texte(sous_valeur, indentation + 1)
+            else:
+                yield 'texte', f'{marge}{libelle(cle)} : {sous_valeur}'
+    elif isinstance(valeur, list):
+        for element in valeur:
+            if isinstance(element, (dict, list)):
+                yield from _lignes_texte(element, indentation + 1)
+                yield 'texte', ''
+            else:
+                yield 'texte', f'{marge}- {element}'
+    else:
+        yield 'texte', f'{marge}{valeur}'
+
+def _echapper_pdf(texte):
+    """Encoder une chaîne pour un objet texte PDF (WinAnsi, caractères spéciaux échappés)"""
+    octets = texte.encode('cp1252', errors='replace')
+    return octets.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+def rendre_pdf(donnees, lignes_par_page=52, largeur=95):
+    """Rendre le contenu d'un rapport en PDF (générateur minimal en Python pur)"""
+    lignes = [('titre', donnees.get('titre', 'Rapport'))]
+    if donnees.get('date_generation'):
+        lignes.append(('texte', f"Généré le {donnees['date_generation']}"))
+    for cle, valeur in donnees.items():
+        if cle in ('titre', 'date_generation'):
+            continue
+        lignes.append(('texte', ''))
+        lignes.append(('section', libelle(cle)))
+        lignes.extend(_lignes_texte(valeur))
+
+    # Retour à la ligne des textes trop longs
+    lignes_coupees = []
+    for style, texte in lignes:
+        morceaux = textwrap.wrap(texte, largeur, subsequent_indent='    ') if texte else ['']
+        lignes_coupees.extend((style, morceau) for morceau in morceaux)
+
+    polices = {'titre': (b'F2', 16, 24), 'section': (b'F2', 12, 18), 'gras': (b'F2', 10, 14), 'texte': (b'F1', 10, 14)}
+    pages = []
+    for debut in range(0, len(lignes_coupees), lignes_par_page):
+        flux = [b'BT', b'50 800 Td']
+        for style, texte in lignes_coupees[debut:debut + lignes_par_page]:
+            police, taille, interligne = polices[style]
+            flux.append(b'/%s %d Tf 0 -%d Td (%s) Tj' % (police, taille, interligne, _echapper_pdf(texte)))
+        flux.append(b'ET')
+        pages.append(zlib.compress(b'\n'.join(flux)))
+
+    # Objets : 1 catalogue, 2 arbre des pages, 3-4 polices, puis (page, contenu) par page
+    objets = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % (5 + 2 * i) for i in range(len(pages))), len(pages)),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>'
+    ]
+    for i, flux in enumerate(pages):
+        objets.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                      b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>' % (6 + 2 * i))
+        objets.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(flux), flux))
+
+    sortie = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    positions = []
+    for numero, objet in enumerate(objets, start=1):
+        positions.append(len(sortie))
+        sortie += b'%d 0 obj\n%s\nendobj\n' % (numero, objet)
+    debut_xref = len(sortie)
+    sortie += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objets) + 1)
+    for position in positions:
+        sortie += b'%010d 00000 n \n' % position
+    sortie += b'trailer\n<< /Size %d /Root 1 0 R >>\n' % (len(objets) + 1)
+    sortie += b'startxref\n%d\n%%%%EOF\n' % debut_xref
+    return bytes(sortie)
+
+_executeur = None
+_verrou_executeur = threading.Lock()
+
+def _pool(workers):
+    """Pool de processus de rendu, créé à la première utilisation"""
+    global _executeur
+    with _verrou_executeur:
+        if _executeur is None:
+            _executeur = ProcessPoolExecutor(max_workers=workers)
+        return _executeur
+
+def rendre_artefact(dossier, contenu, format_fichier, workers=2):
+    """Obtenir le chemin d'un artefact, en le rendant dans le pool de processus si besoin"""
+    chemin = chemin_artefact(dossier, contenu, format_fichier)
+    if os.path.exists(chemin):
+        return chemin
+    return _pool(workers).submit(rendre_fichier, dossier, contenu, format_fichier).result()
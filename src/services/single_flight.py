@@ -0,0 +1,242 @@
+from flask import abort
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+from werkzeug.exceptions import HTTPException
+from src.models.user import db
+from src.models.change_log import ChangeLog
+from src.services.metrics import metriques
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # hors POSIX : coalescence limitée au processus courant
+    fcntl = None
+
+PLAGE_VERROUS = 1 << 62  # octets verrouillables du fichier `verrous` : un par empreinte de clé
+
+class CalculEchoue(Exception):
+    """Le calcul partagé a échoué dans un autre processus (message de l'erreur d'origine)"""
+
+class _Vol:
+    """Calcul en cours dans ce processus, attendu par les appels identiques"""
+
+    __slots__ = ('termine', 'resultat', 'erreur')
+
+    def __init__(self):
+        self.termine = threading.Event()
+        self.resultat = None
+        self.erreur = None
+
+class Coalescence:
+    """Coalescence des calculs coûteux identiques (« single-flight »).
+
+    Les appels simultanés de `executer` avec la même clé (nom du calcul, paramètres
+    normalisés et dernière séquence du journal des modifications) attendent le calcul
+    en cours au lieu d'en lancer un autre, puis reçoivent son résultat ou son erreur.
+    Rien n'est mis en cache : un appel arrivé après la fin du calcul le relance.
+
+    Entre les processus d'un même hôte, le calcul en cours est signalé par un verrou
+    fcntl sur un octet de COALESCENCE_DOSSIER/verrous, choisi par l'empreinte de la
+    clé, et son résultat est déposé en JSON dans le même dossier. Sans dossier, la
+    coalescence reste limitée au processus.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._vols = {}
+        self._verrou = threading.Lock()
+        self._dossier = None
+        self._descripteur = None
+        self._balaye = 0.0
+        self._pid = os.getpid()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COALESCENCE_ACTIVE', True)
+        # Par défaut, à côté de la base principale : app.db -> app_coalescence/ (base en mémoire : processus seul)
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        base = url.database if url.get_backend_name() == 'sqlite' else None
+        app.config.setdefault('COALESCENCE_DOSSIER',
+                              f'{os.path.splitext(base)[0]}_coalescence' if base and base != ':memory:' else None)
+        app.config.setdefault('COALESCENCE_ATTENTE', 10.0)  # secondes d'attente d'un calcul en cours, puis calcul local
+        app.config.setdefault('COALESCENCE_RETENTION', 60)  # secondes de conservation des résultats déposés
+        self.app = app
+        self._ouvrir(app.config['COALESCENCE_DOSSIER'])
+        app.extensions['coalescence'] = self
+
+    def _ouvrir(self, dossier):
+        if dossier and fcntl is None:
+            dossier = None
+        if dossier == self._dossier and (dossier is None or self._descripteur is not None):
+            return  # déjà ouvert : fermer le descripteur rendrait les verrous de ce processus
+        if self._descripteur is not None:
+            os.close(self._descripteur)
+            self._descripteur = None
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+            self._descripteur = os.open(os.path.join(dossier, 'verrous'), os.O_RDWR | os.O_CREAT, 0o600)
+        self._dossier = dossier
+
+    def _apres_fork(self):
+        # Les calculs en cours et les verrous fcntl appartiennent au processus parent
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._vols = {}
+
+    def _compter(self, nom, issue):
+        metriques.compter('coalescence_total', (nom, issue))
+
+    # Calcul partagé
+
+    def executer(self, nom, parametres, calcul):
+        """Résultat de `calcul()`, partagé avec les appels simultanés de même `nom` et `parametres`.
+
+        `parametres` doit être sérialisable en JSON et déjà normalisé ; le résultat aussi
+        (il traverse les processus en JSON) et ne doit pas être modifié par l'appelant.
+        Un appel qui attend plus de COALESCENCE_ATTENTE secondes calcule lui-même.
+        """
+        if self.app is None or not self.app.config['COALESCENCE_ACTIVE']:
+            return calcul()
+        self._apres_fork()
+        # La séquence du journal est commune aux processus : un calcul lancé avant une écriture
+        # commitée n'est pas partagé avec les appels arrivés après
+        version = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+        cle = json.dumps([nom, parametres, version], sort_keys=True, ensure_ascii=False, default=str)
+
+        with self._verrou:
+            vol = self._vols.get(cle)
+            meneur = vol is None
+            if meneur:
+                vol = self._vols[cle] = _Vol()
+        if not meneur:
+            if not vol.termine.wait(self.app.config['COALESCENCE_ATTENTE']):
+                self._compter(nom, 'attente_expiree')
+                return calcul()
+            self._compter(nom, 'partage')
+            if vol.erreur is not None:
+                raise vol.erreur
+            return vol.resultat
+
+        try:
+            vol.resultat = self._executer_entre_processus(nom, cle, calcul)
+            return vol.resultat
+        except Exception as erreur:
+            vol.erreur = erreur
+            raise
+        finally:
+            with self._verrou:
+                if self._vols.get(cle) is vol:
+                    del self._vols[cle]
+            vol.termine.set()
+
+    def _executer_entre_processus(self, nom, cle, calcul):
+        if self._descripteur is None:
+            return self._calculer(nom, None, calcul)
+        empreinte = hashlib.blake2b(cle.encode('utf-8'), digest_size=8).digest()
+        position = int.from_bytes(empreinte, 'little') % PLAGE_VERROUS
+        chemin = os.path.join(self._dossier, f'{empreinte.hex()}.json')
+
+        if self._verrouiller(position, bloquant=False):
+            try:
+                # Dépôt d'un calcul terminé avant notre arrivée : il ne doit pas servir aux suivants
+                try:
+                    os.remove(chemin)
+                except FileNotFoundError:
+                    pass
+                return self._calculer(nom, chemin, calcul)
+            finally:
+                self._deverrouiller(position)
+
+        # Calcul en cours dans un autre processus : son verrou est rendu après le dépôt du résultat
+        if not self._attendre_verrou(position, self.app.config['COALESCENCE_ATTENTE']):
+            self._compter(nom, 'attente_expiree')
+            return calcul()
+        try:
+            depot = self._lire(chemin)
+            if depot is None:
+                # Processus arrêté en plein calcul, ou résultat non sérialisable : calcul local
+                return self._calculer(nom, chemin, calcul)
+            self._compter(nom, 'partage_processus')
+            if 'resultat' in depot:
+                return depot['resultat']
+            if 'statut' in depot:
+                abort(depot['statut'], depot['description'])
+            raise CalculEchoue(depot['erreur'])
+        finally:
+            self._deverrouiller(position)
+
+    def _calculer(self, nom, chemin, calcul):
+        self._compter(nom, 'calcule')
+        try:
+            resultat = calcul()
+        except HTTPException as erreur:
+            self._deposer(chemin, {'statut': erreur.code, 'description': erreur.description})
+            raise
+        except Exception as erreur:
+            self._deposer(chemin, {'erreur': f'{type(erreur).__name__}: {erreur}'})
+            raise
+        self._deposer(chemin, {'resultat': resultat})
+        return resultat
+
+    # Stockage partagé
+
+    def _verrouiller(self, position, bloquant):
+        try:
+            fcntl.lockf(self._descripteur, fcntl.LOCK_EX | (0 if bloquant else fcntl.LOCK_NB), 1, position)
+        except OSError:
+            return False
+        return True
+
+    def _deverrouiller(self, position):
+        fcntl.lockf(self._descripteur, fcntl.LOCK_UN, 1, position)
+
+    def _attendre_verrou(self, position, attente):
+        # Sondage court, comme les places du contrôle d'admission : lockf bloquant ne connaît pas de délai
+        echeance = time.monotonic() + attente
+        while not self._verrouiller(position, bloquant=False):
+            if time.monotonic() >= echeance:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _deposer(self, chemin, depot):
+        if chemin is None:
+            return
+        temporaire = f'{chemin}.{os.getpid()}.tmp'
+        try:
+            with open(temporaire, 'w', encoding='utf-8') as fichier:
+                json.dump(depot, fichier, ensure_ascii=False)
+            os.replace(temporaire, chemin)
+        except (OSError, TypeError, ValueError):
+            # Résultat non sérialisable : les autres processus calculeront eux-mêmes
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+        self._balayer()
+
+    def _lire(self, chemin):
+        try:
+            with open(chemin, encoding='utf-8') as fichier:
+                return json.load(fichier)
+        except (OSError, ValueError):
+            return None
+
+    def _balayer(self):
+        """Supprimer les résultats déposés depuis plus de COALESCENCE_RETENTION secondes"""
+        retention = self.app.config['COALESCENCE_RETENTION']
+        maintenant = time.time()
+        if maintenant - self._balaye < retention:
+            return
+        self._balaye = maintenant
+        for entree in os.scandir(self._dossier):
+            try:
+                if entree.name.endswith('.json') and entree.stat().st_mtime < maintenant - retention:
+                    os.remove(entree.path)
+            except OSError:
+                continue  # supprimé par un autre processus
+
+coalescence = Coalescence()
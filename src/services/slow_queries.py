@@ -0,0 +1,170 @@
+from collections import deque
+from datetime import datetime
+from flask import has_request_context, request
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+# « SCAN property » (SQLite >= 3.36) ou « SCAN TABLE property » : parcours complet sans index
+REGEX_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+
+class ProfileurRequetes:
+    """Journal des instructions SQL lentes, avec leur plan d'exécution (EXPLAIN QUERY PLAN).
+
+    Chaque instruction plus lente que SLOW_QUERY_SEUIL_MS est écrite dans un fichier
+    à rotation et conservée dans un tampon circulaire consultable par l'API.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.logger = logging.getLogger('ferme_immo.slow_queries')
+        self.logger.propagate = False
+        self._entrees = deque(maxlen=200)
+        self._verrou = threading.Lock()
+        self._tailles_tables = {}
+        self._ecoute_sql = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_SEUIL_MS', 100)
+        app.config.setdefault('SLOW_QUERY_ENDPOINT', False)  # expose /api/debug/slow-queries (sans authentification)
+        app.config.setdefault('SLOW_QUERY_FICHIER', os.path.join(app.config['DATA_DIR'], 'slow_queries.log'))
+        app.config.setdefault('SLOW_QUERY_FICHIER_TAILLE', 5 * 1024 * 1024)  # octets avant rotation
+        app.config.setdefault('SLOW_QUERY_FICHIER_NOMBRE', 5)  # fichiers conservés
+        app.config.setdefault('SLOW_QUERY_TAMPON', 200)  # entrées conservées en mémoire
+        app.config.setdefault('SLOW_QUERY_GRANDE_TABLE', 10000)  # lignes à partir desquelles un parcours complet est signalé
+        self.app = app
+        app.extensions['slow_queries'] = self
+        self._entrees = deque(maxlen=app.config['SLOW_QUERY_TAMPON'])
+
+        fichier = app.config['SLOW_QUERY_FICHIER']
+        if fichier and not self.logger.handlers:
+            os.makedirs(os.path.dirname(fichier), exist_ok=True)
+            gestionnaire = RotatingFileHandler(fichier, maxBytes=app.config['SLOW_QUERY_FICHIER_TAILLE'],
+                                               backupCount=app.config['SLOW_QUERY_FICHIER_NOMBRE'], encoding='utf-8')
+            gestionnaire.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(gestionnaire)
+            self.logger.setLevel(logging.INFO)
+
+        if not self._ecoute_sql:
+            event.listen(Engine, 'before_cursor_execute', self._avant_execution)
+            event.listen(Engine, 'after_cursor_execute', self._apres_execution)
+            self._ecoute_sql = True
+
+    def _avant_execution(self, conn, cursor, statement, parameters, context, executemany):
+        # Début porté par le contexte de l'instruction : rien ne reste sur la connexion si elle échoue
+        if context is not None:
+            context.debut_requete_lente = time.perf_counter()
+
+    def _apres_execution(self, conn, cursor, statement, parameters, context, executemany):
+        debut = getattr(context, 'debut_requete_lente', None)
+        if debut is None:
+            return
+        duree = time.perf_counter() - debut
+        if self.app is None or duree * 1000 < self.app.config['SLOW_QUERY_SEUIL_MS']:
+            return
+        try:
+            self.enregistrer(conn, statement, parameters, executemany, duree)
+        except Exception:
+            # Le profilage ne doit jamais faire échouer l'instruction profilée
+            self.app.logger.exception("Échec de l'enregistrement d'une requête lente")
+
+    def enregistrer(self, conn, instruction, parametres, executemany, duree):
+        """Enregistrer une instruction lente avec son plan d'exécution"""
+        plan = []
+        if conn.dialect.name == 'sqlite' and not executemany:
+            plan = self._plan(conn, instruction, parametres)
+
+        entree = {
+            'date': datetime.utcnow().isoformat(),
+            'duree_ms': round(duree * 1000, 2),
+            'route': f'{request.method} {request.path}' if has_request_context() else 'hors_requete',
+            'sql': instruction,
+            'parametres': _parametres_lisibles(parametres, executemany),
+            'plan': plan,
+            'parcours_complets': self._parcours_complets(conn, plan)
+        }
+        with self._verrou:
+            self._entrees.append(entree)
+        self.logger.info(json.dumps(entree, ensure_ascii=False, default=str))
+
+    def _plan(self, conn, instruction, parametres):
+        """Plan d'exécution SQLite de l'instruction, sur la même connexion"""
+        if not instruction.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')):
+            return []
+        curseur = conn.connection.cursor()
+        try:
+            curseur.execute(f'EXPLAIN QUERY PLAN {instruction}', parametres or ())
+            return [ligne[3] for ligne in curseur.fetchall()]
+        finally:
+            curseur.close()
+
+    def _parcours_complets(self, conn, plan):
+        """Tables parcourues entièrement d'après le plan, avec leur taille"""
+        parcours = []
+        for etape in plan:
+            correspondance = REGEX_SCAN.match(etape)
+            # « SCAN t USING COVERING INDEX ix » ne lit que l'index : ce n'est pas un parcours de table
+            if correspondance is None or 'INDEX' in correspondance.group(2):
+                continue
+            table = correspondance.group(1)
+            lignes = self._taille_table(conn, table)
+            parcours.append({
+                'table': table,
+                'lignes': lignes,
+                'grande_table': lignes is not None and lignes >= self.app.config['SLOW_QUERY_GRANDE_TABLE']
+            })
+        return parcours
+
+    def _taille_table(self, conn, table):
+        """Nombre de lignes d'une table, mis en cache une minute"""
+        maintenant = time.monotonic()
+        en_cache = self._tailles_tables.get(table)
+        if en_cache is not None and maintenant - en_cache[1] < 60:
+            return en_cache[0]
+        curseur = conn.connection.cursor()
+        try:
+            curseur.execute(f'SELECT count(*) FROM "{table}"')
+            lignes = curseur.fetchone()[0]
+        except Exception:
+            lignes = None  # alias de sous-requête ou table temporaire
+        finally:
+            curseur.close()
+        self._tailles_tables[table] = (lignes, maintenant)
+        return lignes
+
+    def entrees(self, limite=50, parcours_seulement=False):
+        """Dernières requêtes lentes, de la plus récente à la plus ancienne"""
+        with self._verrou:
+            entrees = list(self._entrees)
+        entrees.reverse()
+        if parcours_seulement:
+            entrees = [entree for entree in entrees if entree['parcours_complets']]
+        return entrees[:limite]
+
+def _parametres_lisibles(parametres, executemany):
+    """Forme des paramètres liés pour le journal : types et longueurs, jamais les valeurs"""
+    if executemany:
+        return {'lignes': len(parametres), 'premiere': _masquer(parametres[0]) if parametres else None}
+    return _masquer(parametres)
+
+def _masquer(valeur):
+    # Les valeurs (emails, téléphones des leads...) ne sont ni journalisées ni exposées
+    if isinstance(valeur, (list, tuple)):
+        return [_masquer(element) for element in valeur[:50]]
+    if isinstance(valeur, dict):
+        return {cle: _masquer(element) for cle, element in list(valeur.items())[:50]}
+    if valeur is None:
+        return None
+    if isinstance(valeur, (str, bytes)):
+        return f'<{type(valeur).__name__} {len(valeur)}>'
+    return f'<{type(valeur).__name__}>'
+
+profileur_requetes = ProfileurRequetes()
@@ -0,0 +1,162 @@
+from flask import Response, request, send_file
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : les variantes .br déjà présentes sur disque restent servies
+    brotli = None
+
+# Types compressibles (les images, polices woff2 et archives sont déjà compressées)
+TYPES_COMPRESSIBLES = re.compile(r'^(text/|application/(javascript|json|xml|manifest\+json|wasm)|image/(svg\+xml|x-icon|vnd\.microsoft\.icon))')
+
+# Encodages servis, par ordre de préférence : (nom HTTP, extension du fichier précompressé)
+ENCODAGES = (('br', '.br'), ('gzip', '.gz'))
+
+CACHE_IMMUABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDATION = 'no-cache'
+
+class FichierStatique:
+    """Entrée du manifeste : métadonnées d'un fichier et de ses variantes compressées"""
+
+    __slots__ = ('chemin', 'type_mime', 'etag', 'contenu', 'cache_control', 'variantes')
+
+    def __init__(self, chemin, type_mime, etag, contenu, cache_control):
+        self.chemin = chemin
+        self.type_mime = type_mime
+        self.etag = etag
+        self.contenu = contenu  # None au-delà de STATIC_MEMOIRE_MAX : servi depuis le disque
+        self.cache_control = cache_control
+        self.variantes = {}  # encodage -> (contenu, etag)
+
+class ManifesteStatique:
+    """Manifeste des fichiers de static/, construit au démarrage.
+
+    Les fichiers sont servis sans accès au système de fichiers (contenu en mémoire),
+    avec une variante gzip ou brotli selon Accept-Encoding, un ETag issu du contenu
+    et un cache immuable pour les fichiers dont le nom contient une empreinte.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.dossier = None
+        self.fichiers = {}
+        self._signature = None
+        self._prochaine_verification = 0.0
+        self._verrou = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STATIC_MEMOIRE_MAX', 1024 * 1024)  # octets : au-delà, fichier lu sur disque
+        app.config.setdefault('STATIC_COMPRESSION_MIN', 1024)  # octets : en dessous, pas de variante compressée
+        # Empreinte dans le nom (app.3f9c2a1b.js, index-B4x9Kq2d.css) : au moins 8 caractères dont un chiffre
+        app.config.setdefault('STATIC_EMPREINTE_REGEX', r'[.-](?=[A-Za-z0-9_]*\d)[A-Za-z0-9_]{8,}\.\w+$')
+        # Rechargement du manifeste quand static/ change (mode debug par défaut)
+        app.config.setdefault('STATIC_RECHARGEMENT', app.debug)
+        app.config.setdefault('STATIC_RECHARGEMENT_INTERVALLE', 1.0)  # secondes entre deux vérifications
+        self.app = app
+        self.dossier = app.static_folder
+        app.extensions['fichiers_statiques'] = self
+        self.construire()
+
+    def construire(self):
+        """(Re)construire le manifeste à partir du contenu de static/"""
+        fichiers = {}
+        signature = self._signature_dossier()
+        empreinte = re.compile(self.app.config['STATIC_EMPREINTE_REGEX'])
+        for chemin_relatif, chemin in self._parcourir():
+            if chemin_relatif.endswith(tuple(extension for _, extension in ENCODAGES)):
+                continue
+            fichiers[chemin_relatif] = self._entree(chemin_relatif, chemin, empreinte)
+        with self._verrou:
+            self.fichiers = fichiers
+            self._signature = signature
+
+    def _parcourir(self):
+        if not self.dossier or not os.path.isdir(self.dossier):
+            return
+        for racine, _, noms in os.walk(self.dossier):
+            for nom in sorted(noms):
+                chemin = os.path.join(racine, nom)
+                yield os.path.relpath(chemin, self.dossier).replace(os.sep, '/'), chemin
+
+    def _signature_dossier(self):
+        """Chemins, tailles et dates de modification de tous les fichiers (détection des changements)"""
+        signature = []
+        for chemin_relatif, chemin in self._parcourir():
+            statut = os.stat(chemin)
+            signature.append((chemin_relatif, statut.st_size, statut.st_mtime_ns))
+        return tuple(signature)
+
+    def _entree(self, chemin_relatif, chemin, empreinte):
+        with open(chemin, 'rb') as fichier:
+            contenu = fichier.read()
+        type_mime = mimetypes.guess_type(chemin_relatif)[0] or 'application/octet-stream'
+        etag = hashlib.sha256(contenu).hexdigest()[:32]
+        cache_control = CACHE_IMMUABLE if empreinte.search(chemin_relatif) else CACHE_REVALIDATION
+        en_memoire = len(contenu) <= self.app.config['STATIC_MEMOIRE_MAX']
+        entree = FichierStatique(chemin, type_mime, etag, contenu if en_memoire else None, cache_control)
+
+        if not en_memoire or not TYPES_COMPRESSIBLES.match(type_mime) \
+                or len(contenu) < self.app.config['STATIC_COMPRESSION_MIN']:
+            return entree
+        for encodage, extension in ENCODAGES:
+            # Variante précompressée par la chaîne de build si elle existe, sinon compressée ici
+            if os.path.exists(chemin + extension):
+                with open(chemin + extension, 'rb') as fichier:
+                    compresse = fichier.read()
+            elif encodage == 'gzip':
+                compresse = gzip.compress(contenu, compresslevel=9, mtime=0)
+            elif encodage == 'br' and brotli is not None:
+                compresse = brotli.compress(contenu, quality=11)
+            else:
+                continue
+            if len(compresse) < len(contenu):
+                entree.variantes[encodage] = (compresse, f'{etag}-{encodage}')
+        return entree
+
+    def _recharger_si_necessaire(self):
+        maintenant = time.monotonic()
+        if maintenant < self._prochaine_verification:
+            return
+        self._prochaine_verification = maintenant + self.app.config['STATIC_RECHARGEMENT_INTERVALLE']
+        if self._signature_dossier() != self._signature:
+            self.construire()
+
+    def trouver(self, chemin):
+        """Entrée du manifeste pour un chemin demandé (None si absent)"""
+        if self.app.config['STATIC_RECHARGEMENT']:
+            self._recharger_si_necessaire()
+        return self.fichiers.get(chemin)
+
+    def servir(self, entree):
+        """Réponse pour une entrée du manifeste, avec négociation de l'encodage et requêtes conditionnelles"""
+        if entree.contenu is None:
+            reponse = send_file(entree.chemin, mimetype=entree.type_mime, etag=entree.etag, conditional=True)
+            reponse.headers['Cache-Control'] = entree.cache_control
+            return reponse
+
+        contenu, etag, encodage = entree.contenu, entree.etag, None
+        for nom, _ in ENCODAGES:
+            if nom in entree.variantes and request.accept_encodings[nom] > 0:
+                encodage = nom
+                contenu, etag = entree.variantes[nom]
+                break
+
+        reponse = Response(contenu, mimetype=entree.type_mime)
+        reponse.set_etag(etag)
+        reponse.headers['Cache-Control'] = entree.cache_control
+        if entree.variantes:
+            reponse.vary.add('Accept-Encoding')
+        if encodage:
+            reponse.headers['Content-Encoding'] = encodage
+        # 304 si l'ETag correspond, 206 pour les requêtes Range (sur la représentation servie)
+        return reponse.make_conditional(request, accept_ranges=True, complete_length=len(contenu))
+
+fichiers_statiques = ManifesteStatique()
@@ -0,0 +1,134 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.user import db
+from src.models.lead import Lead
+from src.services.change_feed import journaliser
+import hashlib
+import json
+import os
+
+SOURCE_PAR_DEFAUT = 'transcription'
+
+def texte_message(message):
+    """Texte d'un message de transcription (chaîne ou objet {message|texte|text})"""
+    if isinstance(message, dict):
+        return message.get('message') or message.get('texte') or message.get('text') or ''
+    return str(message or '')
+
+def analyser_conversation(conversation):
+    """Rejouer une conversation archivée dans les extracteurs du chatbot"""
+    from src.routes.chatbot import (champs_lead_depuis_contexte, classer_intentions,
+                                    mettre_a_jour_contexte, peut_creer_lead)
+
+    messages = [texte_message(message) for message in conversation.get('messages', [])]
+    session_id = conversation.get('session_id') or hashlib.sha1(
+        json.dumps(messages, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    contexte = {}
+    intentions = []
+    for message in messages:
+        message = message.lower()
+        classement = classer_intentions(message)
+        intention = classement[0]['intention'] if classement else 'autre'
+        intentions.append(intention)
+        contexte = mettre_a_jour_contexte(contexte, intention, message)
+
+    resultat = {
+        'session_id': session_id,
+        'nb_messages': len(messages),
+        'intentions': intentions,
+        'contexte': contexte,
+        'lead_possible': peut_creer_lead(contexte),
+        'lead': None
+    }
+    if resultat['lead_possible']:
+        lead = champs_lead_depuis_contexte(contexte)
+        lead['source'] = conversation.get('source', SOURCE_PAR_DEFAUT)
+        resultat['lead'] = lead
+    return resultat
+
+def analyser_lot(lot):
+    """Analyser un lot de lignes JSONL (exécuté dans un processus fils)"""
+    resultats = []
+    for numero, ligne in lot:
+        try:
+            conversation = json.loads(ligne)
+            if not isinstance(conversation, dict):
+                raise ValueError('objet JSON attendu')
+            resultats.append(analyser_conversation(conversation))
+        except ValueError as erreur:
+            resultats.append({'ligne': numero, 'erreur': str(erreur)})
+    return resultats
+
+def _lots(lignes, taille_lot):
+    lot = []
+    for numero, ligne in enumerate(lignes, start=1):
+        if isinstance(ligne, bytes):
+            ligne = ligne.decode('utf-8')
+        if not ligne.strip():
+            continue
+        lot.append((numero, ligne))
+        if len(lot) >= taille_lot:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+def analyser_flux(lignes, workers=None, taille_lot=500):
+    """Analyser un flux de lignes JSONL, résultats produits dans l'ordre d'entrée.
+
+    Le nombre de lots en cours est borné : l'entrée n'est jamais chargée entièrement en mémoire.
+    """
+    if workers == 1:
+        for lot in _lots(lignes, taille_lot):
+            yield from analyser_lot(lot)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executeur:
+        en_cours = deque()
+        fenetre = 2 * (workers or os.cpu_count() or 1)
+        for lot in _lots(lignes, taille_lot):
+            en_cours.append(executeur.submit(analyser_lot, lot))
+            if len(en_cours) >= fenetre:
+                yield from en_cours.popleft().result()
+        while en_cours:
+            yield from en_cours.popleft().result()
+
+def upsert_leads(resultats):
+    """Créer ou mettre à jour en masse les leads des conversations analysées"""
+    from src.routes.lead import calculate_lead_score
+
+    lignes = []
+    for resultat in resultats:
+        if resultat.get('lead'):
+            ligne = dict(resultat['lead'], session_id=resultat['session_id'])
+            ligne['score'] = calculate_lead_score(Lead(**ligne))
+            lignes.append(ligne)
+    if not lignes:
+        return 0
+
+    requete = sqlite_insert(Lead)
+    mises_a_jour = {colonne: requete.excluded[colonne] for colonne in lignes[0] if colonne != 'session_id'}
+    mises_a_jour['updated_at'] = datetime.utcnow()
+    mises_a_jour['version'] = Lead.version + 1
+    resultat = db.session.execute(requete.on_conflict_do_update(index_elements=['session_id'], set_=mises_a_jour)
+                                  .returning(Lead.id), lignes)
+    # Upsert hors unité de travail : journalisé explicitement pour le flux /api/changes
+    journaliser('lead', resultat.scalars().all())
+    db.session.commit()
+    return len(lignes)
+
+def analyser_et_ecrire(lignes, workers=None, taille_lot=500, ecrire_leads=False):
+    """Analyser un flux et, si demandé, écrire les leads par lots ; produit les résultats un à un"""
+    a_ecrire = []
+    for resultat in analyser_flux(lignes, workers, taille_lot):
+        if ecrire_leads and resultat.get('lead'):
+            a_ecrire.append(resultat)
+            if len(a_ecrire) >= taille_lot:
+                upsert_leads(a_ecrire)
+                a_ecrire = []
+        yield resultat
+    if a_ecrire:
+        upsert_leads(a_ecrire)